@@ -13,14 +13,26 @@ from openpyxl.utils import get_column_letter, rows_from_range, cols_from_range
 import math
 from copy import deepcopy
 import re
+import logging
+import time
 
 
 
 # --- IMPORT CÁC MODULE XỬ LÝ ---
 from data_processor import *
+from workbook_cache import list_sheet_names, enable_disk_cache, preload_sheets
+from jobs import JobManager, JOB_WORKERS, MAX_QUEUED_JOBS, JOB_EXECUTOR, JOB_PROCESSES
+from logging_config import configure_logging
+from instrumentation import stats_registry
+from solvers import DEFAULT_STRATEGY, available_strategies
+import metrics
+
+logger = logging.getLogger('packing.api')
 
 # --- KHỞI TẠO ỨNG DỤNG FLASK ---
 app = Flask(__name__)
+# Mức log lấy từ biến môi trường LOG_LEVEL (mặc định WARNING: không in chi tiết từng pallet)
+configure_logging()
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
 CORS(app, resources={r"/api/*": {"origins": "https://phamthingocanh25.github.io"}})
 #CORS(app)
@@ -28,6 +40,42 @@ UPLOAD_FOLDER = 'uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Sheet đã parse được lưu dạng sidecar cạnh file upload để không phải parse lại
+SHEET_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, '.sheet_cache')
+SHEET_CACHE_MAX_BYTES = int(os.environ.get('SHEET_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+enable_disk_cache(SHEET_CACHE_FOLDER, SHEET_CACHE_MAX_BYTES)
+# Tùy chọn (mặc định tắt): parse trước vài sheet đầu ngay sau khi upload (luồng nền) để
+# /api/process không phải chờ parse. Chỉ parse tối đa PRELOAD_MAX_SHEETS sheet để không đẩy
+# các sheet đang dùng ra khỏi cache trong bộ nhớ.
+PRELOAD_UPLOADED_SHEETS = os.environ.get('PRELOAD_UPLOADED_SHEETS', '0') == '1'
+PRELOAD_MAX_SHEETS = int(os.environ.get('PRELOAD_MAX_SHEETS', 2))
+# Pool chạy các job /api/process (số luồng, số job chờ tối đa, chế độ thread/process và
+# số tiến trình cấu hình qua biến môi trường JOB_WORKERS, MAX_QUEUED_JOBS, JOB_EXECUTOR, JOB_PROCESSES)
+job_manager = JobManager(
+    max_workers=JOB_WORKERS,
+    max_queued=MAX_QUEUED_JOBS,
+    executor=JOB_EXECUTOR,
+    processes=JOB_PROCESSES
+)
+metrics.JOBS_IN_FLIGHT.set_function(job_manager.in_flight_count)
+# Các endpoint được đo thời gian xử lý cho /metrics
+TIMED_ENDPOINTS = {'upload_file', 'process_data', 'generate_packing_list_endpoint'}
+
+
+@app.before_request
+def _start_request_timer():
+    if request.endpoint in TIMED_ENDPOINTS:
+        request.environ['packing.request_started'] = time.perf_counter()
+
+
+@app.after_request
+def _observe_request_latency(response):
+    started = request.environ.get('packing.request_started')
+    if started is not None:
+        endpoint = request.url_rule.rule
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        metrics.REQUESTS_TOTAL.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
 ############### Packing list #########
 def _safe_float(value, default=0.0):
     """Chuyển đổi giá trị sang float một cách an toàn."""
@@ -94,7 +142,7 @@ def _render_combined_pallet_block(item_content, raw_data_map, pallet_counter, pk
         # Lấy thông tin đã tính toán trước từ map
         alloc_data = product_allocation_map.get(product_code)
         if not alloc_data:
-            print(f"Warning: No allocation data found for product {product_code}. Calculation might be incorrect.")
+            logger.warning("Warning: No allocation data found for product %s. Calculation might be incorrect.", product_code)
             continue
 
         key_item = str(item['product_code']).strip() + '||' + str(item['product_name']).strip()
@@ -387,7 +435,7 @@ def write_packing_list_to_sheet(ws, data_df, container_id_num,cumulative_pallet_
             cell.number_format = data['format']
             cell.alignment = align_right_center
         except ValueError:
-            print(f"LOGIC ERROR: Header '{header_text}' not found in `headers` list.")
+            logger.error("LOGIC ERROR: Header '%s' not found in `headers` list.", header_text)
             continue
 
     for i, col_name in enumerate(headers, start=start_col):
@@ -447,79 +495,24 @@ def upload_file():
             filename = werkzeug.utils.secure_filename(file.filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(filepath)
-            import pandas as pd
-            xls = pd.ExcelFile(filepath)
-            return jsonify({"success": True, "filepath": filepath, "sheets": xls.sheet_names})
+            metrics.UPLOAD_BYTES.observe(os.path.getsize(filepath))
+            sheet_names = list_sheet_names(filepath)
+            if PRELOAD_UPLOADED_SHEETS:
+                preload_sheets(filepath, sheet_names, max_sheets=PRELOAD_MAX_SHEETS)
+            return jsonify({"success": True, "filepath": filepath, "sheets": sheet_names})
         except Exception as e:
             return jsonify({"success": False, "error": f"Lỗi khi xử lý file: {str(e)}"}), 500
     return jsonify({"success": False, "error": "Định dạng file không hợp lệ"}), 400
 
 
-# backend/app.py
-
-def _generate_response_from_containers(containers):
-    """
-    Chuyển đổi danh sách các đối tượng Container thành định dạng JSON
-    mà frontend có thể hiểu được.
-    """
-    response_data = []
-    for container in containers:
-        container_dict = {
-            "id": container.id,
-            "main_company": container.main_company,
-            "total_quantity": round(container.total_quantity, 4),
-            "total_weight": round(container.total_weight, 2),
-            "total_logical_pallets": container.total_logical_pallets,
-            "contents": []
-        }
-
-        for pallet in sorted(container.pallets, key=lambda p: p.id):
-            content_block = {}
-            # Xử lý pallet gộp
-            if pallet.is_combined and len(pallet.original_pallets) > 1:
-                content_block['type'] = 'CombinedPallet'
-                content_block['id'] = pallet.id
-                content_block['quantity'] = round(pallet.quantity, 4)
-                content_block['total_weight'] = round(pallet.total_weight, 2)
-                content_block['is_cross_ship'] = pallet.is_cross_ship
-                content_block['items'] = []
-                for sub_pallet in sorted(pallet.original_pallets, key=lambda p: p.id):
-                    content_block['items'].append({
-                        "id": sub_pallet.id,
-                        "product_code": sub_pallet.product_code,
-                        "product_name": sub_pallet.product_name,
-                        "company": sub_pallet.company,
-                        "quantity": round(sub_pallet.quantity, 4),
-                        "total_weight": round(sub_pallet.total_weight, 2),
-                        "is_split": sub_pallet.is_split,
-                        "split_from_id": sub_pallet.split_from_id
-                    })
-            # Xử lý pallet đơn (không gộp hoặc gộp từ 1 pallet)
-            else:
-                # Nếu là pallet gộp nhưng chỉ có 1 item (do bị tách ra), vẫn hiển thị như pallet đơn
-                single_item = pallet.original_pallets[0] if pallet.is_combined else pallet
-                content_block['type'] = 'SinglePallet'
-                content_block['id'] = single_item.id
-                content_block['product_code'] = single_item.product_code
-                content_block['product_name'] = single_item.product_name
-                content_block['company'] = single_item.company
-                content_block['quantity'] = round(single_item.quantity, 4)
-                content_block['total_weight'] = round(single_item.total_weight, 2)
-                content_block['is_cross_ship'] = pallet.is_cross_ship # Lấy trạng thái cross-ship từ pallet cha
-                content_block['is_split'] = single_item.is_split
-                content_block['split_from_id'] = single_item.split_from_id
-
-            container_dict['contents'].append(content_block)
-        response_data.append(container_dict)
-
-    return {"success": True, "data": response_data}
-
-
 @app.route('/api/process', methods=['POST'])
 def process_data():
     """
     API endpoint để xử lý và tối ưu hóa việc xếp pallet vào container.
-    Hàm này sử dụng pipeline xử lý đầy đủ, đồng bộ với logic 'Iterative Solver V3' từ test_p2.py.
+    Hàm này sử dụng pipeline xử lý đầy đủ, đồng bộ với logic 'Iterative Solver V3' từ test_p2.py
+    (xem pipeline.run_optimization_pipeline).
+    Gửi kèm "async": true để chạy nền và nhận job_id thay vì chờ kết quả.
+    "strategy" chọn chiến lược xếp (mặc định 'v3', xem GET /api/strategies).
     """
     try:
         data = request.get_json()
@@ -529,205 +522,60 @@ def process_data():
         if not all([filepath, sheet_name]):
             return jsonify({"success": False, "error": "Thiếu thông tin file hoặc sheet."}), 400
 
-        # --- GIAI ĐOẠN 1: TẢI DỮ LIỆU ---
-        all_pallets, error = load_and_prepare_pallets(filepath, sheet_name)
-        if error:
-            return jsonify({"success": False, "error": error}), 400
-        if not all_pallets:
-            return jsonify({"success": False, "error": "Không có dữ liệu pallet hợp lệ để xử lý."}), 400
-
-        # --- BƯỚC 2: TÁCH TOÀN BỘ PALLET THÀNH PHẦN NGUYÊN VÀ LẺ ---
-        print("\n# BƯỚC 2: TÁCH TOÀN BỘ PALLET THÀNH PHẦN NGUYÊN VÀ LẺ #")
-        integer_pallets, fractional_pallets = split_integer_fractional_pallets(all_pallets)
-
-        # --- BƯỚC 3: XỬ LÝ PALLET NGUYÊN QUÁ KHỔ ---
-        print("\n# BƯỚC 3: XỬ LÝ PALLET NGUYÊN QUÁ KHỔ #")
-        oversized_containers, regular_sized_integer_pallets, container_id_counter = handle_all_oversized_pallets(
-            all_pallets=integer_pallets,
-            start_container_id=1
-        )
-
-        # --- BƯỚC 4: XẾP CÁC PALLET NGUYÊN CÓ KÍCH THƯỚC BÌNH THƯỜNG ---
-        print("\n# BƯỚC 4: XẾP PALLET NGUYÊN CÓ KÍCH THƯỚC BÌNH THƯỜNG #")
-        final_containers = list(oversized_containers)
-        final_containers, unplaced_integer_pallets, container_id_counter = pack_integer_pallets(
-            regular_sized_integer_pallets,
-            final_containers,
-            container_id_counter
-        )
+        # Chế độ bất đồng bộ: trả job_id ngay, frontend hỏi tiến độ qua GET /api/process/<job_id>
+        # "include_stats": true -> kèm thời gian từng giai đoạn và các bộ đếm trong kết quả
+        include_stats = bool(data.get('include_stats'))
+        strategy = data.get('strategy') or DEFAULT_STRATEGY
+        if strategy not in available_strategies():
+            return jsonify({
+                "success": False,
+                "error": f"Chiến lược xếp '{strategy}' không hợp lệ. Các chiến lược có sẵn: {', '.join(sorted(available_strategies()))}."
+            }), 400
+
+        if data.get('async'):
+            job_id = job_manager.submit(filepath, sheet_name, include_stats=include_stats, strategy=strategy)
+            if job_id is None:
+                return jsonify({"success": False, "error": "Hệ thống đang bận, vui lòng thử lại sau."}), 503
+            return jsonify({"success": True, "job_id": job_id, "status_url": f"/api/process/{job_id}"}), 202
+
+        final_response, status_code = job_manager.run(filepath, sheet_name, include_stats=include_stats, strategy=strategy)
+        return jsonify(final_response), status_code
 
-        # --- BƯỚC 5: GỘP PALLET LẺ CÙNG CÔNG TY ---
-        print("\n# BƯỚC 5: GỘP PALLET LẺ CÙNG CÔNG TY #")
-        combined_pallets_same_company, uncombined_pallets = combine_fractional_pallets(fractional_pallets)
-        
-        last_combined_id = 0
-        if combined_pallets_same_company:
-            last_combined_id = max([int(re.search(r'\d+', p.id).group()) for p in combined_pallets_same_company])
-        next_id_for_mixed = last_combined_id + 1
-
-        # --- BƯỚC 5.5: TỐI ƯU HÓA GHÉP LIÊN CÔNG TY ---
-        print("\n# BƯỚC 5.5: TỐI ƯU HÓA GHÉP LIÊN CÔNG TY #")
-        newly_combined_mixed, remaining_fractionals, next_id_for_mixed = optimize_cross_company_combination(
-            combined_pallets_same_company, uncombined_pallets, next_id_for_mixed
-        )
-        
-        # --- BƯỚC 5.5b (MỚI THÊM): NỚI LỎNG NGƯỠNG GỘP LÊN 0.95 ---
-        print("\n# BƯỚC 5.5b: NỚI LỎNG NGƯỠNG GỘP LÊN 0.95 (CÙNG & LIÊN CTY) #")
-        current_combined_5_5 = newly_combined_mixed + [p for p in remaining_fractionals if p.is_combined]
-        current_single_5_5 = [p for p in remaining_fractionals if not p.is_combined]
-        
-        relaxed_combined, relaxed_singles, next_id_for_mixed = optimize_combination_relaxed_threshold(
-            current_combined_5_5, current_single_5_5, next_id_for_mixed, threshold=0.95
-        )
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"success": False, "error": f"Đã xảy ra lỗi hệ thống không mong muốn: {str(e)}"}), 500
+    
+@app.route('/api/process/<job_id>', methods=['GET'])
+def process_job_status(job_id):
+    """Trạng thái, giai đoạn hiện tại và kết quả (khi xong) của một job /api/process bất đồng bộ."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Không tìm thấy job hoặc job đã hết hạn."}), 404
+    return jsonify({"success": True, **job})
 
-        # --- BƯỚC 5.6 (MỚI THÊM): TÁCH NHỎ PALLET LẺ ĐỂ LẤP ĐẦY PALLET GỘP ---
-        print("\n# BƯỚC 5.6: TÁCH NHỎ PALLET LẺ ĐỂ LẤP ĐẦY PALLET GỘP #")
-        final_combined_5_6, final_singles_5_6 = optimize_by_splitting_and_filling_fractionals(
-            relaxed_combined, 
-            relaxed_singles
-        )
-        
-        # Gộp tất cả các pallet lẻ/gộp lại để chuẩn bị xếp
-        pallets_to_pack_fractional = final_combined_5_6 + final_singles_5_6
-        
-        # Xếp các pallet fractional đã tối ưu vào container
-        unplaced_fractional_pallets = pack_fractional_pallets(pallets_to_pack_fractional, final_containers)
-
-        # --- BƯỚC 6: VÒNG LẶP XỬ LÝ TOÀN BỘ PALLET CHỜ ---
-        print("\n# BƯỚC 6: VÒNG LẶP XỬ LÝ TOÀN BỘ PALLET CHỜ #")
-        loop_counter = 0
-        while unplaced_integer_pallets or unplaced_fractional_pallets:
-            loop_counter += 1
-            if loop_counter > 20: 
-                print("Warning: Loop limit reached. Breaking.")
-                break
-
-            pallets_before_iteration = len(unplaced_integer_pallets) + len(unplaced_fractional_pallets)
-            print(f"\n--- Bắt đầu vòng lặp xử lý pallet chờ lần thứ {loop_counter} ---")
-
-            # === 6.1: ƯU TIÊN XỬ LÝ DANH SÁCH PALLET NGUYÊN CHỜ ===
-            if unplaced_integer_pallets:
-                unplaced_integer_pallets = try_pack_pallets_into_same_company_containers(unplaced_integer_pallets, final_containers)
-
-                if unplaced_integer_pallets:
-                    can_cross_ship_all = check_cross_ship_capacity_for_list(unplaced_integer_pallets, final_containers, unplaced_fractional_pallets)
-                    
-                    if can_cross_ship_all:
-                        unplaced_integer_pallets = handle_unplaced_pallets_with_smart_splitting(unplaced_integer_pallets, final_containers, unplaced_fractional_pallets)
-                        if unplaced_integer_pallets:
-                            final_containers, container_id_counter = handle_remaining_integers_iteratively(unplaced_integer_pallets, final_containers, container_id_counter)
-                            unplaced_integer_pallets = []
-                    else:
-                        unplaced_integer_pallets = attempt_partial_cross_ship(unplaced_integer_pallets, final_containers, unplaced_fractional_pallets)
-                        if unplaced_integer_pallets:
-                            unplaced_integer_pallets, final_containers, container_id_counter = create_and_pack_one_new_container(
-                                unplaced_integer_pallets, final_containers, container_id_counter, unplaced_fractional_pallets
-                            )
 
-            # === 6.2: XỬ LÝ DANH SÁCH PALLET LẺ/GỘP CHỜ ===
-            if unplaced_fractional_pallets:
-                # 6.2.1: Thử xếp nguyên vẹn cùng công ty
-                unplaced_fractional_pallets = try_pack_unplaced_fractionals_same_company(unplaced_fractional_pallets, final_containers)
-                
-                # --- ĐOẠN MỚI THÊM: XỬ LÝ PALLET HỖN HỢP TRƯỚC LẮP GHÉP ---
-                mixed_pallets_to_place = [p for p in unplaced_fractional_pallets if "+" in str(p.company)]
-                unplaced_fractional_pallets = [p for p in unplaced_fractional_pallets if "+" not in str(p.company)]
-
-                if mixed_pallets_to_place:
-                    for mixed_pallet in list(mixed_pallets_to_place):
-                        placed = False
-                        for container in sorted(final_containers, key=lambda c: c.remaining_quantity):
-                            if container.can_fit(mixed_pallet):
-                                container.add_pallet(mixed_pallet)
-                                placed = True
-                                break 
-                        if not placed:
-                             unplaced_fractional_pallets.append(mixed_pallet)
-                # --------------------------------------------------------
-
-                # 6.2.2: Lắp ghép nâng cao (Repack)
-                if unplaced_fractional_pallets:
-                    unplaced_fractional_pallets = repack_unplaced_pallets(unplaced_fractional_pallets, final_containers)
-                
-                # 6.2.3: Chia nhỏ tỉ mỉ (Split & Fit)
-                if unplaced_fractional_pallets:
-                   final_containers, container_id_counter, unplaced_fractional_pallets = split_and_fit_leftovers(
-                           unplaced_fractional_pallets, final_containers, container_id_counter
-                   )
-                
-                # 6.2.4: Xếp chéo (Cross-ship)
-                if unplaced_fractional_pallets:
-                  unplaced_fractional_pallets, container_id_counter = cross_ship_remaining_pallets(
-                      unplaced_pallets=unplaced_fractional_pallets,
-                      containers=final_containers,
-                      next_container_id=container_id_counter,
-                      unplaced_integer_pallets=unplaced_integer_pallets
-                 )
-
-            # === 6.3: KIỂM TRA TIẾN TRIỂN ===
-            pallets_after_iteration = len(unplaced_integer_pallets) + len(unplaced_fractional_pallets)
-            
-            if pallets_after_iteration > 0 and pallets_after_iteration == pallets_before_iteration:
-                print("Warning: No progress in packing loop. Breaking to avoid infinite loop.")
-                break
-            
-            # === 6.4: XỬ LÝ PALLET HỖN HỢP CÒN SÓT LẠI VÀO CUỐI VÒNG LẶP ===
-            mixed_pallets_to_place = [p for p in unplaced_fractional_pallets if "+" in str(p.company)]
-            
-            if mixed_pallets_to_place:
-                for mixed_pallet in list(mixed_pallets_to_place):
-                    placed = False
-                    for container in sorted(final_containers, key=lambda c: c.remaining_quantity):
-                        if container.can_fit(mixed_pallet):
-                            container.add_pallet(mixed_pallet)
-                            placed = True
-                            unplaced_fractional_pallets = [p for p in unplaced_fractional_pallets if p.id != mixed_pallet.id]
-                            break
-                    if not placed:
-                        print(f"  [-] (Chưa xếp được) Pallet hỗn hợp {mixed_pallet.id} vẫn trong danh sách chờ.")
-
-        # --- GIAI ĐOẠN TỐI ƯU: XỬ LÝ CONTAINER LÃNG PHÍ ---
-        print("\n" + "="*80)
-        print("BẮT ĐẦU GIAI ĐOẠN TỐI ƯU HÓA: XỬ LÝ CONTAINER LÃNG PHÍ (ITERATIVE SOLVER V3)")
-        print("="*80)
-        
-        fully_optimized_containers = solve_waste_container_iteratively(final_containers)
+@app.route('/api/strategies', methods=['GET'])
+def list_strategies():
+    """Các chiến lược xếp có thể chọn qua tham số "strategy" của /api/process."""
+    return jsonify({"success": True, "default": DEFAULT_STRATEGY, "strategies": available_strategies()})
 
-        # --- BƯỚC 6.5 (MỚI THÊM): GỌI HÀM TỐI ƯU HÓA CROSS-SHIP ---
-        fully_optimized_containers = optimize_cross_company_combination_v2(fully_optimized_containers)
 
-        # --- GIAI ĐOẠN 7: HOÀN THIỆN VÀ TRẢ KẾT QUẢ ---
-        fully_optimized_containers.sort(key=lambda c: int(re.search(r'\d+', c.id).group()))
-        for i, container in enumerate(fully_optimized_containers, 1):
-            container.id = f"Cont_{i}"
+@app.route('/api/stats', methods=['GET'])
+def pipeline_stats_snapshot():
+    """Snapshot số liệu tổng hợp (thời gian từng giai đoạn, bộ đếm) của các lần chạy /api/process."""
+    return jsonify(stats_registry.snapshot())
 
-        response_dict = _generate_response_from_containers(fully_optimized_containers)
-        final_response = {
-            "success": response_dict.get("success", True),
-            "results": response_dict.get("data", [])
-        }
-        
-        unplaced_info = []
-        for p in (unplaced_integer_pallets or []):
-            unplaced_info.append(f"Pallet nguyên: {p.id} ({p.quantity} qty, {p.total_weight} wgt)")
-        for p in (unplaced_fractional_pallets or []):
-             unplaced_info.append(f"Pallet lẻ/gộp: {p.id} ({p.quantity} qty, {p.total_weight} wgt)")
 
-        if unplaced_info:
-            final_response["warning"] = "Không thể xếp hết tất cả pallet. Các pallet còn lại là:"
-            final_response["unplaced_pallets"] = unplaced_info
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Metrics dạng text Prometheus (độ trễ endpoint, thời gian từng giai đoạn, job đang chạy, ...)."""
+    return app.response_class(metrics.render_latest(), content_type=metrics.CONTENT_TYPE)
 
-        gc.collect()
-        return jsonify(final_response)
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"success": False, "error": f"Đã xảy ra lỗi hệ thống không mong muốn: {str(e)}"}), 500
-    
 @app.route('/api/generate_packing_list', methods=['POST'])
 def generate_packing_list_endpoint():
-    print("\n[BACKEND] Bắt đầu xử lý /api/generate_packing_list với logic PHÂN BỔ MỚI.")
+    logger.info("[BACKEND] Bắt đầu xử lý /api/generate_packing_list với logic PHÂN BỔ MỚI.")
     try:
         data = request.get_json()
         optimized_results = data.get('optimized_results')
@@ -777,7 +625,7 @@ def generate_packing_list_endpoint():
         for product_code, data in product_allocation_map.items():
             key_item = next((k for k in raw_data_map if k.startswith(str(product_code) + '||')), None)
             if not key_item:
-                print(f"Warning: Could not find raw data for product code {product_code} during pre-computation.")
+                logger.warning("Warning: Could not find raw data for product code %s during pre-computation.", product_code)
                 continue
                 
             raw_info_item = raw_data_map.get(key_item, {})
@@ -797,14 +645,14 @@ def generate_packing_list_endpoint():
 
 
         # --- BƯỚC 3: TẠO DỮ LIỆU PACKING LIST CHO TỪNG CONTAINER (RENDER) ---
-        print("[BACKEND] Bắt đầu render Packing List từ kết quả tối ưu hóa...")
+        logger.info("[BACKEND] Bắt đầu render Packing List từ kết quả tối ưu hóa...")
         global_pallet_counter = {'item_no': 1, 'pallet_no': 1}
         finalized_dfs = {}
         optimized_results.sort(key=lambda x: int(re.search(r'\d+', x['id']).group()))
 
         for container_data in optimized_results:
             container_id = container_data['id']
-            print(f"  - Đang render cho Container {container_id}...")
+            logger.debug("  - Đang render cho Container %s...", container_id)
             container_rows = []
             sorted_contents = sorted(container_data.get('contents', []), key=lambda x: x.get('id', ''))
 
@@ -848,7 +696,7 @@ def generate_packing_list_endpoint():
                 finalized_dfs[container_id] = pd.DataFrame(container_rows)
 
         # --- BƯỚC 4: GHI KẾT QUẢ RA FILE EXCEL (Không thay đổi) ---
-        print("[BACKEND] Đang tạo file Excel từ dữ liệu đã render...")
+        logger.info("[BACKEND] Đang tạo file Excel từ dữ liệu đã render...")
         wb = Workbook()
         wb.remove(wb.active)
 
@@ -908,7 +756,7 @@ def generate_packing_list_endpoint():
         excel_buffer.seek(0)
         gc.collect()
 
-        print("[BACKEND] Đang gửi file về cho frontend...")
+        logger.info("[BACKEND] Đang gửi file về cho frontend...")
         return send_file(
             excel_buffer, as_attachment=True,
             download_name=f'PackingList_{sheet_name}.xlsx',
@@ -918,8 +766,8 @@ def generate_packing_list_endpoint():
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
-        print(f"\n\n[BACKEND] !!! ĐÃ XẢY RA LỖI KHÔNG MONG MUỐN !!!")
-        print(error_details)
+        logger.error("[BACKEND] !!! ĐÃ XẢY RA LỖI KHÔNG MONG MUỐN !!!")
+        logger.error("%s", error_details)
         return jsonify({"success": False, "error": f"Lỗi nghiêm trọng ở backend: {str(e)}"}), 500
 
 
@@ -0,0 +1,87 @@
+"""
+Benchmark bước tạo Pallet từ dữ liệu Excel đã làm sạch.
+
+So sánh cách cũ (df.iterrows()) với build_pallets_from_frame (lấy cột thành mảng).
+Mặc định dùng DataFrame giả lập N dòng (không cần file); nếu truyền đường dẫn file
+và tên sheet thì đo thêm toàn bộ load_and_prepare_pallets trên file đó.
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_loader.py [N]
+    python benchmarks/bench_loader.py N path/to/file.xlsx SheetName
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_processor import Pallet, build_pallets_from_frame, load_and_prepare_pallets
+
+
+def _pallets_via_iterrows(df):
+    """Cách tạo pallet trước đây, giữ lại làm mốc so sánh."""
+    return [
+        Pallet(
+            p_id=f"P{i}",
+            product_code=r['product_code'],
+            product_name=r['product_name'],
+            company=r['company'],
+            box_per_pallet=r['BoxPerPallet'],
+            quantity=r['quantity'],
+            weight_per_pallet=r['weight_per_pallet']
+        )
+        for i, r in df.iterrows()
+    ]
+
+
+def _synthetic_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'product_code': [f"PC{i:06d}" for i in range(n)],
+        'product_name': [f"Part {i}" for i in range(n)],
+        'company': rng.integers(1, 5, n).astype(str),
+        'BoxPerPallet': rng.choice([10.0, 20.0, 40.0], n),
+        'weight_per_pallet': rng.uniform(200, 1500, n).round(1),
+        'quantity': rng.uniform(0.05, 12, n).round(3),
+    })
+
+
+def _timed(fn, *args, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    df = _synthetic_frame(n)
+
+    t_old, old = _timed(_pallets_via_iterrows, df)
+    t_new, new = _timed(build_pallets_from_frame, df)
+    same = all(
+        (a.id, a.product_code, a.company, a.quantity, a.total_weight) ==
+        (b.id, b.product_code, b.company, b.quantity, b.total_weight)
+        for a, b in zip(old, new)
+    ) and len(old) == len(new)
+
+    print(f"{n} dòng -> Pallet:")
+    print(f"  iterrows                 : {t_old * 1000:9.1f} ms")
+    print(f"  build_pallets_from_frame : {t_new * 1000:9.1f} ms  (x{t_old / t_new:.1f})")
+    print(f"  kết quả giống nhau       : {same}")
+
+    if len(sys.argv) > 3:
+        filepath, sheet_name = sys.argv[2], sys.argv[3]
+        t_file, (pallets, error) = _timed(load_and_prepare_pallets, filepath, sheet_name, repeat=1)
+        print(f"load_and_prepare_pallets({filepath}): {t_file * 1000:.1f} ms, "
+              f"{len(pallets or [])} pallet, lỗi: {error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark chi phí logging của pipeline tối ưu hóa.
+
+Chạy optimize_pallet_table (BƯỚC 2 -> 6.5) trên cùng một file với:
+- DEBUG   : in toàn bộ log chi tiết (tương đương các lệnh print trước đây), ghi vào os.devnull
+            để chỉ đo chi phí định dạng + I/O chứ không phụ thuộc tốc độ terminal;
+- WARNING : mức mặc định khi chạy production.
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_logging.py path/to/file.xlsx SheetName [số lần lặp]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_processor import load_pallet_table
+from logging_config import configure_logging
+from pipeline import optimize_pallet_table
+
+
+def _best_time(pallet_table, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        optimize_pallet_table(pallet_table)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    filepath, sheet_name = sys.argv[1], sys.argv[2]
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    pallet_table, error = load_pallet_table(filepath, sheet_name)
+    if error:
+        print(error)
+        sys.exit(1)
+
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        configure_logging('DEBUG', stream=devnull)
+        t_debug = _best_time(pallet_table, repeat)
+        configure_logging('WARNING')
+        t_quiet = _best_time(pallet_table, repeat)
+
+    print(f"{filepath} [{sheet_name}], {len(pallet_table)} dòng, tốt nhất trong {repeat} lần:")
+    print(f"  LOG_LEVEL=DEBUG   : {t_debug * 1000:9.1f} ms")
+    print(f"  LOG_LEVEL=WARNING : {t_quiet * 1000:9.1f} ms  (x{t_debug / t_quiet:.2f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark bộ nhớ và thời gian khởi tạo của Pallet.
+
+Đo trên N pallet (mặc định 50.000) - tương đương số mảnh pallet sau khi tách
+của một đơn hàng tháng lớn:
+  - bytes/pallet khi khởi tạo trực tiếp (tracemalloc)
+  - µs/pallet khi khởi tạo trực tiếp
+  - bytes/mảnh và µs/mảnh khi tạo bằng Pallet.split()
+
+Chạy từ thư mục backend:  python benchmarks/bench_pallet.py [N]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_processor import Pallet
+
+
+def _build(n):
+    return [
+        Pallet(p_id=f"P{i}", product_code=f"PC{i}", product_name="Part", company="1",
+               quantity=0.25 + (i % 7) * 0.1, weight_per_pallet=500.0, box_per_pallet=20)
+        for i in range(n)
+    ]
+
+
+def _split_all(pallets):
+    pieces = []
+    for p in pallets:
+        rem, part = p.split(p.quantity / 2)
+        pieces.append(rem)
+        pieces.append(part)
+    return pieces
+
+
+def measure(n):
+    results = {}
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    pallets = _build(n)
+    results['bytes_per_pallet'] = (tracemalloc.get_traced_memory()[0] - before) / n
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    _build(n)
+    results['us_per_pallet'] = (time.perf_counter() - start) / n * 1e6
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    pieces = _split_all(pallets)
+    results['bytes_per_split_piece'] = (tracemalloc.get_traced_memory()[0] - before) / len(pieces)
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    _split_all(pallets)
+    results['us_per_split_piece'] = (time.perf_counter() - start) / (2 * n) * 1e6
+    return results
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    for key, value in measure(n).items():
+        print(f"{key:>24}: {value:10.2f}")
@@ -0,0 +1,304 @@
+"""
+Benchmark có thể tái lập cho pipeline tối ưu hóa (/api/process) trên dữ liệu giả lập.
+
+Mỗi kịch bản (xem SCENARIOS, tham số của synthetic.generate_rows) được ghi ra file .xlsx tạm rồi, với mỗi chiến lược xếp (--strategy):
+- chạy toàn bộ pipeline như /api/process (run_optimization_pipeline, cache sheet được xóa
+  trước mỗi lần nên bước đọc file luôn được tính), lấy thời gian tốt nhất / trung vị;
+- đo riêng bước đọc file (load_pallet_table);
+- đo từng giai đoạn (PIPELINE_STAGES): thời gian lấy từ PipelineStats, bộ nhớ đỉnh của mỗi
+  giai đoạn đo bằng tracemalloc trong một lần chạy riêng (tracemalloc làm chậm nên không
+  dùng lần chạy đó để tính thời gian). Các giai đoạn phụ thuộc kết quả của nhau nên được
+  tách ra theo ranh giới giai đoạn trong cùng một lần chạy;
+- ghi lại số container, số pallet không xếp được và các bộ đếm thao tác;
+- tính cận dưới của số container (bounds.container_lower_bounds) và gap của kết quả so với cận
+  đó, in cạnh thời gian chạy để so sánh công bằng các heuristic nhanh hơn với pipeline hiện tại.
+  Gap chỉ có ý nghĩa đầy đủ khi mọi pallet đều được xếp (complete=true).
+
+Kết quả ghi ra file JSON (--output). Truyền --compare <file cũ> để so sánh với lần chạy trước:
+chương trình trả mã lỗi 1 nếu một kịch bản trước đây chạy được nay bị lỗi, số container/pallet
+không xếp được tăng lên hoặc thời gian chạy chậm hơn quá --tolerance lần.
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --scenarios small,medium --repeat 5 --output bench.json
+    python benchmarks/bench_pipeline.py --compare bench_old.json
+    python benchmarks/bench_pipeline.py --strategy v3,greedy --scenarios medium
+    python benchmarks/bench_pipeline.py --rows 3000 --companies 8 --fractional-share 0.8 --oversized-share 0.1
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from bounds import container_lower_bounds, optimality_gap
+from data_processor import build_pallets_from_frame, load_pallet_table
+from pipeline import PIPELINE_STAGES, run_optimization_pipeline
+from solvers import DEFAULT_STRATEGY, available_strategies
+from synthetic import write_order_sheet
+from workbook_cache import clear_cache
+
+RESULTS_FORMAT_VERSION = 1
+
+# Kịch bản mặc định: (tên, tham số của synthetic.generate_rows)
+SCENARIOS = [
+    ('small', dict(rows=200, companies=3, fractional_share=0.6, fraction_profile='uniform', oversized_share=0.02)),
+    ('medium', dict(rows=1500, companies=5, fractional_share=0.6, fraction_profile='uniform', oversized_share=0.02)),
+    ('many_companies', dict(rows=1500, companies=20, fractional_share=0.6, fraction_profile='uniform', oversized_share=0.02)),
+    ('fractional_small', dict(rows=1500, companies=5, fractional_share=0.9, fraction_profile='small', oversized_share=0.0)),
+    ('fractional_large', dict(rows=1500, companies=5, fractional_share=0.9, fraction_profile='large', oversized_share=0.0)),
+    ('oversized', dict(rows=800, companies=5, fractional_share=0.5, fraction_profile='uniform', oversized_share=0.2)),
+    ('large', dict(rows=5000, companies=8, fractional_share=0.6, fraction_profile='uniform', oversized_share=0.02)),
+]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'cpu_count': os.cpu_count(),
+        'git_commit': _git_commit(),
+    }
+
+
+def _run_full(filepath, sheet_name, strategy, progress=None):
+    """Như /api/process: lỗi không mong muốn trong pipeline trở thành payload lỗi với mã 500."""
+    clear_cache()
+    try:
+        return run_optimization_pipeline(filepath, sheet_name, progress=progress, strategy=strategy)
+    except Exception as e:
+        return {"success": False, "error": f"{type(e).__name__}: {e}"}, 500
+
+
+def _measure_stage_memory(filepath, sheet_name, strategy):
+    """Một lần chạy có tracemalloc: bộ nhớ đỉnh (MB) của cả pipeline và của từng giai đoạn."""
+    stage_peaks = {}
+    current = [None]
+
+    def progress(stage, detail=None):
+        if stage == current[0]:
+            return
+        if current[0] is not None:
+            peak = tracemalloc.get_traced_memory()[1]
+            stage_peaks[current[0]] = max(stage_peaks.get(current[0], 0), peak)
+        tracemalloc.reset_peak()
+        current[0] = stage
+
+    tracemalloc.start()
+    try:
+        _run_full(filepath, sheet_name, strategy, progress)
+        if current[0] is not None:
+            stage_peaks[current[0]] = max(stage_peaks.get(current[0], 0), tracemalloc.get_traced_memory()[1])
+    finally:
+        tracemalloc.stop()
+    total_peak = max(stage_peaks.values()) if stage_peaks else 0
+    return total_peak / 1e6, {stage: peak / 1e6 for stage, peak in stage_peaks.items()}
+
+
+def _measure_load(filepath, sheet_name, repeat):
+    times = []
+    for _ in range(repeat):
+        clear_cache()
+        start = time.perf_counter()
+        table, error = load_pallet_table(filepath, sheet_name)
+        times.append(time.perf_counter() - start)
+    clear_cache()
+    tracemalloc.start()
+    try:
+        load_pallet_table(filepath, sheet_name)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': round(min(times), 6), 'peak_mb': round(peak / 1e6, 3)}, (None if error else table)
+
+
+def run_scenario(name, params, seed, strategy, filepath, sheet_name, repeat):
+    load, table = _measure_load(filepath, sheet_name, repeat)
+    bounds = container_lower_bounds(build_pallets_from_frame(table) if table is not None else [])
+    bounds.pop('companies')
+
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload, http_status = _run_full(filepath, sheet_name, strategy)
+        runs.append((time.perf_counter() - start, payload, http_status))
+    best_seconds, payload, http_status = min(runs, key=lambda run: run[0])
+    stats = payload.get('stats') or {'stages': [], 'counters': {}}
+
+    peak_mb, stage_peaks = _measure_stage_memory(filepath, sheet_name, strategy)
+    stage_seconds = {item['stage']: item['seconds'] for item in stats['stages']}
+    stages = {
+        stage: {'seconds': stage_seconds.get(stage), 'peak_mb': round(stage_peaks.get(stage, 0.0), 3)}
+        for stage, _ in PIPELINE_STAGES if stage in stage_seconds or stage in stage_peaks
+    }
+    containers = len(payload.get('results') or [])
+    unplaced = len(payload.get('unplaced_pallets') or [])
+    gap, gap_ratio = optimality_gap(containers, bounds['global'])
+
+    return {
+        'name': name,
+        'strategy': strategy,
+        'params': dict(params, seed=seed),
+        'rows_loaded': 0 if table is None else len(table),
+        'http_status': http_status,
+        'error': payload.get('error'),
+        'containers': containers,
+        'unplaced': unplaced,
+        'lower_bounds': bounds,
+        'gap': {
+            'containers': gap if http_status == 200 else None,
+            'ratio': round(gap_ratio, 4) if http_status == 200 and gap_ratio is not None else None,
+            'complete': http_status == 200 and unplaced == 0,
+        },
+        'full': {
+            'seconds_best': round(best_seconds, 6),
+            'seconds_median': round(statistics.median(run[0] for run in runs), 6),
+            'peak_mb': round(peak_mb, 3),
+        },
+        'load': load,
+        'stages': stages,
+        'counters': stats['counters'],
+    }
+
+
+def _format_gap(gap):
+    if not gap or gap['containers'] is None:
+        return '-'
+    return f"+{gap['containers']}" if gap['containers'] >= 0 else str(gap['containers'])
+
+
+def _print_item(item):
+    gap = item['gap']
+    gap_text = '' if gap['containers'] is None else (
+        f"  gap {_format_gap(gap)}" + (f" ({gap['ratio']:.1%})" if gap['ratio'] is not None else '')
+        + ('' if gap['complete'] else '*'))
+    print(f"{item['name'] + '/' + item['strategy']:<26} {item['rows_loaded']:>6} dòng"
+          f"  {item['full']['seconds_best'] * 1000:9.1f} ms"
+          f"  đỉnh {item['full']['peak_mb']:7.1f} MB  {item['containers']:>4} container"
+          f"  (cận dưới {item['lower_bounds']['global']:>4}{gap_text})"
+          f"  {item['unplaced']:>3} không xếp được"
+          + (f"  [HTTP {item['http_status']}: {item['error']}]" if item['http_status'] != 200 else ''))
+
+
+def compare_results(current, previous, tolerance):
+    """In bảng so sánh với kết quả cũ, trả về danh sách kịch bản bị hồi quy."""
+    # Kết quả cũ chưa có khóa 'strategy' được tính là 'v3'
+    old = {(item['name'], item.get('strategy', DEFAULT_STRATEGY)): item for item in previous['scenarios']}
+    regressions = []
+    print(f"\nSo sánh với {previous.get('environment', {}).get('git_commit') or 'kết quả cũ'}:")
+    print(f"  {'kịch bản':<26}{'thời gian':>22}{'container':>14}{'không xếp':>14}{'gap':>16}")
+    for item in current['scenarios']:
+        label = f"{item['name']}/{item['strategy']}"
+        before = old.get((item['name'], item['strategy']))
+        if before is None or before['params'] != item['params']:
+            print(f"  {label:<26}{'(không có mốc so sánh)':>22}")
+            continue
+        ratio = item['full']['seconds_best'] / max(before['full']['seconds_best'], 1e-9)
+        worse = (ratio > tolerance
+                 or (item['http_status'] != 200 and before['http_status'] == 200)
+                 or item['containers'] > before['containers']
+                 or item['unplaced'] > before['unplaced'])
+        if worse:
+            regressions.append(label)
+        print(f"  {label:<26}{'x%.2f' % ratio:>22}"
+              f"{'%d -> %d' % (before['containers'], item['containers']):>14}"
+              f"{'%d -> %d' % (before['unplaced'], item['unplaced']):>14}"
+              f"{_format_gap(before.get('gap')) + ' -> ' + _format_gap(item['gap']):>16}"
+              f"{'  HỒI QUY' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', help='danh sách tên kịch bản, phân cách bởi dấu phẩy (mặc định: tất cả)')
+    parser.add_argument('--rows', type=int, help='chạy một kịch bản tùy chỉnh với số dòng này')
+    parser.add_argument('--companies', type=int, default=5)
+    parser.add_argument('--fractional-share', type=float, default=0.6)
+    parser.add_argument('--fraction-profile', default='uniform', choices=['uniform', 'small', 'large'])
+    parser.add_argument('--oversized-share', type=float, default=0.02)
+    parser.add_argument('--strategy', default=DEFAULT_STRATEGY,
+                        help=f"chiến lược xếp, nhiều chiến lược phân cách bởi dấu phẩy "
+                             f"({', '.join(sorted(available_strategies()))}; mặc định {DEFAULT_STRATEGY})")
+    parser.add_argument('--repeat', type=int, default=3, help='số lần chạy mỗi kịch bản (lấy thời gian tốt nhất)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_pipeline_results.json')
+    parser.add_argument('--compare', help='file kết quả cũ để so sánh')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='chậm hơn quá bao nhiêu lần thì coi là hồi quy (mặc định 1.25)')
+    args = parser.parse_args()
+
+    # Pipeline log rất nhiều ở mức DEBUG/INFO; benchmark chỉ cần kết quả
+    logging.getLogger('packing').setLevel(logging.CRITICAL)
+
+    if args.rows:
+        scenarios = [('custom', dict(rows=args.rows, companies=args.companies,
+                                     fractional_share=args.fractional_share,
+                                     fraction_profile=args.fraction_profile,
+                                     oversized_share=args.oversized_share))]
+    else:
+        scenarios = SCENARIOS
+        if args.scenarios:
+            wanted = set(args.scenarios.split(','))
+            unknown = wanted - {name for name, _ in SCENARIOS}
+            if unknown:
+                parser.error(f"không có kịch bản: {', '.join(sorted(unknown))}")
+            scenarios = [(name, params) for name, params in SCENARIOS if name in wanted]
+    strategies = args.strategy.split(',')
+    unknown = set(strategies) - set(available_strategies())
+    if unknown:
+        parser.error(f"không có chiến lược: {', '.join(sorted(unknown))}")
+
+    results = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'generated_at': time.time(),
+        'environment': _environment(),
+        'repeat': args.repeat,
+        'scenarios': [],
+    }
+    with tempfile.TemporaryDirectory(prefix='bench_pipeline_') as workdir:
+        for name, params in scenarios:
+            filepath, sheet_name = write_order_sheet(os.path.join(workdir, f"{name}.xlsx"), seed=args.seed, **params)
+            for strategy in strategies:
+                item = run_scenario(name, params, args.seed, strategy, filepath, sheet_name, args.repeat)
+                results['scenarios'].append(item)
+                _print_item(item)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    if any(not item['gap']['complete'] for item in results['scenarios'] if item['gap']['containers'] is not None):
+        print("(*) còn pallet không xếp được: gap thấp hơn thực tế")
+    print(f"\nĐã ghi kết quả vào {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        regressions = compare_results(results, previous, args.tolerance)
+        if regressions:
+            print(f"\nHồi quy: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
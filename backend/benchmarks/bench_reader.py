@@ -0,0 +1,57 @@
+"""
+Benchmark bước đọc sheet Excel (workbook_cache._parse_sheet).
+
+So sánh pd.read_excel (đọc toàn bộ các cột của sheet) với trình đọc openpyxl read_only
+(chỉ giữ RAW_COLUMNS): thời gian, bộ nhớ đỉnh (tracemalloc) và kiểm tra hai DataFrame
+giống hệt nhau.
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_reader.py path/to/file.xlsx SheetName
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import workbook_cache
+
+
+def _measure(streaming, filepath, sheet_name):
+    workbook_cache.USE_STREAMING_READER = streaming
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = workbook_cache._parse_sheet(filepath, sheet_name)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, df
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    filepath, sheet_name = sys.argv[1], sys.argv[2]
+    size_mb = os.path.getsize(filepath) / (1024 * 1024)
+
+    t_old, peak_old, df_old = _measure(False, filepath, sheet_name)
+    t_new, peak_new, df_new = _measure(True, filepath, sheet_name)
+
+    try:
+        pd.testing.assert_frame_equal(df_old, df_new)
+        same = True
+    except AssertionError:
+        same = False
+
+    print(f"{filepath} ({size_mb:.1f} MB, {len(df_new)} dòng):")
+    print(f"  pd.read_excel      : {t_old * 1000:9.1f} ms, bộ nhớ đỉnh {peak_old / 1e6:7.1f} MB")
+    print(f"  openpyxl read_only : {t_new * 1000:9.1f} ms, bộ nhớ đỉnh {peak_new / 1e6:7.1f} MB")
+    print(f"  kết quả giống nhau : {same}")
+
+
+if __name__ == '__main__':
+    main()
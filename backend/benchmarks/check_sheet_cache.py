@@ -0,0 +1,83 @@
+"""
+Kiểm tra cache sheet trên đĩa (workbook_cache sidecar) với file nhiều sheet:
+- đọc hai sheet của cùng một file -> cả hai sidecar được giữ lại;
+- sau khi xóa cache bộ nhớ, cả hai sheet được đọc lại từ sidecar (không parse lại file);
+- upload đè file bằng nội dung khác -> sidecar của nội dung cũ bị xóa, hash / tên sheet đã nhớ
+  của file được thay (không tích lũy mục theo từng lần sửa file).
+
+Chạy từ thư mục backend:
+    python benchmarks/check_sheet_cache.py
+"""
+import os
+import sys
+import tempfile
+
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import workbook_cache
+from benchmarks.synthetic import HEADER_ROWS, SHEET_COLUMNS
+
+SHEETS = ('Sheet1', 'Sheet2')
+
+
+def _write_workbook(path, rows):
+    wb = Workbook()
+    wb.remove(wb.active)
+    for n, sheet_name in enumerate(SHEETS):
+        ws = wb.create_sheet(sheet_name)
+        for _ in range(HEADER_ROWS):
+            ws.append(['header'] * SHEET_COLUMNS)
+        for i in range(rows):
+            row = [None] * SHEET_COLUMNS
+            row[1] = f"PC{n}-{i}"
+            row[11] = i + 1
+            ws.append(row)
+    wb.save(path)
+
+
+def _sidecars(cache_dir):
+    return sorted(e.name for e in os.scandir(cache_dir) if e.is_dir() and not e.name.startswith('.'))
+
+
+def _no_parse(*args):
+    raise AssertionError("sheet bị parse lại dù đã có sidecar")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'upload.xlsx')
+        cache_dir = os.path.join(tmp, '.sheet_cache')
+        workbook_cache.clear_cache()
+        workbook_cache.enable_disk_cache(cache_dir)
+
+        _write_workbook(path, rows=3)
+        for sheet_name in SHEETS:
+            workbook_cache.read_sheet(path, sheet_name)
+        assert len(_sidecars(cache_dir)) == 2, f"cần 2 sidecar, còn {_sidecars(cache_dir)}"
+
+        workbook_cache.clear_cache()
+        parse_sheet = workbook_cache._parse_sheet
+        workbook_cache._parse_sheet = _no_parse
+        try:
+            for sheet_name in SHEETS:
+                workbook_cache.read_sheet(path, sheet_name)
+        finally:
+            workbook_cache._parse_sheet = parse_sheet
+
+        old_sidecars = set(_sidecars(cache_dir))
+        _write_workbook(path, rows=4)
+        workbook_cache.read_sheet(path, SHEETS[0])
+        remaining = set(_sidecars(cache_dir))
+        assert not remaining & old_sidecars, "sidecar của nội dung cũ chưa bị xóa"
+        assert len(remaining) == 1
+        workbook_cache.list_sheet_names(path)
+        assert len(workbook_cache._hash_cache) == 1 and len(workbook_cache._sheet_names_cache) == 1
+
+        workbook_cache.clear_cache()
+    print("OK: sidecar của các sheet cùng file được giữ, nội dung cũ bị xóa khi upload đè.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Load test cho /api/process: chạy nhiều job tối ưu hóa cùng lúc và đo thông lượng (job/giây).
+
+Mặc định chạy ngay trong tiến trình (không cần server), so sánh JobManager ở hai chế độ:
+- thread : pipeline chạy trong các luồng -> các job tranh nhau GIL, thông lượng không tăng theo số core.
+- process: phần tính toán chạy trong ProcessPoolExecutor -> thông lượng tăng theo số core.
+Có thể thay bằng server thật (waitress) qua --url, khi đó các request được gửi song song qua HTTP.
+
+Chạy từ thư mục backend:
+    python benchmarks/load_test.py path/to/file.xlsx SheetName --jobs 8 --processes 4
+    python benchmarks/load_test.py path/to/file.xlsx SheetName --jobs 8 --url http://localhost:5001
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import JobManager
+
+
+class _SilencedStdout:
+    """Tắt stdout ở mức file descriptor (kể cả print của tiến trình worker) trong lúc đo."""
+
+    def __enter__(self):
+        sys.stdout.flush()
+        self._saved = os.dup(1)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.close(devnull)
+        return self
+
+    def __exit__(self, *exc):
+        sys.stdout.flush()
+        os.dup2(self._saved, 1)
+        os.close(self._saved)
+
+
+def _run_in_process(mode, filepath, sheet_name, jobs, processes):
+    manager = JobManager(max_workers=jobs, max_queued=jobs, executor=mode, processes=processes)
+    # Khởi động trước: đọc file vào cache và (chế độ process) tạo sẵn các tiến trình worker
+    with ThreadPoolExecutor(max_workers=processes) as warmup:
+        list(warmup.map(lambda _: manager.run(filepath, sheet_name), range(processes if mode == 'process' else 1)))
+
+    start = time.perf_counter()
+    job_ids = [manager.submit(filepath, sheet_name) for _ in range(jobs)]
+    results = []
+    while len(results) < len(job_ids):
+        time.sleep(0.05)
+        results = [job for job in (manager.get(j) for j in job_ids) if job['status'] in ('done', 'failed')]
+    elapsed = time.perf_counter() - start
+    manager.shutdown(wait=True)
+
+    containers = {len(job['result'].get('results', [])) for job in results}
+    failed = sum(1 for job in results if job['status'] == 'failed')
+    return elapsed, containers, failed
+
+
+def _post(url, payload):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=3600) as resp:
+        return json.loads(resp.read())
+
+
+def _run_over_http(url, filepath, sheet_name, jobs):
+    payload = {'filepath': filepath, 'sheetName': sheet_name}
+    _post(f"{url}/api/process", payload)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(lambda _: _post(f"{url}/api/process", payload), range(jobs)))
+    elapsed = time.perf_counter() - start
+    containers = {len(r.get('results', [])) for r in results}
+    failed = sum(1 for r in results if not r.get('success'))
+    return elapsed, containers, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('filepath')
+    parser.add_argument('sheet_name')
+    parser.add_argument('--jobs', type=int, default=8, help='số job chạy đồng thời')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='số tiến trình worker')
+    parser.add_argument('--modes', default='thread,process', help='các chế độ JobManager cần đo')
+    parser.add_argument('--url', help='gửi request tới server đang chạy thay vì chạy trong tiến trình')
+    args = parser.parse_args()
+    filepath = os.path.abspath(args.filepath)
+
+    print(f"{args.jobs} job đồng thời trên {filepath} [{args.sheet_name}], {os.cpu_count()} CPU")
+    if args.url:
+        with _SilencedStdout():
+            elapsed, containers, failed = _run_over_http(args.url.rstrip('/'), filepath, args.sheet_name, args.jobs)
+        print(f"  {args.url}: {elapsed:8.2f} s, {args.jobs / elapsed:6.2f} job/s, "
+              f"số container {sorted(containers)}, lỗi {failed}")
+        return
+
+    for mode in args.modes.split(','):
+        with _SilencedStdout():
+            elapsed, containers, failed = _run_in_process(mode, filepath, args.sheet_name,
+                                                          args.jobs, args.processes)
+        workers = f"{args.processes} tiến trình" if mode == 'process' else f"{args.jobs} luồng"
+        print(f"  {mode:7s} ({workers}): {elapsed:8.2f} s, {args.jobs / elapsed:6.2f} job/s, "
+              f"số container {sorted(containers)}, lỗi {failed}")
+
+
+if __name__ == '__main__':
+    main()
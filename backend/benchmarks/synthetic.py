@@ -0,0 +1,121 @@
+"""
+Sinh dữ liệu đơn hàng giả lập (cùng bố cục sheet với file Excel thật) cho các benchmark.
+
+Các tham số điều khiển:
+- rows             : số dòng sản phẩm;
+- companies        : số công ty (cột D nhận giá trị 1..companies);
+- fractional_share : tỉ lệ dòng có số lượng lẻ (ví dụ 3.4 hoặc 0.6), phần còn lại là số nguyên;
+- fraction_profile : phân bố phần lẻ (số thùng lẻ / BoxPerPallet): 'uniform' (đều), 'small' (đa số < 0.5),
+                     'large' (đa số >= 0.5);
+- oversized_share  : tỉ lệ dòng quá khổ (quantity > MAX_PALLETS hoặc tổng trọng lượng > MAX_WEIGHT);
+- seed             : cùng tham số + seed -> cùng dữ liệu.
+
+generate_order_table() trả về DataFrame giống kết quả load_pallet_table (dùng thẳng cho
+optimize_pallet_table), write_order_sheet() ghi ra .xlsx để chạy cả bước đọc file.
+"""
+import os
+import random
+import sys
+
+import pandas as pd
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_processor import MAX_PALLETS, MAX_WEIGHT
+
+SHEET_NAME = 'Sheet1'
+HEADER_ROWS = 5
+SHEET_COLUMNS = 49
+FRACTION_PROFILES = ('uniform', 'small', 'large')
+
+TABLE_COLUMNS = ['product_code', 'product_name', 'company', 'BoxPerPallet', 'weight_per_pallet', 'quantity']
+
+
+def _fraction(rnd, profile, box_per_pallet):
+    """Phần lẻ = số thùng lẻ / số thùng mỗi pallet, như trong file thật."""
+    if profile == 'small':
+        share = rnd.betavariate(1.2, 4.0)
+    elif profile == 'large':
+        share = rnd.betavariate(4.0, 1.2)
+    else:
+        share = rnd.random()
+    boxes = min(box_per_pallet - 1, 1 + int(share * (box_per_pallet - 1)))
+    return round(boxes / box_per_pallet, 3)
+
+
+def generate_rows(rows, companies=3, fractional_share=0.6, fraction_profile='uniform',
+                  oversized_share=0.02, seed=0):
+    """Danh sách dict, mỗi dict là một dòng sản phẩm (các trường của sheet gốc)."""
+    if fraction_profile not in FRACTION_PROFILES:
+        raise ValueError(f"fraction_profile phải là một trong {FRACTION_PROFILES}")
+    rnd = random.Random(seed)
+    result = []
+    for i in range(rows):
+        box_per_pallet = rnd.choice([10, 20, 40])
+        qty_per_box = rnd.choice([10, 20, 50])
+        weight_per_pallet = round(rnd.uniform(200, 1500), 1)
+        is_fractional = rnd.random() < fractional_share
+
+        if rnd.random() < oversized_share:
+            if rnd.random() < 0.5:
+                # Quá khổ theo số lượng
+                quantity = rnd.randint(int(MAX_PALLETS) + 1, int(MAX_PALLETS) * 2 + 5)
+            else:
+                # Quá khổ theo trọng lượng
+                quantity = rnd.randint(12, int(MAX_PALLETS))
+                weight_per_pallet = round(rnd.uniform(MAX_WEIGHT / quantity + 50, MAX_WEIGHT / quantity + 900), 1)
+        elif is_fractional:
+            quantity = rnd.choice([0, 0, 1, 2, 3, 4, 5, 6])
+        else:
+            quantity = rnd.randint(1, 8)
+        if is_fractional:
+            quantity = round(quantity + _fraction(rnd, fraction_profile, box_per_pallet), 3)
+
+        result.append({
+            'product_code': f"PC{i:06d}",
+            'product_name': f"Part {i}",
+            'company': rnd.randint(1, companies),
+            'weight_per_piece': round(weight_per_pallet / (box_per_pallet * qty_per_box), 4),
+            'QtyPerBox': qty_per_box,
+            'BoxPerPallet': box_per_pallet,
+            'weight_per_pallet': weight_per_pallet,
+            'quantity': quantity,
+            'total_pcs': int(quantity * box_per_pallet * qty_per_box),
+        })
+    return result
+
+
+def generate_order_table(rows, companies=3, fractional_share=0.6, fraction_profile='uniform',
+                         oversized_share=0.02, seed=0):
+    """Bảng pallet đã làm sạch, cùng định dạng với load_pallet_table."""
+    data = generate_rows(rows, companies, fractional_share, fraction_profile, oversized_share, seed)
+    df = pd.DataFrame(data, columns=TABLE_COLUMNS)
+    df['company'] = df['company'].astype(str)
+    return df
+
+
+def write_order_sheet(path, rows, companies=3, fractional_share=0.6, fraction_profile='uniform',
+                      oversized_share=0.02, seed=0):
+    """Ghi sheet giả lập ra file .xlsx (5 dòng tiêu đề, 49 cột như file thật). Trả về (path, SHEET_NAME)."""
+    data = generate_rows(rows, companies, fractional_share, fraction_profile, oversized_share, seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SHEET_NAME)
+    for _ in range(HEADER_ROWS):
+        ws.append(['header'] * SHEET_COLUMNS)
+    for item in data:
+        row = [None] * SHEET_COLUMNS
+        row[1] = item['product_code']
+        row[2] = item['product_name']
+        row[3] = item['company']
+        row[4] = item['weight_per_piece']
+        row[5] = item['QtyPerBox']
+        row[6] = item['weight_per_piece']
+        row[7] = item['BoxPerPallet']
+        row[10] = item['weight_per_pallet']
+        row[11] = item['quantity']
+        row[12] = item['total_pcs']
+        row[48] = '1.1x1.1x1.0'
+        ws.append(row)
+    wb.save(path)
+    return path, SHEET_NAME
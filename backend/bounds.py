@@ -0,0 +1,75 @@
+# backend/bounds.py
+"""
+Cận dưới (lower bound) rẻ cho số container của một bộ pallet, dùng để đánh giá kết quả
+tối ưu hóa cách tối ưu bao xa (gap) mà không cần giải bài toán tối ưu.
+
+Mọi cận đều đúng với MỌI cách xếp hợp lệ (kể cả tách pallet, gộp pallet lẻ và xếp chéo):
+- quantity : ceil(tổng qty / MAX_PALLETS);
+- weight   : ceil(tổng trọng lượng / MAX_WEIGHT);
+- lines    : mỗi container có tối đa MAX_PALLETS dòng (pallet logic), mỗi dòng chứa tối đa
+             1.0 qty. Phần nguyên của mỗi pallet chiếm ít nhất floor(qty) dòng, các phần lẻ
+             (dù được gộp/tách thế nào) chiếm ít nhất ceil(tổng phần lẻ) dòng.
+- global   : max của ba cận trên.
+
+per_company là cận khi KHÔNG xếp chéo: tổng theo từng công ty của
+max(ceil(qty / MAX_PALLETS), ceil(trọng lượng / MAX_WEIGHT)) (cùng cách tính "cần tối thiểu
+N container" của BƯỚC 6.5). Đây chỉ là mốc tham khảo: xếp chéo có thể dùng ít container hơn.
+"""
+import math
+from collections import defaultdict
+
+from data_processor import EPSILON, MAX_PALLETS, MAX_WEIGHT
+
+
+def _ceil(value):
+    # Bỏ qua sai số dấu phẩy động: 40.0000001 pallet vẫn là 2 container, không phải 3
+    return math.ceil(value - EPSILON) if value > EPSILON else 0
+
+
+def container_lower_bounds(pallets):
+    """
+    Các cận dưới của số container cho danh sách pallet (đối tượng có quantity, total_weight, company).
+    Trả về dict: quantity, weight, lines, global, per_company, companies
+    (companies: {company: {'quantity', 'weight', 'containers'}}).
+    """
+    total_qty = 0.0
+    total_weight = 0.0
+    integer_lines = 0
+    fractional_qty = 0.0
+    companies = defaultdict(lambda: {'quantity': 0.0, 'weight': 0.0})
+
+    for pallet in pallets:
+        quantity = pallet.quantity
+        total_qty += quantity
+        total_weight += pallet.total_weight
+        whole = math.floor(quantity + EPSILON)
+        integer_lines += whole
+        if quantity - whole > EPSILON:
+            fractional_qty += quantity - whole
+        company = companies[str(pallet.company)]
+        company['quantity'] += quantity
+        company['weight'] += pallet.total_weight
+
+    quantity_bound = _ceil(total_qty / MAX_PALLETS)
+    weight_bound = _ceil(total_weight / MAX_WEIGHT)
+    lines_bound = _ceil((integer_lines + _ceil(fractional_qty)) / MAX_PALLETS)
+
+    per_company = 0
+    for company in companies.values():
+        company['containers'] = max(_ceil(company['quantity'] / MAX_PALLETS), _ceil(company['weight'] / MAX_WEIGHT))
+        per_company += company['containers']
+
+    return {
+        'quantity': quantity_bound,
+        'weight': weight_bound,
+        'lines': lines_bound,
+        'global': max(quantity_bound, weight_bound, lines_bound),
+        'per_company': per_company,
+        'companies': dict(companies),
+    }
+
+
+def optimality_gap(containers_used, lower_bound):
+    """(số container thừa so với cận dưới, tỉ lệ gap). Tỉ lệ là None khi cận bằng 0."""
+    gap = containers_used - lower_bound
+    return gap, (gap / lower_bound if lower_bound else None)
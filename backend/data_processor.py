@@ -1,12 +1,19 @@
 import pandas as pd
 import math
+import os
+import logging
 import warnings # Import the warnings library
 import re
+import bisect
+import numpy as np
 from collections import defaultdict
 import copy
 
 from collections import Counter
 
+from workbook_cache import read_sheet
+from instrumentation import current_stats
+
 # --- HIDE HARMLESS WARNINGS FROM openpyxl ---
 from openpyxl.utils.exceptions import InvalidFileException
 warnings.filterwarnings("ignore", category=UserWarning, module='openpyxl')
@@ -14,46 +21,141 @@ warnings.filterwarnings("ignore", category=UserWarning, module='openpyxl')
 MAX_WEIGHT = 24000.0
 MAX_PALLETS = 20.0
 EPSILON = 1e-6 # Ngưỡng để xử lý sai số dấu phẩy động
+# Bật lên khi debug: sau mỗi lần thêm/xóa pallet, đối chiếu tổng cộng dồn của container
+# với kết quả tính lại toàn bộ để phát hiện sai lệch.
+DEBUG_CONTAINER_TOTALS = False
+# Biểu diễn số nguyên (fixed-point) cho các phép kiểm tra sức chứa: số lượng tính theo phần nghìn
+# pallet, trọng lượng tính theo gam. Pallet và container luôn giữ sẵn các giá trị/tổng số nguyên này;
+# bật FIXED_POINT_CAPACITY=1 để can_fit, calculate_max_fit và việc phân loại pallet nguyên/lẻ so sánh
+# số nguyên chính xác thay cho so sánh số thực với EPSILON (số lượng được làm tròn tới 0.001 pallet).
+FIXED_POINT_CAPACITY = os.environ.get('FIXED_POINT_CAPACITY', '0') == '1'
+QUANTITY_SCALE = 1000
+WEIGHT_SCALE = 1000
+MAX_QUANTITY_UNITS = int(MAX_PALLETS) * QUANTITY_SCALE
+MAX_WEIGHT_UNITS = int(MAX_WEIGHT) * WEIGHT_SCALE
+
+
+def to_quantity_units(quantity):
+    """Số lượng (pallet) -> số nguyên phần nghìn pallet."""
+    return int(round(quantity * QUANTITY_SCALE))
+
+
+def to_weight_units(weight):
+    """Trọng lượng (kg) -> số nguyên gam."""
+    return int(round(weight * WEIGHT_SCALE))
+
+
+# --- LOGGING ---
+# Mỗi giai đoạn có logger riêng (con của 'packing'), bật/tắt độc lập qua logging_config.
+# Chi tiết từng pallet ở mức DEBUG, tiêu đề các bước ở mức INFO; mặc định chỉ in WARNING trở lên.
+log_loader = logging.getLogger('packing.loader')
+log_oversized = logging.getLogger('packing.oversized')
+log_integer = logging.getLogger('packing.integer')
+log_combine = logging.getLogger('packing.combine')
+log_fractional = logging.getLogger('packing.fractional')
+log_unplaced = logging.getLogger('packing.unplaced')
+log_waste = logging.getLogger('packing.waste')
+log_cross_ship = logging.getLogger('packing.cross_ship')
 # --- CÁC LỚP ĐỐI TƯỢỢNG (Mô hình hóa dữ liệu) ---
 # Giữ nguyên như file gốc
 class Pallet:
     """Đại diện cho một pallet hoặc một phần của pallet."""
+    # Dùng __slots__ thay cho __dict__ riêng của từng đối tượng: đơn hàng lớn sau khi
+    # tách có thể sinh ra hàng chục nghìn mảnh pallet.
+    __slots__ = (
+        'id', 'product_code', 'product_name', 'company', '_quantity', 'weight_per_pallet',
+        'box_per_pallet', '_total_weight', 'is_combined', '_original_pallets', 'is_split',
+        'is_cross_ship', 'split_from_id', 'sibling_id',
+        # Các giá trị suy ra từ quantity, được tính lại mỗi khi gán quantity (set_quantity)
+        'whole_pallets', 'fractional_part', 'is_integer', 'logical_pallet_count', 'quantity_units',
+        # Trọng lượng theo gam, được tính lại mỗi khi gán total_weight (set_total_weight)
+        'weight_units',
+    )
+
     def __init__(self, p_id, product_code, product_name, company, quantity, weight_per_pallet, box_per_pallet):
         self.id = p_id
         self.product_code = product_code
         self.product_name = product_name
         self.company = str(company)
-        self.quantity = float(quantity)
+        self.set_quantity(float(quantity))
         self.weight_per_pallet = float(weight_per_pallet)
         self.box_per_pallet = box_per_pallet
-        self.total_weight = self.quantity * self.weight_per_pallet
+        self.set_total_weight(self.quantity * self.weight_per_pallet)
 
         self.is_combined = False
-        self.original_pallets = [self]
+        self._original_pallets = None
         self.is_split = False
         self.is_cross_ship = False
         self.split_from_id = None
         self.sibling_id = None
 
     @property
-    def logical_pallet_count(self):
+    def original_pallets(self):
         """
-        Tính toán số 'pallet logic' (số dòng) sẽ chiếm trong Packing List.
-        Ví dụ: 4.9 qty -> 4 pallet nguyên + 1 pallet lẻ = 5 dòng.
-              4.0 qty -> 4 pallet nguyên = 4 dòng.
-              0.9 qty -> 1 pallet lẻ = 1 dòng.
+        Danh sách pallet thành phần. Pallet đơn chỉ gồm chính nó; danh sách [self]
+        chỉ được tạo khi thực sự được truy cập (tránh một list + tham chiếu vòng cho mỗi pallet).
         """
-        if self.quantity < EPSILON:
-            return 0
+        if self._original_pallets is None:
+            self._original_pallets = [self]
+        return self._original_pallets
 
-        integer_part = math.floor(self.quantity)
-        fractional_part = self.quantity - integer_part
+    @original_pallets.setter
+    def original_pallets(self, pallets):
+        self._original_pallets = pallets
 
-        count = integer_part
-        if fractional_part > EPSILON:
-            count += 1
+    @property
+    def quantity(self):
+        return self._quantity
 
-        return int(count)
+    @quantity.setter
+    def quantity(self, quantity):
+        # Gán trực tiếp cũng đi qua set_quantity(): các giá trị suy ra không thể lệch với quantity
+        self.set_quantity(quantity)
+
+    @property
+    def total_weight(self):
+        return self._total_weight
+
+    @total_weight.setter
+    def total_weight(self, total_weight):
+        self.set_total_weight(total_weight)
+
+    def set_quantity(self, quantity):
+        """
+        Gán số lượng và tính lại các giá trị suy ra từ nó. Các giá trị này được đọc rất nhiều lần
+        (can_fit, _recalculate_totals, các phép hoán đổi...) nên được lưu sẵn thay vì tính lại mỗi lần đọc:
+        - whole_pallets      : phần nguyên (floor);
+        - fractional_part    : phần lẻ;
+        - is_integer         : không có phần lẻ (sai số <= EPSILON);
+        - logical_pallet_count: số 'pallet logic' (số dòng) sẽ chiếm trong Packing List.
+          Ví dụ: 4.9 qty -> 4 pallet nguyên + 1 pallet lẻ = 5 dòng.
+                4.0 qty -> 4 pallet nguyên = 4 dòng.
+                0.9 qty -> 1 pallet lẻ = 1 dòng.
+        - quantity_units     : số lượng theo phần nghìn pallet (xem FIXED_POINT_CAPACITY).
+        """
+        self._quantity = quantity
+        units = to_quantity_units(quantity)
+        self.quantity_units = units
+        if FIXED_POINT_CAPACITY:
+            whole, fraction_units = divmod(units, QUANTITY_SCALE)
+            fractional = fraction_units / QUANTITY_SCALE
+            has_fraction = fraction_units != 0
+        else:
+            whole = math.floor(quantity)
+            fractional = quantity - whole
+            has_fraction = fractional > EPSILON
+        self.whole_pallets = whole
+        self.fractional_part = fractional
+        self.is_integer = not has_fraction
+        if (units <= 0) if FIXED_POINT_CAPACITY else (quantity < EPSILON):
+            self.logical_pallet_count = 0
+        else:
+            self.logical_pallet_count = int(whole + 1 if has_fraction else whole)
+
+    def set_total_weight(self, total_weight):
+        """Gán tổng trọng lượng (kg) và giá trị tương ứng theo gam."""
+        self._total_weight = total_weight
+        self.weight_units = to_weight_units(total_weight)
 
     def __repr__(self):
         type_info = ""
@@ -84,8 +186,8 @@ class Pallet:
         if not self.is_combined or not self.original_pallets:
             return
 
-        self.quantity = sum(p.quantity for p in self.original_pallets)
-        self.total_weight = sum(p.total_weight for p in self.original_pallets)
+        self.set_quantity(sum(p.quantity for p in self.original_pallets))
+        self.set_total_weight(sum(p.total_weight for p in self.original_pallets))
         if self.quantity > EPSILON:
             self.weight_per_pallet = self.total_weight / self.quantity
         else:
@@ -102,6 +204,10 @@ class Pallet:
         Tách pallet hiện tại thành hai phần một cách chính xác, đặc biệt đối với pallet gộp.
         Phiên bản này đảm bảo tổng các pallet con LUÔN LUÔN khớp với số lượng của phần pallet cha.
         """
+        stats = current_stats()
+        if stats is not None:
+            stats.split_calls += 1
+
         # --- BƯỚC 1: KIỂM TRA ĐIỀU KIỆN ĐẦU VÀO ---
         if not (EPSILON < split_quantity < self.quantity - EPSILON):
             return None, None
@@ -131,10 +237,7 @@ class Pallet:
         rem_part.sibling_id = new_part.id
 
         # --- BƯỚC 3: PHÂN BỔ DANH SÁCH PALLET CON ---
-        if not self.is_combined:
-            new_part.original_pallets = [new_part]
-            rem_part.original_pallets = [rem_part]
-        else:
+        if self.is_combined:
             new_part_originals_list = []
             rem_part_originals_list = []
             quantity_needed_for_new_part = split_quantity
@@ -205,33 +308,295 @@ class Pallet:
             rem_part.original_pallets = rem_part_originals_list
 
         # --- BƯỚC 4: TÍNH TOÁN LẠI ĐỂ ĐẢM BẢO TÍNH TOÀN VẸN (Vẫn giữ) ---
-        new_part.quantity = sum(p.quantity for p in new_part.original_pallets)
-        new_part.total_weight = sum(p.total_weight for p in new_part.original_pallets)
-        if new_part.quantity > EPSILON:
-            new_part.weight_per_pallet = new_part.total_weight / new_part.quantity
-
-        rem_part.quantity = sum(p.quantity for p in rem_part.original_pallets)
-        rem_part.total_weight = sum(p.total_weight for p in rem_part.original_pallets)
-        if rem_part.quantity > EPSILON:
-            rem_part.weight_per_pallet = rem_part.total_weight / rem_part.quantity
+        # Pallet đơn chỉ gồm chính nó nên tổng đã đúng, không cần tạo danh sách thành phần.
+        for part in (new_part, rem_part):
+            if self.is_combined:
+                part.set_quantity(sum(p.quantity for p in part.original_pallets))
+                part.set_total_weight(sum(p.total_weight for p in part.original_pallets))
+            if part.quantity > EPSILON:
+                part.weight_per_pallet = part.total_weight / part.quantity
 
         return rem_part, new_part
+class PalletIndex:
+    """
+    Danh sách pallet có chỉ mục theo id (giữ nguyên thứ tự thêm vào).
+    Thêm, xóa, kiểm tra `in` và tra cứu theo id đều là O(1), thay cho việc
+    lọc lại toàn bộ list bằng list comprehension. Duyệt, len(), bool() dùng như list.
+    """
+    __slots__ = ('_by_id',)
+
+    def __init__(self, pallets=()):
+        self._by_id = {}
+        for p in pallets:
+            self.append(p)
+
+    @staticmethod
+    def _key(item):
+        return item.id if isinstance(item, Pallet) else item
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, item):
+        return self._key(item) in self._by_id
+
+    def __repr__(self):
+        return f"PalletIndex({list(self._by_id.values())!r})"
+
+    def get(self, pallet_id, default=None):
+        return self._by_id.get(pallet_id, default)
+
+    def append(self, pallet):
+        existing = self._by_id.get(pallet.id)
+        if existing is not None and existing is not pallet:
+            raise ValueError(f"Trùng id pallet '{pallet.id}' trong cùng một danh sách.")
+        self._by_id[pallet.id] = pallet
+
+    def extend(self, pallets):
+        for p in pallets:
+            self.append(p)
+
+    def pop(self, item, default=None):
+        """Lấy ra (và xóa) pallet theo id hoặc theo đối tượng pallet."""
+        return self._by_id.pop(self._key(item), default)
+
+    def remove(self, item):
+        if self._by_id.pop(self._key(item), None) is None:
+            raise ValueError(f"Pallet '{self._key(item)}' không có trong danh sách.")
+
+    def pop_first(self):
+        """Lấy ra pallet được thêm vào sớm nhất."""
+        first_id = next(iter(self._by_id))
+        return self._by_id.pop(first_id)
+
+    def copy(self):
+        """Bản sao nông (cùng các đối tượng pallet, giữ thứ tự)."""
+        new = PalletIndex()
+        new._by_id = dict(self._by_id)
+        return new
+
+    def clear(self):
+        self._by_id.clear()
+
+
+class QuantitySortedIndex:
+    """
+    Pallet sắp xếp theo số lượng (danh sách khóa + bisect), cho truy vấn "pallet lớn nhất có
+    qty <= x" trong O(log n) thay cho việc sắp xếp lại và duyệt toàn bộ ứng viên mỗi lần.
+    Hòa số lượng thì pallet được thêm vào trước đứng trước (giống sorted(..., reverse=True) ổn định).
+    Xóa: tìm vị trí bằng bisect rồi xóa khỏi list (chỉ dịch chuyển bộ nhớ, không so sánh lại).
+    Pallet được nhận diện theo đối tượng (không theo id) nên danh sách trùng id vẫn dùng được.
+    """
+    __slots__ = ('_keys', '_pallets', '_key_of', '_next_seq')
+
+    def __init__(self, pallets=()):
+        self._keys = []       # (quantity, -thứ tự thêm vào), tăng dần
+        self._pallets = []    # song song với _keys
+        self._key_of = {}     # id(pallet) -> khóa
+        self._next_seq = 0
+        for p in pallets:
+            self.add(p)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, pallet):
+        return id(pallet) in self._key_of
+
+    def add(self, pallet):
+        if id(pallet) in self._key_of:
+            return
+        key = (pallet.quantity, -self._next_seq)
+        self._next_seq += 1
+        i = bisect.bisect_left(self._keys, key)
+        self._keys.insert(i, key)
+        self._pallets.insert(i, pallet)
+        self._key_of[id(pallet)] = key
+
+    def remove(self, pallet):
+        key = self._key_of.pop(id(pallet), None)
+        if key is None:
+            return False
+        i = bisect.bisect_left(self._keys, key)
+        del self._keys[i]
+        del self._pallets[i]
+        return True
+
+    def descending(self, max_quantity=math.inf):
+        """Các pallet có qty <= max_quantity, từ lớn đến nhỏ. Không thêm/xóa trong lúc duyệt."""
+        i = bisect.bisect_right(self._keys, (max_quantity, math.inf))
+        pallets = self._pallets
+        for j in range(i - 1, -1, -1):
+            yield pallets[j]
+
+    def pop_largest(self):
+        """Lấy ra pallet lớn nhất (hòa thì pallet được thêm vào trước)."""
+        self._keys.pop()
+        pallet = self._pallets.pop()
+        del self._key_of[id(pallet)]
+        return pallet
+
+
+class _RunningSum:
+    """
+    Tổng cộng dồn CHÍNH XÁC cho số thực (thuật toán partials của Shewchuk, giống math.fsum).
+    Cộng/trừ một giá trị là O(1) (danh sách partials luôn rất ngắn) và không bị trôi sai số
+    dù có hàng nghìn lần thêm/bớt: trừ đúng giá trị đã cộng sẽ triệt tiêu hoàn toàn.
+    """
+    __slots__ = ('_partials', 'value')
+
+    def __init__(self, values=()):
+        self._partials = []
+        self.value = 0.0
+        for v in values:
+            self._add_partial(float(v))
+        self.value = math.fsum(self._partials)
+
+    def _add_partial(self, x):
+        partials = self._partials
+        i = 0
+        for y in partials:
+            if abs(x) < abs(y):
+                x, y = y, x
+            hi = x + y
+            lo = y - (hi - x)
+            if lo:
+                partials[i] = lo
+                i += 1
+            x = hi
+        partials[i:] = [x] if x else []
+
+    def add(self, x):
+        self._add_partial(float(x))
+        self.value = math.fsum(self._partials)
+
+    def sub(self, x):
+        self.add(-x)
+
+    def copy(self):
+        new = _RunningSum()
+        new._partials = list(self._partials)
+        new.value = self.value
+        return new
+
+
 class Container:
     """Đại diện cho một container."""
     def __init__(self, container_id, main_company):
         self.id = container_id
         self.main_company = str(main_company)
-        self.pallets = []
-        self.total_quantity = 0.0
-        self.total_weight = 0.0
+        # CapacityAggregates đang theo dõi container này (không sao chép khi deepcopy/pickle)
+        self._capacity_observers = []
+        # ContainerTransaction đang ghi nhật ký hoàn tác cho container này (nếu có)
+        self._transaction = None
+        # Pallet được lưu theo id (giữ thứ tự thêm vào) để xóa/tra cứu O(1)
+        self._pallet_index = PalletIndex()
+        # Tổng số lượng/trọng lượng được cộng dồn chính xác, cập nhật O(1) khi thêm/xóa pallet
+        self._quantity_sum = _RunningSum()
+        self._weight_sum = _RunningSum()
+        # Các tổng theo số nguyên (phần nghìn pallet, gam), xem FIXED_POINT_CAPACITY
+        self.total_quantity_units = 0
+        self.total_weight_units = 0
         # MỚI: Theo dõi tổng số pallet logic để không vượt quá 20 dòng trong PKL
         self.total_logical_pallets = 0
+        stats = current_stats()
+        if stats is not None:
+            stats.containers_created += 1
+
+    def __getstate__(self):
+        # Bản sao mô phỏng (deepcopy) và bản pickle không báo thay đổi cho các tổng hợp của bản gốc
+        state = self.__dict__.copy()
+        state['_capacity_observers'] = []
+        state['_transaction'] = None
+        return state
+
+    def _touch(self):
+        """Gọi TRƯỚC mọi thay đổi trạng thái: giao dịch đang mở lưu lại trạng thái cũ (lần đầu)."""
+        if self._transaction is not None:
+            self._transaction.touch(self)
+
+    def _notify_capacity(self):
+        for observer in self._capacity_observers:
+            observer.update(self)
+
+    @property
+    def pallets(self):
+        """Danh sách (bản sao) các pallet trong container, theo thứ tự được thêm vào."""
+        return list(self._pallet_index)
+
+    @pallets.setter
+    def pallets(self, pallets):
+        self._touch()
+        self._pallet_index = PalletIndex(pallets)
+        self._recalculate_totals()
+
+    @property
+    def pallet_count(self):
+        return len(self._pallet_index)
+
+    def has_pallet(self, pallet_or_id):
+        return pallet_or_id in self._pallet_index
+
+    def get_pallet(self, pallet_id):
+        return self._pallet_index.get(pallet_id)
+
+    @property
+    def total_quantity(self):
+        return self._quantity_sum.value
+
+    @total_quantity.setter
+    def total_quantity(self, value):
+        # Các hàm mô phỏng gán trực tiếp tổng số lượng trên bản sao container
+        self._touch()
+        self._quantity_sum = _RunningSum((value,))
+        self.total_quantity_units = to_quantity_units(value)
+        self._notify_capacity()
+
+    @property
+    def total_weight(self):
+        return self._weight_sum.value
+
+    @total_weight.setter
+    def total_weight(self, value):
+        self._touch()
+        self._weight_sum = _RunningSum((value,))
+        self.total_weight_units = to_weight_units(value)
+        self._notify_capacity()
 
     def _recalculate_totals(self):
-        """Tính toán lại tất cả các tổng số từ danh sách pallet hiện có."""
-        self.total_quantity = sum(p.quantity for p in self.pallets)
-        self.total_weight = sum(p.total_weight for p in self.pallets)
-        self.total_logical_pallets = sum(p.logical_pallet_count for p in self.pallets)
+        """
+        Tính toán lại tất cả các tổng số từ danh sách pallet hiện có.
+        Chỉ cần gọi khi pallet BÊN TRONG container bị thay đổi trực tiếp (ví dụ lắp ghép thêm mảnh con);
+        add_pallet/remove_pallet đã tự cập nhật tổng số.
+        """
+        self._touch()
+        pallets = self._pallet_index
+        self._quantity_sum = _RunningSum(p.quantity for p in pallets)
+        self._weight_sum = _RunningSum(p.total_weight for p in pallets)
+        self.total_quantity_units = sum(p.quantity_units for p in pallets)
+        self.total_weight_units = sum(p.weight_units for p in pallets)
+        self.total_logical_pallets = sum(p.logical_pallet_count for p in pallets)
+        self._notify_capacity()
+
+    def _check_totals(self):
+        """Chế độ debug: đối chiếu tổng cộng dồn với kết quả tính lại toàn bộ."""
+        pallets = self._pallet_index
+        expected_qty = math.fsum(p.quantity for p in pallets)
+        expected_wgt = math.fsum(p.total_weight for p in pallets)
+        expected_lines = sum(p.logical_pallet_count for p in pallets)
+        expected_units = (sum(p.quantity_units for p in pallets), sum(p.weight_units for p in pallets))
+        if (self.total_quantity != expected_qty or self.total_weight != expected_wgt
+                or self.total_logical_pallets != expected_lines
+                or (self.total_quantity_units, self.total_weight_units) != expected_units):
+            raise AssertionError(
+                f"Container {self.id}: tổng cộng dồn lệch so với tính lại "
+                f"(qty {self.total_quantity} != {expected_qty}, wgt {self.total_weight} != {expected_wgt}, "
+                f"dòng {self.total_logical_pallets} != {expected_lines}, "
+                f"units {(self.total_quantity_units, self.total_weight_units)} != {expected_units})"
+            )
 
     def can_fit(self, pallet):
         """
@@ -240,10 +605,19 @@ class Container:
         2. Số lượng (quantity/volume)
         3. Số pallet logic (để đảm bảo <= 20 dòng trong PKL)
         """
+        stats = current_stats()
+        if stats is not None:
+            stats.can_fit_calls += 1
+
         # Điều kiện 1: Kiểm tra số pallet logic (số dòng trên Packing List)
         if self.total_logical_pallets + pallet.logical_pallet_count > MAX_PALLETS:
             return False
 
+        if FIXED_POINT_CAPACITY:
+            # Điều kiện 2 và 3 bằng số nguyên, không cần sai số
+            return (self.total_quantity_units + pallet.quantity_units <= MAX_QUANTITY_UNITS
+                    and self.total_weight_units + pallet.weight_units <= MAX_WEIGHT_UNITS)
+
         # Điều kiện 2: Kiểm tra số lượng pallet vật lý (tương đương thể tích)
         if self.total_quantity + pallet.quantity > MAX_PALLETS + EPSILON:
             return False
@@ -256,18 +630,48 @@ class Container:
         return True
 
     def add_pallet(self, pallet):
-        """Thêm pallet vào container và cập nhật lại các tổng số."""
+        """Thêm pallet vào container và cộng dồn các tổng số (O(1))."""
+        stats = current_stats()
+        if stats is not None:
+            stats.add_pallet_calls += 1
+        transaction = self._transaction
+        if transaction is not None:
+            transaction.touch(self)
         if str(pallet.company) != self.main_company:
+            if transaction is not None:
+                transaction.record(pallet, 'is_cross_ship')
             pallet.is_cross_ship = True
-        self.pallets.append(pallet)
-        # Tính toán lại thay vì cộng dồn để đảm bảo chính xác sau các thao tác phức tạp
-        self._recalculate_totals()
+        self._pallet_index.append(pallet)
+        self._quantity_sum.add(pallet.quantity)
+        self._weight_sum.add(pallet.total_weight)
+        self.total_quantity_units += pallet.quantity_units
+        self.total_weight_units += pallet.weight_units
+        self.total_logical_pallets += pallet.logical_pallet_count
+        if self._capacity_observers:
+            self._notify_capacity()
+        if DEBUG_CONTAINER_TOTALS:
+            self._check_totals()
 
     def remove_pallet(self, pallet_to_remove):
-        """Xóa một pallet khỏi container và cập nhật lại tổng số."""
-        self.pallets = [p for p in self.pallets if p.id != pallet_to_remove.id]
-        self._recalculate_totals()
-        
+        """Xóa một pallet khỏi container (tra theo id, O(1)) và trừ các tổng số tương ứng."""
+        self._touch()
+        p = self._pallet_index.pop(pallet_to_remove.id)
+        if p is not None:
+            self._quantity_sum.sub(p.quantity)
+            self._weight_sum.sub(p.total_weight)
+            self.total_quantity_units -= p.quantity_units
+            self.total_weight_units -= p.weight_units
+            self.total_logical_pallets -= p.logical_pallet_count
+            if self._capacity_observers:
+                self._notify_capacity()
+        if DEBUG_CONTAINER_TOTALS:
+            self._check_totals()
+
+    def swap_pallet(self, pallet_out, pallet_in):
+        """Hoán đổi: lấy pallet_out ra và đưa pallet_in vào, tổng số cập nhật O(1)."""
+        self.remove_pallet(pallet_out)
+        self.add_pallet(pallet_in)
+
 
     @property
     def remaining_logical_pallets(self):
@@ -290,12 +694,503 @@ class Container:
     def remaining_logical_pallets(self):
         # Số "dòng" còn trống trong Packing List
         return MAX_PALLETS - self.total_logical_pallets
+
+
+class ContainerIndex:
+    """
+    Chỉ mục container sắp xếp theo số lượng còn trống (tăng dần), chia theo công ty chính.
+    Thay cho việc sắp xếp lại toàn bộ danh sách container mỗi lần xếp một pallet (best-fit):
+    - best_fit() tìm bằng bisect vị trí đầu tiên còn đủ chỗ về số lượng (O(log n)), rồi mới
+      gọi can_fit() (kiểm tra cả trọng lượng và số dòng) từ đó trở đi;
+    - update() đặt lại vị trí của một container sau khi thêm/bớt pallet (O(log n) tìm kiếm).
+    Thứ tự khi bằng nhau theo thứ tự trong danh sách ban đầu, giống sorted(..., key=remaining_quantity),
+    nên container được chọn y hệt cách duyệt tuần tự cũ. Khi FIXED_POINT_CAPACITY bật, khóa là số
+    lượng còn trống theo phần nghìn pallet (cùng phép so sánh số nguyên với can_fit).
+    Giống CapacityAggregates, chỉ mục đăng ký theo dõi container qua _capacity_observers nên tự
+    update() sau mỗi add_pallet/remove_pallet/_recalculate_totals; thành viên do nơi gọi quản lý
+    (add()/remove()). Dùng xong phải close() (hoặc dùng `with`) để gỡ theo dõi.
+    """
+    __slots__ = ('_entries', '_by_company', '_keys', '_next_seq')
+
+    def __init__(self, containers=()):
+        self._entries = []       # [(còn trống, seq, container)] - mọi container, xem _remaining()
+        self._by_company = {}    # main_company -> [(còn trống, seq, container)]
+        self._keys = {}          # id(container) -> (còn trống, seq)
+        self._next_seq = 0
+        for c in containers:
+            self.add(c)
+
+    @staticmethod
+    def _remaining(container):
+        """Khóa sắp xếp: số lượng còn trống, theo phần nghìn pallet khi FIXED_POINT_CAPACITY bật."""
+        if FIXED_POINT_CAPACITY:
+            return MAX_QUANTITY_UNITS - container.total_quantity_units
+        return container.remaining_quantity
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, container):
+        return id(container) in self._keys
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, container):
+        if id(container) in self._keys:
+            raise ValueError(f"Container {container.id} đã có trong chỉ mục.")
+        key = (self._remaining(container), self._next_seq)
+        self._next_seq += 1
+        self._keys[id(container)] = key
+        entry = key + (container,)
+        bisect.insort(self._entries, entry)
+        bisect.insort(self._by_company.setdefault(container.main_company, []), entry)
+        container._capacity_observers.append(self)
+
+    def remove(self, container):
+        key = self._keys.pop(id(container))
+        for entries in (self._entries, self._by_company[container.main_company]):
+            del entries[bisect.bisect_left(entries, key)]
+        container._capacity_observers.remove(self)
+
+    def update(self, container):
+        """Container báo thay đổi: đặt lại vị trí theo số lượng còn trống (giữ thứ tự gốc khi bằng nhau)."""
+        key = self._keys.get(id(container))
+        if key is None:
+            return
+        remaining = self._remaining(container)
+        if key[0] == remaining:
+            return
+        new_key = (remaining, key[1])
+        self._keys[id(container)] = new_key
+        for entries in (self._entries, self._by_company[container.main_company]):
+            del entries[bisect.bisect_left(entries, key)]
+            bisect.insort(entries, new_key + (container,))
+
+    def candidates(self, min_remaining=None, company=None):
+        """
+        Duyệt container theo số lượng còn trống tăng dần (chỉ của `company` nếu có), từ min_remaining
+        trở lên (cùng đơn vị với khóa, xem _remaining()).
+        """
+        if company is None:
+            entries = self._entries
+        else:
+            entries = self._by_company.get(company, ())
+        start = 0 if min_remaining is None else bisect.bisect_left(entries, (min_remaining,))
+        for i in range(start, len(entries)):
+            yield entries[i][2]
+
+    def best_fit(self, pallet, company=None):
+        """Container còn ít chỗ nhất chứa được pallet (theo can_fit), hoặc None."""
+        if FIXED_POINT_CAPACITY:
+            # can_fit so sánh số nguyên: cần còn trống ít nhất pallet.quantity_units
+            min_remaining = pallet.quantity_units
+        else:
+            # Container còn thiếu hơn 2*EPSILON về số lượng chắc chắn không qua được can_fit
+            min_remaining = pallet.quantity - 2 * EPSILON
+        for container in self.candidates(min_remaining, company):
+            if container.can_fit(pallet):
+                return container
+        return None
+
+    def close(self):
+        """Gỡ theo dõi khỏi mọi container của chỉ mục."""
+        for entry in self._entries:
+            entry[2]._capacity_observers.remove(self)
+        self._entries = []
+        self._by_company = {}
+        self._keys = {}
+
+
+class ContainerTransaction:
+    """
+    Giao dịch trên trạng thái của một danh sách container (begin/commit/rollback), thay cho việc
+    deepcopy toàn bộ container để mô phỏng hoặc để sao lưu trước khi thử.
+
+    Nhật ký hoàn tác (undo log) ghi:
+    - trạng thái của một container ngay trước lần thay đổi ĐẦU TIÊN trong giao dịch (danh sách
+      tham chiếu pallet + các tổng số), do chính Container báo qua _touch();
+    - giá trị cũ của thuộc tính pallet bị đổi (is_cross_ship khi add_pallet, hoặc qua record()/set_attr());
+    - thứ tự của danh sách container (container được thêm/bớt khỏi list trong giao dịch).
+    Chi phí tỉ lệ với số container/thuộc tính bị thay đổi, không phải toàn bộ pallet. rollback() khôi
+    phục đúng các đối tượng cũ (không tạo bản sao), nên tham chiếu tới container/pallet vẫn hợp lệ.
+
+    Chỉ các thay đổi qua phương thức của Container (add_pallet, remove_pallet, _recalculate_totals,
+    gán pallets/total_quantity/total_weight) được ghi tự động; thay đổi trực tiếp trên pallet phải đi
+    qua record()/set_attr(). Một container chỉ thuộc một giao dịch đang mở tại một thời điểm.
+    """
+    __slots__ = ('_containers', '_container_order', '_undo', '_snapshotted', '_active')
+
+    def __init__(self, containers):
+        self._containers = containers
+        self._container_order = None
+        self._undo = []
+        self._snapshotted = set()
+        self._active = False
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._active:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+
+    @property
+    def active(self):
+        return self._active
+
+    def begin(self):
+        if self._active:
+            raise RuntimeError("Giao dịch đã được mở.")
+        for c in self._containers:
+            if c._transaction is not None and c._transaction is not self:
+                raise RuntimeError(f"Container {c.id} đang thuộc một giao dịch khác.")
+        for c in self._containers:
+            c._transaction = self
+        self._container_order = list(self._containers)
+        self._active = True
+        return self
+
+    def touch(self, container):
+        """Lưu trạng thái container trước lần thay đổi đầu tiên trong giao dịch."""
+        if id(container) in self._snapshotted:
+            return
+        self._snapshotted.add(id(container))
+        self._undo.append((container, None, (
+            container._pallet_index.copy(), container._quantity_sum.copy(),
+            container._weight_sum.copy(), container.total_logical_pallets,
+            container.total_quantity_units, container.total_weight_units,
+        )))
+
+    def record(self, obj, attr):
+        """Ghi lại giá trị hiện tại của obj.attr trước khi nơi gọi thay đổi nó."""
+        self._undo.append((obj, attr, getattr(obj, attr)))
+
+    def set_attr(self, obj, attr, value):
+        self.record(obj, attr)
+        setattr(obj, attr, value)
+
+    def _finish(self):
+        for c in self._container_order:
+            if c._transaction is self:
+                c._transaction = None
+        self._undo.clear()
+        self._snapshotted.clear()
+        self._container_order = None
+        self._active = False
+
+    def commit(self):
+        """Giữ mọi thay đổi, bỏ nhật ký."""
+        self._finish()
+
+    def rollback(self):
+        """Hoàn tác mọi thay đổi theo thứ tự ngược lại."""
+        restored = []
+        for obj, attr, old in reversed(self._undo):
+            if attr is not None:
+                setattr(obj, attr, old)
+                continue
+            (obj._pallet_index, obj._quantity_sum, obj._weight_sum, obj.total_logical_pallets,
+             obj.total_quantity_units, obj.total_weight_units) = old
+            restored.append(obj)
+        self._containers[:] = self._container_order
+        self._finish()
+        for container in restored:
+            container._notify_capacity()
+
+
+class CapacityAggregates:
+    """
+    Tổng sức chứa CÒN TRỐNG (số lượng, trọng lượng, số dòng) của một nhóm container,
+    theo từng công ty chính và toàn cục, thay cho việc cộng lại trên mọi container mỗi lần kiểm tra.
+
+    Container báo cho các tổng hợp đang theo dõi nó sau mỗi add_pallet/remove_pallet/
+    _recalculate_totals (và khi gán trực tiếp total_quantity/total_weight), nên mỗi thay đổi chỉ
+    tốn O(1); tổng số lượng/trọng lượng dùng _RunningSum nên không bị trôi sai số.
+    Thành viên của nhóm do nơi gọi quản lý: container mới được add() ngay khi được tạo/thêm vào danh
+    sách, container bị bỏ thì remove(); check_members(containers) đối chiếu lại (chế độ debug).
+    Dùng xong phải close() (hoặc dùng `with`) để gỡ theo dõi.
+    """
+    __slots__ = ('_members', '_by_company', '_total', '_track_changes')
+
+    def __init__(self, containers=(), track_changes=True):
+        self._members = {}       # id(container) -> (container, (qty, wgt, dòng) còn trống đã cộng)
+        self._by_company = {}    # main_company -> {'containers': {id: container}, 'qty', 'weight', 'lines'}
+        self._total = self._new_bucket()
+        # track_changes=False: chỉ nhóm container theo công ty, không theo dõi thay đổi sức chứa
+        self._track_changes = track_changes
+        for c in containers:
+            self.add(c)
+
+    @staticmethod
+    def _new_bucket():
+        return {'containers': {}, 'qty': _RunningSum(), 'weight': _RunningSum(), 'lines': 0.0}
+
+    @staticmethod
+    def _free_of(container):
+        return container.remaining_quantity, container.remaining_weight, container.remaining_logical_pallets
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, container):
+        return id(container) in self._members
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _apply(self, container, free, sign):
+        qty, wgt, lines = free
+        for bucket in (self._total, self._by_company[container.main_company]):
+            bucket['qty'].add(sign * qty)
+            bucket['weight'].add(sign * wgt)
+            bucket['lines'] += sign * lines
+
+    def add(self, container):
+        if id(container) in self._members:
+            return
+        free = self._free_of(container)
+        self._members[id(container)] = (container, free)
+        bucket = self._by_company.get(container.main_company)
+        if bucket is None:
+            bucket = self._by_company[container.main_company] = self._new_bucket()
+        bucket['containers'][id(container)] = container
+        self._total['containers'][id(container)] = container
+        self._apply(container, free, 1)
+        if self._track_changes:
+            container._capacity_observers.append(self)
+
+    def remove(self, container):
+        member = self._members.pop(id(container), None)
+        if member is None:
+            return
+        self._apply(container, member[1], -1)
+        del self._by_company[container.main_company]['containers'][id(container)]
+        del self._total['containers'][id(container)]
+        if self._track_changes:
+            container._capacity_observers.remove(self)
+
+    def update(self, container):
+        """Container báo thay đổi: thay phần đóng góp cũ bằng sức chứa còn trống hiện tại (O(1))."""
+        member = self._members.get(id(container))
+        if member is None:
+            return
+        free = self._free_of(container)
+        if free != member[1]:
+            self._apply(container, member[1], -1)
+            self._apply(container, free, 1)
+            self._members[id(container)] = (container, free)
+
+    def check_members(self, containers):
+        """Chế độ debug (DEBUG_CONTAINER_TOTALS): thành viên phải đúng là các container trong danh sách."""
+        if {id(c) for c in containers} != set(self._members):
+            raise AssertionError(
+                f"CapacityAggregates lệch với danh sách container ({len(self._members)} thành viên, "
+                f"{len(containers)} container)"
+            )
+
+    def close(self):
+        """Gỡ theo dõi khỏi mọi container (các container không còn phải báo thay đổi)."""
+        if self._track_changes:
+            for container, _ in self._members.values():
+                container._capacity_observers.remove(self)
+        self._members.clear()
+        self._by_company.clear()
+        self._total = self._new_bucket()
+
+    def containers_of(self, company):
+        """Các container có công ty chính là `company`, theo thứ tự được thêm vào."""
+        bucket = self._by_company.get(company)
+        return list(bucket['containers'].values()) if bucket else []
+
+    def free(self, company=None):
+        """(qty, trọng lượng, số dòng) còn trống của một công ty, hoặc của toàn bộ nếu company=None."""
+        bucket = self._total if company is None else self._by_company.get(company)
+        if bucket is None:
+            return 0.0, 0.0, 0.0
+        return bucket['qty'].value, bucket['weight'].value, bucket['lines']
+
+    def free_excluding(self, companies):
+        """Sức chứa còn trống của các container có công ty chính KHÔNG thuộc `companies` (O(số công ty))."""
+        buckets = [b for company, b in self._by_company.items() if company not in companies]
+        return (math.fsum(b['qty'].value for b in buckets),
+                math.fsum(b['weight'].value for b in buckets),
+                sum(b['lines'] for b in buckets))
+
+class ContainerFitKernel:
+    """
+    Tổng của một danh sách container dưới dạng mảng NumPy, để trả lời "container nào nhận được
+    pallet này (và nhận được bao nhiêu)?" bằng một phép tính vector thay cho vòng lặp Python gọi
+    can_fit/calculate_max_fit trên từng container.
+
+    - fit_mask(pallet)  : mảng bool theo thứ tự container, giống Container.can_fit
+                          (số dòng, số lượng, trọng lượng);
+    - max_fit(pallet)   : số lượng tối đa nhận được ở mỗi container, giống calculate_max_fit
+                          (thêm giới hạn số lượng còn trống, vốn đã được giới hạn số dòng bao hàm);
+    - fit_mask_batch / max_fit_batch: cùng phép tính cho nhiều pallet, kết quả (số pallet, số container).
+    Khi FIXED_POINT_CAPACITY bật, phép so sánh dùng các tổng số nguyên (phần nghìn pallet, gam).
+
+    Các hàng được cập nhật O(1) qua cơ chế báo thay đổi của Container (như CapacityAggregates);
+    danh sách container cố định từ lúc tạo. Dùng xong phải close() (hoặc dùng `with`).
+    """
+    __slots__ = ('containers', '_position', '_lines', '_qty', '_weight', '_qty_units', '_weight_units',
+                 '_company', '_company_masks')
+
+    def __init__(self, containers):
+        self.containers = list(containers)
+        n = len(self.containers)
+        self._position = {id(c): i for i, c in enumerate(self.containers)}
+        self._lines = np.zeros(n)
+        self._qty = np.zeros(n)
+        self._weight = np.zeros(n)
+        self._qty_units = np.zeros(n, dtype=np.int64)
+        self._weight_units = np.zeros(n, dtype=np.int64)
+        self._company = np.array([c.main_company for c in self.containers], dtype=object)
+        self._company_masks = {}
+        for i, c in enumerate(self.containers):
+            self._load(i, c)
+            c._capacity_observers.append(self)
+
+    def __len__(self):
+        return len(self.containers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _load(self, i, container):
+        self._lines[i] = container.total_logical_pallets
+        self._qty[i] = container.total_quantity
+        self._weight[i] = container.total_weight
+        self._qty_units[i] = container.total_quantity_units
+        self._weight_units[i] = container.total_weight_units
+
+    def update(self, container):
+        """Container báo thay đổi: nạp lại đúng hàng của nó."""
+        i = self._position.get(id(container))
+        if i is not None:
+            self._load(i, container)
+
+    def close(self):
+        """Gỡ theo dõi khỏi mọi container."""
+        for c in self.containers:
+            if self in c._capacity_observers:
+                c._capacity_observers.remove(self)
+        self._position = {}
+
+    def company_mask(self, company):
+        """Mảng bool: container có công ty chính là `company`."""
+        mask = self._company_masks.get(company)
+        if mask is None:
+            mask = self._company_masks[company] = self._company == str(company)
+        return mask
+
+    def overloaded_mask(self):
+        """Container đang vượt số dòng hoặc trọng lượng (cùng điều kiện với fix_container_overflows)."""
+        return (self._lines > MAX_PALLETS) | (self._weight > MAX_WEIGHT)
+
+    @property
+    def remaining_lines(self):
+        return MAX_PALLETS - self._lines
+
+    @property
+    def remaining_quantity(self):
+        return MAX_PALLETS - self._qty
+
+    @property
+    def remaining_weight(self):
+        return MAX_WEIGHT - self._weight
+
+    @staticmethod
+    def _pallet_columns(pallets):
+        """Các thuộc tính của pallet dưới dạng cột (số pallet, 1) để broadcast với các container."""
+        return (
+            np.array([p.quantity for p in pallets])[:, None],
+            np.array([p.total_weight for p in pallets])[:, None],
+            np.array([p.weight_per_pallet for p in pallets])[:, None],
+            np.array([p.logical_pallet_count for p in pallets])[:, None],
+            np.array([p.quantity_units for p in pallets], dtype=np.int64)[:, None],
+            np.array([p.weight_units for p in pallets], dtype=np.int64)[:, None],
+        )
+
+    def fit_mask_batch(self, pallets):
+        quantity, weight, _, lines, qty_units, weight_units = self._pallet_columns(pallets)
+        mask = self._lines + lines <= MAX_PALLETS
+        if FIXED_POINT_CAPACITY:
+            mask &= self._qty_units + qty_units <= MAX_QUANTITY_UNITS
+            mask &= self._weight_units + weight_units <= MAX_WEIGHT_UNITS
+        else:
+            mask &= self._qty + quantity <= MAX_PALLETS + EPSILON
+            mask &= self._weight + weight <= MAX_WEIGHT + EPSILON
+        return mask
+
+    def max_fit_batch(self, pallets):
+        quantity, _, weight_per_pallet, _, qty_units, _ = self._pallet_columns(pallets)
+        remaining_lines = self.remaining_lines
+        if FIXED_POINT_CAPACITY:
+            return self._max_fit_fixed(quantity, weight_per_pallet, qty_units, remaining_lines)
+
+        is_whole = quantity >= 1.0 - EPSILON
+        # Pallet nguyên: mỗi qty một dòng; pallet lẻ: chiếm đúng 1 dòng
+        fit = np.minimum(quantity, np.where(is_whole, remaining_lines, 1.0))
+        with np.errstate(divide='ignore'):
+            by_weight = np.where(weight_per_pallet > EPSILON, self.remaining_weight / weight_per_pallet, np.inf)
+        fit = np.minimum(fit, by_weight)
+        fit = np.minimum(fit, self.remaining_quantity + EPSILON)
+        fit = np.where(is_whole, np.floor(fit + EPSILON), fit)
+        return np.where(remaining_lines <= 0, 0.0, np.maximum(fit, 0.0))
+
+    def _max_fit_fixed(self, quantity, weight_per_pallet, qty_units, remaining_lines):
+        is_whole = qty_units >= QUANTITY_SCALE
+        lines_units = np.maximum(remaining_lines, 0).astype(np.int64) * QUANTITY_SCALE
+        fit = np.minimum(qty_units, np.where(is_whole, lines_units, QUANTITY_SCALE))
+        weight_per_pallet_units = np.rint(weight_per_pallet * WEIGHT_SCALE).astype(np.int64)
+        remaining_weight_units = MAX_WEIGHT_UNITS - self._weight_units
+        by_weight = remaining_weight_units * QUANTITY_SCALE // np.maximum(weight_per_pallet_units, 1)
+        fit = np.where(weight_per_pallet_units > 0, np.minimum(fit, by_weight), fit)
+        fit = np.minimum(fit, MAX_QUANTITY_UNITS - self._qty_units)
+        fit = np.where(is_whole, fit - fit % QUANTITY_SCALE, fit)
+        fit = np.where(remaining_lines <= 0, 0, np.maximum(fit, 0))
+        # Vừa cả pallet: trả đúng số lượng gốc (như _calculate_max_fit_fixed)
+        return np.where(fit == qty_units, quantity, fit / QUANTITY_SCALE)
+
+    def fit_mask(self, pallet):
+        return self.fit_mask_batch((pallet,))[0]
+
+    def max_fit(self, pallet):
+        return self.max_fit_batch((pallet,))[0]
+
+    def best_fit(self, pallet, company=None):
+        """
+        Container (trong `company` nếu có) nhận được TOÀN BỘ pallet và còn ít chỗ (số lượng) nhất;
+        hòa thì theo thứ tự danh sách. None nếu không có.
+        """
+        mask = self.fit_mask(pallet)
+        if company is not None:
+            mask &= self.company_mask(company)
+        positions = np.flatnonzero(mask)
+        if not len(positions):
+            return None
+        return self.containers[positions[np.argmin(MAX_PALLETS - self._qty[positions])]]
+
+
 def load_and_map_raw_data_for_pkl(filepath, sheet_name):
     """
     Trích xuất và ánh xạ dữ liệu thô từ file Excel gốc để chuẩn bị cho việc tạo Packing List.
     Hàm này sẽ là nguồn cung cấp dữ liệu duy nhất cho PKL.
     """
-    print(f"[DATA_PROCESSOR] Loading raw PKL data from: {filepath}, Sheet: {sheet_name}")
+    log_loader.info("[DATA_PROCESSOR] Loading raw PKL data from: %s, Sheet: %s", filepath, sheet_name)
     try:
         # Xác định các cột cần thiết cho Packing List theo framework
         # B(1), C(2), F(5), G(6), H(7), AW(48)
@@ -303,14 +1198,9 @@ def load_and_map_raw_data_for_pkl(filepath, sheet_name):
         column_indices_pkl = [1, 2, 4, 5, 6, 7,12, 48]
         column_names_pkl = ['Part No', 'Part Name', 'Wpc_kgs','QtyPerBox', 'WeightPerPc_Raw', 'BoxPerPallet','TotalPcsFromM', 'BoxSpec']
 
-        df_raw = pd.read_excel(
-            filepath,
-            sheet_name=sheet_name,
-            header=None,
-            skiprows=5,
-            usecols=column_indices_pkl,
-            names=column_names_pkl
-        ).fillna('')
+        # Sheet chỉ được parse một lần và dùng chung với bước tối ưu hóa (workbook_cache)
+        df_raw = read_sheet(filepath, sheet_name)[column_indices_pkl].fillna('')
+        df_raw.columns = column_names_pkl
 
         # 1. Tạo khóa tra cứu duy nhất từ Part No và Part Name
         df_raw['lookup_key'] = df_raw['Part No'].astype(str) + '||' + df_raw['Part Name'].astype(str)
@@ -330,17 +1220,47 @@ def load_and_map_raw_data_for_pkl(filepath, sheet_name):
                 # Loại bỏ ký tự đặc biệt
                         cleaned = re.sub(r'[^\d.]', '', value)
                         raw_data_map[key][field] = cleaned if cleaned else 0
-        print(f"[DATA_PROCESSOR] Successfully created raw data map with {len(raw_data_map)} unique items.")
+        log_loader.info("[DATA_PROCESSOR] Successfully created raw data map with %s unique items.", len(raw_data_map))
         return raw_data_map, None
 
     except Exception as e:
         error_msg = f"Lỗi khi đọc dữ liệu thô cho Packing List: {e}"
-        print(f"[DATA_PROCESSOR] ERROR: {error_msg}")
+        log_loader.error("[DATA_PROCESSOR] ERROR: %s", error_msg)
         return None, error_msg
 
-def load_and_prepare_pallets(filepath, sheet_name):
+def build_pallets_from_frame(df):
     """
-    Đọc và làm sạch dữ liệu từ file Excel, trả về một danh sách các đối tượng Pallet.
+    Tạo hàng loạt đối tượng Pallet từ DataFrame đã làm sạch của load_and_prepare_pallets.
+    Lấy từng cột ra thành mảng một lần rồi zip lại, thay vì df.iterrows() (mỗi dòng bị
+    đóng gói thành một Series) - nhanh hơn nhiều với sheet 10k+ dòng.
+    ID pallet vẫn là "P{chỉ số dòng gốc}" như trước.
+    """
+    columns = zip(
+        df.index.tolist(),
+        df['product_code'].tolist(),
+        df['product_name'].tolist(),
+        df['company'].tolist(),
+        df['BoxPerPallet'].tolist(),
+        df['quantity'].to_numpy(dtype=float).tolist(),
+        df['weight_per_pallet'].to_numpy(dtype=float).tolist(),
+    )
+    return [
+        Pallet(
+            p_id=f"P{i}",
+            product_code=product_code,
+            product_name=product_name,
+            company=company,
+            box_per_pallet=box_per_pallet,
+            quantity=quantity,
+            weight_per_pallet=weight_per_pallet
+        )
+        for i, product_code, product_name, company, box_per_pallet, quantity, weight_per_pallet in columns
+    ]
+
+def load_pallet_table(filepath, sheet_name):
+    """
+    Đọc và làm sạch dữ liệu từ file Excel, trả về (DataFrame, None) hoặc (None, thông báo lỗi).
+    DataFrame có các cột của build_pallets_from_frame, gọn để pickle gửi sang tiến trình khác.
     - Cột B (1): product_code
     - Cột C (2): product_name
     - Cột D (3): company
@@ -353,14 +1273,8 @@ def load_and_prepare_pallets(filepath, sheet_name):
         column_indices = [1, 2, 3, 7, 10, 11]
         column_names = ['product_code', 'product_name', 'company', 'BoxPerPallet', 'weight_per_pallet', 'quantity']
 
-        df = pd.read_excel(
-            filepath,
-            sheet_name=sheet_name,
-            header=None,
-            skiprows=5,
-            usecols=column_indices,
-            names=column_names
-        )
+        df = read_sheet(filepath, sheet_name)[column_indices].copy()
+        df.columns = column_names
 
         df.dropna(subset=['product_name', 'company', 'weight_per_pallet', 'quantity'], how='any', inplace=True)
 
@@ -383,21 +1297,7 @@ def load_and_prepare_pallets(filepath, sheet_name):
         if df.empty:
             return None, "Không tìm thấy dữ liệu hợp lệ trong các cột đã chỉ định."
 
-        # SỬA ĐỔI: Truyền r['BoxPerPallet'] khi tạo Pallet
-        pallets = [
-            Pallet(
-                p_id=f"P{i}",
-                product_code=r['product_code'],
-                product_name=r['product_name'],
-                company=r['company'],
-                box_per_pallet=r['BoxPerPallet'],
-                quantity=r['quantity'],
-                weight_per_pallet=r['weight_per_pallet']
-            )
-            for i, r in df.iterrows()
-        ]
-
-        return pallets, None
+        return df, None
 
     except FileNotFoundError:
         return None, f"Lỗi: Không tìm thấy file tại đường dẫn '{filepath}'."
@@ -406,6 +1306,15 @@ def load_and_prepare_pallets(filepath, sheet_name):
         if "No sheet named" in str(e):
              return None, f"Lỗi: Không tìm thấy sheet tên là '{sheet_name}' trong file Excel."
         return None, f"Lỗi không xác định khi xử lý file Excel: {e}"
+
+def load_and_prepare_pallets(filepath, sheet_name):
+    """
+    Đọc và làm sạch dữ liệu từ file Excel (load_pallet_table), trả về một danh sách các đối tượng Pallet.
+    """
+    df, error = load_pallet_table(filepath, sheet_name)
+    if error:
+        return None, error
+    return build_pallets_from_frame(df), None
 ### tách phần nguyên và lẻ
 def split_integer_fractional_pallets(pallets_list):
     """
@@ -417,8 +1326,8 @@ def split_integer_fractional_pallets(pallets_list):
     fractional_pallets = []
 
     for p in pallets_list:
-        integer_part = math.floor(p.quantity)
-        fractional_part = p.quantity - integer_part
+        integer_part = p.whole_pallets
+        fractional_part = p.fractional_part
 
         # Nếu có phần nguyên, tạo pallet nguyên
         if integer_part > 0:
@@ -463,9 +1372,9 @@ def handle_oversized_pallet(pallet_to_split, main_company, start_container_id):
     if num_containers_needed <= 1:
         return []
 
-    print(f"\n--- XỬ LÝ PALLET NGUYÊN QUÁ KHỔ ---")
-    print(f"Pallet {pallet_to_split.id} (qty={pallet_to_split.quantity:.0f}, wgt={pallet_to_split.total_weight:.2f}) quá lớn.")
-    print(f"Sẽ được chia đều ra {num_containers_needed} containers.")
+    log_oversized.info("--- XỬ LÝ PALLET NGUYÊN QUÁ KHỔ ---")
+    log_oversized.debug("Pallet %s (qty=%.0f, wgt=%.2f) quá lớn.", pallet_to_split.id, pallet_to_split.quantity, pallet_to_split.total_weight)
+    log_oversized.debug("Sẽ được chia đều ra %s containers.", num_containers_needed)
 
     # --- BƯỚC 2: Chia đều số lượng nguyên ---
     total_quantity_to_split = int(pallet_to_split.quantity)
@@ -496,10 +1405,10 @@ def handle_oversized_pallet(pallet_to_split, main_company, start_container_id):
 
         new_container.add_pallet(piece_pallet)
         newly_created_containers.append(new_container)
-        print(f" - Tạo {new_container.id}: chứa mảnh {piece_pallet.id} (qty={piece_pallet.quantity:.0f})")
+        log_oversized.debug(" - Tạo %s: chứa mảnh %s (qty=%.0f)", new_container.id, piece_pallet.id, piece_pallet.quantity)
 
-    print(f"Đã chia thành công pallet {pallet_to_split.id} thành {len(newly_created_containers)} phần nguyên.")
-    print("----------------------------\n")
+    log_oversized.debug("Đã chia thành công pallet %s thành %s phần nguyên.", pallet_to_split.id, len(newly_created_containers))
+    log_oversized.info("----------------------------")
     return newly_created_containers
 
 def handle_all_oversized_pallets(all_pallets, start_container_id):
@@ -515,7 +1424,7 @@ def handle_all_oversized_pallets(all_pallets, start_container_id):
     Returns:
         tuple: (danh_sách_container_mới, danh_sách_pallet_không_quá_khổ, next_container_id)
     """
-    print("\n--- BẮT ĐẦU XỬ LÝ TẤT CẢ PALLET QUÁ KHỔ ---")
+    log_oversized.info("--- BẮT ĐẦU XỬ LÝ TẤT CẢ PALLET QUÁ KHỔ ---")
     oversized_pallets = [
         p for p in all_pallets
         if p.quantity > MAX_PALLETS or p.total_weight > MAX_WEIGHT
@@ -526,7 +1435,7 @@ def handle_all_oversized_pallets(all_pallets, start_container_id):
     ]
 
     if not oversized_pallets:
-        print("Không tìm thấy pallet nào quá khổ.")
+        log_oversized.debug("Không tìm thấy pallet nào quá khổ.")
         return [], regular_pallets, start_container_id
 
     # Nhóm các pallet quá khổ theo công ty
@@ -539,7 +1448,7 @@ def handle_all_oversized_pallets(all_pallets, start_container_id):
 
     # Xử lý đồng thời cho mỗi công ty
     for company, company_pallets in pallets_by_company.items():
-        print(f"\n>>> Đang xử lý pallet quá khổ cho công ty: '{company}'")
+        log_oversized.info(">>> Đang xử lý pallet quá khổ cho công ty: '%s'", company)
         for pallet_to_split in company_pallets:
             # Tái sử dụng logic chia nhỏ từ hàm gốc handle_oversized_pallet
             # (Phần này giả định logic chia một pallet đã đúng, chỉ gọi nó trong ngữ cảnh mới)
@@ -552,7 +1461,7 @@ def handle_all_oversized_pallets(all_pallets, start_container_id):
                 newly_created_containers.extend(containers_for_this_pallet)
                 current_container_id += len(containers_for_this_pallet)
 
-    print(f"--- HOÀN THÀNH XỬ LÝ PALLET QUÁ KHỔ. Đã tạo {len(newly_created_containers)} container mới. ---")
+    log_oversized.info("--- HOÀN THÀNH XỬ LÝ PALLET QUÁ KHỔ. Đã tạo %s container mới. ---", len(newly_created_containers))
     return newly_created_containers, regular_pallets, current_container_id
 
 ##### xếp pallet nguyên vào từ lớn đến bé
@@ -566,7 +1475,7 @@ def pack_integer_pallets(integer_pallets, existing_containers, next_container_id
     3.  QUY TẮC: Không tạo thêm container mới trong giai đoạn xếp tối ưu. Pallet không
         xếp được sẽ bị đưa vào danh sách chờ.
     """
-    print("\n--- BẮT ĐẦU XẾP PALLET PHẦN NGUYÊN (LOGIC 2 GIAI ĐOẠN) ---")
+    log_integer.info("--- BẮT ĐẦU XẾP PALLET PHẦN NGUYÊN (LOGIC 2 GIAI ĐOẠN) ---")
 
     # --- GIAI ĐOẠN 0: KHỞI TẠO ---
     containers = list(existing_containers)
@@ -576,23 +1485,23 @@ def pack_integer_pallets(integer_pallets, existing_containers, next_container_id
 
     # --- GIAI ĐOẠN 1A: TẠO CONTAINER BAN ĐẦU CHO CÁC CÔNG TY CÒN THIẾU ---
     # (ĐOẠN LOGIC ĐÃ ĐƯỢC THAY ĐỔI)
-    print("  [*] Giai đoạn 1A: Kiểm tra và tạo container ban đầu cho các công ty còn thiếu...")
+    log_integer.debug("  [*] Giai đoạn 1A: Kiểm tra và tạo container ban đầu cho các công ty còn thiếu...")
     companies_with_pallets = set(p.company for p in pallets_to_pack)
     companies_with_containers = set(c.main_company for c in containers)
     
     companies_needing_container = sorted(list(companies_with_pallets - companies_with_containers))
 
     if companies_needing_container:
-        print(f"    -> Phát hiện {len(companies_needing_container)} công ty cần tạo container ban đầu.")
+        log_integer.debug("    -> Phát hiện %s công ty cần tạo container ban đầu.", len(companies_needing_container))
         for company in companies_needing_container:
             new_container = Container(container_id=f"C{current_container_id}", main_company=company)
             containers.append(new_container)
-            print(f"    -> (KHỞI TẠO) Tạo container mới {new_container.id} cho công ty {company}")
+            log_integer.debug("    -> (KHỞI TẠO) Tạo container mới %s cho công ty %s", new_container.id, company)
             current_container_id += 1
     else:
-        print("    -> Tất cả công ty có pallet cần xếp đều đã có container.")
+        log_integer.debug("    -> Tất cả công ty có pallet cần xếp đều đã có container.")
     # --- GIAI ĐOẠN 1B: XẾP NỀN (PALLET LỚN NHẤT VÀO CONTAINER TRỐNG) ---
-    empty_containers = [c for c in containers if len(c.pallets) == 0]
+    empty_containers = [c for c in containers if c.pallet_count == 0]
     for container in empty_containers:
         # Tìm pallet lớn nhất cùng công ty để làm nền
         base_pallet_found = None
@@ -603,10 +1512,10 @@ def pack_integer_pallets(integer_pallets, existing_containers, next_container_id
 
         if base_pallet_found:
             container.add_pallet(base_pallet_found)
-            print(f"  [+] (XẾP NỀN) Cố định pallet lớn nhất {base_pallet_found.id} vào container trống {container.id}")
+            log_integer.debug("  [+] (XẾP NỀN) Cố định pallet lớn nhất %s vào container trống %s", base_pallet_found.id, container.id)
         else:
             # Trường hợp hiếm gặp: đã tạo container nhưng không còn pallet nào cho công ty đó
-            print(f"  [!] Không tìm thấy pallet nào để làm nền cho container {container.id}")
+            log_integer.debug("  [!] Không tìm thấy pallet nào để làm nền cho container %s", container.id)
 
 
     # --- GIAI ĐOẠN 2: XẾP TỐI ƯU VỚI LOGIC CHI PHÍ CƠ HỘI MỚI ---
@@ -659,13 +1568,13 @@ def pack_integer_pallets(integer_pallets, existing_containers, next_container_id
 
             if group_is_better:
                 # QUYẾT ĐỊNH: Xếp nhóm nhỏ, hoãn pallet lớn
-                print(f"  [OPP. COST] Ưu tiên nhóm {len(small_pallet_group)} pallet nhỏ cho Cont {container.id} (Tổng wgt: {group_weight:.2f}).")
-                print(f"    - Hoãn pallet {current_pallet.id} (wgt: {current_pallet.total_weight:.2f}) -> đưa vào danh sách chờ.")
+                log_integer.debug("  [OPP. COST] Ưu tiên nhóm %s pallet nhỏ cho Cont %s (Tổng wgt: %.2f).", len(small_pallet_group), container.id, group_weight)
+                log_integer.debug("    - Hoãn pallet %s (wgt: %.2f) -> đưa vào danh sách chờ.", current_pallet.id, current_pallet.total_weight)
                 unplaced_integer_pallets.append(current_pallet)
 
                 # Xếp các pallet trong nhóm đã chọn vào container
                 for p_small in small_pallet_group:
-                    print(f"    - Xếp pallet nhỏ: {p_small.id}")
+                    log_integer.debug("    - Xếp pallet nhỏ: %s", p_small.id)
                     container.add_pallet(p_small)
                     # Xóa khỏi danh sách nguồn để không xét lại
                     pallets_to_pack.remove(p_small)
@@ -675,7 +1584,7 @@ def pack_integer_pallets(integer_pallets, existing_containers, next_container_id
             else:
                 # QUYẾT ĐỊNH: Xếp pallet lớn như bình thường vì không có nhóm nào tốt hơn
                 container.add_pallet(current_pallet)
-                print(f"  [+] (Xếp thường) Xếp pallet nguyên {current_pallet.id} vào container: {container.id}")
+                log_integer.debug("  [+] (Xếp thường) Xếp pallet nguyên %s vào container: %s", current_pallet.id, container.id)
                 placed = True
                 break # Đã xếp xong, chuyển sang pallet lớn tiếp theo
 
@@ -683,7 +1592,7 @@ def pack_integer_pallets(integer_pallets, existing_containers, next_container_id
         if not placed:
             # Pallet này sẽ được đưa vào danh sách chờ
             unplaced_integer_pallets.append(current_pallet)
-            print(f"  [-] (Không vừa) Pallet nguyên {current_pallet.id} không tìm được container nào phù hợp -> đưa vào danh sách chờ.")
+            log_integer.debug("  [-] (Không vừa) Pallet nguyên %s không tìm được container nào phù hợp -> đưa vào danh sách chờ.", current_pallet.id)
 
 
     # Những pallet còn lại trong `pallets_to_pack` chính là những pallet không vừa
@@ -692,27 +1601,88 @@ def pack_integer_pallets(integer_pallets, existing_containers, next_container_id
     remaining_unplaced = [p for p in pallets_to_pack if p not in unplaced_integer_pallets]
     if remaining_unplaced:
         for p in remaining_unplaced:
-            print(f"  [-] (Không vừa) Pallet nguyên {p.id} không tìm được container nào phù hợp -> đưa vào danh sách chờ.")
+            log_integer.debug("  [-] (Không vừa) Pallet nguyên %s không tìm được container nào phù hợp -> đưa vào danh sách chờ.", p.id)
         unplaced_integer_pallets.extend(remaining_unplaced)
 
 
-    print("--- HOÀN THÀNH XẾP PALLET PHẦN NGUYÊN ---")
+    log_integer.info("--- HOÀN THÀNH XẾP PALLET PHẦN NGUYÊN ---")
     if unplaced_integer_pallets:
         # Sắp xếp lại danh sách chờ để dễ theo dõi
         unplaced_integer_pallets.sort(key=lambda p: p.quantity, reverse=True)
-        print(f"Lưu ý: Có {len(unplaced_integer_pallets)} pallet nguyên không xếp được và đã được đưa vào danh sách chờ.")
+        log_integer.debug("Lưu ý: Có %s pallet nguyên không xếp được và đã được đưa vào danh sách chờ.", len(unplaced_integer_pallets))
 
     return containers, unplaced_integer_pallets, current_container_id
 
+COMBINE_TARGET_QUANTITY = 0.9
+
+
+def _combine_size(pallet):
+    """Kích thước của pallet khi ghép: phần nghìn pallet làm tròn gần nhất, ít nhất 1."""
+    return max(1, pallet.quantity_units)
+
+
+def _combine_fits(combination):
+    """Điều kiện ghép gốc (float): tổng số lượng không vượt COMBINE_TARGET_QUANTITY + EPSILON."""
+    return sum(p.quantity for p in combination) <= COMBINE_TARGET_QUANTITY + EPSILON
+
+
+def _subset_sum_fill(groups, capacity):
+    """
+    Bài toán subset-sum có giới hạn: chọn số món từ mỗi nhóm (cùng kích thước) sao cho tổng lớn
+    nhất mà không vượt `capacity` (đơn vị: phần nghìn pallet).
+
+    groups: {kích thước: số món có sẵn}. Trả về {kích thước: số món được chọn}.
+    Quy hoạch động trên bitset (số nguyên Python, bit thứ k bật = đạt được tổng k); mỗi nhóm được
+    tách nhị phân (1, 2, 4, ... món) nên chi phí chỉ phụ thuộc số kích thước khác nhau (<= capacity),
+    không phụ thuộc số pallet. Khi truy vết, món nhỏ được bỏ qua nếu có thể (ưu tiên món lớn).
+    """
+    if capacity <= 0:
+        return {}
+    mask = (1 << (capacity + 1)) - 1
+    items = []
+    for size in sorted(groups, reverse=True):
+        if size > capacity or size <= 0:
+            continue
+        remaining = min(groups[size], capacity // size)
+        chunk = 1
+        while remaining > 0:
+            take = min(chunk, remaining)
+            items.append((size, take))
+            remaining -= take
+            chunk *= 2
+
+    reachable = 1
+    before = []
+    for size, take in items:
+        before.append(reachable)
+        reachable = (reachable | (reachable << (size * take))) & mask
+
+    best = reachable.bit_length() - 1
+    chosen = defaultdict(int)
+    for i in range(len(items) - 1, -1, -1):
+        if best == 0:
+            break
+        if not (before[i] >> best) & 1:
+            size, take = items[i]
+            chosen[size] += take
+            best -= size * take
+    return chosen
+
+
 def combine_fractional_pallets(fractional_pallets):
     """
     Ghép các pallet lẻ với nhau theo từng công ty, với mục tiêu TỐI ƯU HÓA
     để tạo ra các pallet ghép có tổng số lượng (qty) gần bằng 0.9 nhất có thể.
 
-    Chiến lược tối ưu (Best Fit Decreasing):
-    - Lấy pallet lẻ lớn nhất làm "nền".
-    - Ưu tiên ghép thêm các pallet lẻ lớn nhất còn lại trước.
-      Cách này giúp nhanh chóng đạt đến ngưỡng 0.9.
+    Chiến lược tối ưu:
+    - Lấy pallet lẻ lớn nhất còn lại làm "nền".
+    - Chọn tập pallet ghép thêm có tổng LỚN NHẤT còn vừa dưới 0.9 bằng quy hoạch động subset-sum
+      (_subset_sum_fill) trên số lượng đã rời rạc hóa theo phần nghìn pallet, thay cho việc thử
+      lần lượt từng ứng viên từ lớn đến nhỏ. Các pallet cùng kích thước được gom nhóm nên mỗi tổ
+      hợp tốn chi phí theo số kích thước khác nhau, không theo số pallet của công ty.
+    - Số lượng được làm tròn gần nhất nên mỗi món lệch tối đa một đơn vị: quy hoạch động được phép
+      vượt ngưỡng thêm một đơn vị cho mỗi món có thể chọn, rồi tổ hợp được kiểm tra lại bằng điều
+      kiện float gốc (_combine_fits); không đạt thì giảm giới hạn và chọn lại.
 
     Quy tắc ghép:
     1.  Tổng số lượng (qty) của một pallet gộp không được vượt quá 0.9.
@@ -726,7 +1696,7 @@ def combine_fractional_pallets(fractional_pallets):
         tuple[list[Pallet], list[Pallet]]: Một tuple chứa hai danh sách:
                                            (danh_sách_pallet_đã_gộp, danh_sách_pallet_lẻ_còn_lại).
     """
-    print("\n--- BẮT ĐẦU GHÉP CÁC PALLET LẺ (LOGIC TỐI ƯU HÓA NGƯỠNG 0.9) ---")
+    log_combine.info("--- BẮT ĐẦU GHÉP CÁC PALLET LẺ (LOGIC TỐI ƯU HÓA NGƯỠNG 0.9) ---")
 
     final_combined_pallets = []
     final_uncombined_pallets = []
@@ -739,41 +1709,48 @@ def combine_fractional_pallets(fractional_pallets):
 
     # Bước 2: Áp dụng logic ghép nối cho từng công ty
     for company, company_pallets in pallets_by_company.items():
-        print(f"\n>>> Đang xử lý cho công ty: '{company}' ({len(company_pallets)} pallet lẻ)")
-
-        # Sắp xếp tất cả pallet của công ty từ lớn đến nhỏ
-        available_pallets = sorted(company_pallets, key=lambda p: p.quantity, reverse=True)
+        log_combine.info(">>> Đang xử lý cho công ty: '%s' (%s pallet lẻ)", company, len(company_pallets))
+
+        # Sắp xếp tất cả pallet của công ty từ lớn đến nhỏ.
+        # Lưu theo chỉ mục id để lấy pallet nền và xóa pallet đã ghép trong O(1).
+        ordered_pallets = sorted(company_pallets, key=lambda p: p.quantity, reverse=True)
+        available_pallets = PalletIndex(ordered_pallets)
+        # Các pallet NHỎ (< 0.5) còn lại, nhóm theo kích thước (_combine_size).
+        # Mỗi nhóm giữ thứ tự ngược với ordered_pallets để pop() lấy pallet lớn nhất (đứng trước) trước.
+        small_by_size = defaultdict(list)
+        for p in reversed(ordered_pallets):
+            if p.quantity < 0.5:
+                small_by_size[_combine_size(p)].append(p)
+        target_units = to_quantity_units(COMBINE_TARGET_QUANTITY)
 
         while available_pallets:
             # Lấy pallet lớn nhất làm nền cho tổ hợp mới
-            base_pallet = available_pallets.pop(0)
+            base_pallet = available_pallets.pop_first()
             current_combination = [base_pallet]
-            
-            # --- ĐIỂM CỐT LÕI CỦA THUẬT TOÁN ---
-            # Luôn sắp xếp các pallet ứng viên còn lại từ LỚN NHẤT đến nhỏ nhất.
-            # Điều này đảm bảo chúng ta luôn thử ghép mảnh lớn nhất có thể ("Best Fit").
-            candidates = sorted(available_pallets, key=lambda p: p.quantity, reverse=True)
-            
-            # Duyệt qua danh sách ứng viên để tìm các mảnh ghép phù hợp
-            for candidate in list(candidates): 
-                # Bỏ qua nếu ứng viên đã được ghép vào một tổ hợp khác
-                if candidate not in available_pallets:
-                    continue
+            base_size = _combine_size(base_pallet)
+            if base_pallet.quantity < 0.5:
+                # Pallet nền là pallet lớn nhất còn lại nên luôn ở cuối nhóm của nó
+                small_by_size[base_size].pop()
 
-                potential_combination = current_combination + [candidate]
-                
-                # Điều kiện 1: Tổng số lượng phải <= 0.9
-                potential_quantity = sum(p.quantity for p in potential_combination)
-                if potential_quantity > 0.9 + EPSILON:
-                    continue # Bỏ qua nếu vượt ngưỡng
-
-                # Điều kiện 2: Tối đa một pallet có qty >= 0.5
-                num_large_pallets = sum(1 for p in potential_combination if p.quantity >= 0.5)
-                if num_large_pallets > 1:
-                    continue # Bỏ qua nếu vi phạm quy tắc
-                    
-                # NẾU ĐẠT YÊU CẦU: Thêm ứng viên vào tổ hợp hiện tại
-                # và xóa nó khỏi danh sách chờ để không xét lại.
+            # --- ĐIỂM CỐT LÕI CỦA THUẬT TOÁN ---
+            # Điều kiện 1: Tổng số lượng phải <= 0.9 -> phần còn trống sau pallet nền.
+            # Điều kiện 2: Tối đa một pallet có qty >= 0.5. Pallet nền là pallet lớn nhất còn lại,
+            # nên chỉ cần ghép thêm các pallet nhỏ (< 0.5) là luôn thỏa mãn.
+            groups = {size: len(group) for size, group in small_by_size.items() if group}
+            free_units = target_units - base_size
+            # Sai số làm tròn: tối đa một đơn vị cho mỗi món (kể cả pallet nền)
+            max_parts = min(sum(groups.values()), max(free_units, 0) // min(groups, default=1)) + 1
+            capacity = free_units + max_parts
+            while True:
+                chosen = _subset_sum_fill(groups, capacity)
+                # Các pallet được chọn: cuối mỗi nhóm, theo thứ tự pop()
+                candidates = [p for size in sorted(chosen, reverse=True)
+                              for p in reversed(small_by_size[size][-chosen[size]:])]
+                if not candidates or _combine_fits(current_combination + candidates):
+                    break
+                capacity = sum(size * count for size, count in chosen.items()) - 1
+            for candidate in candidates:
+                small_by_size[_combine_size(candidate)].pop()
                 current_combination.append(candidate)
                 available_pallets.remove(candidate)
 
@@ -799,14 +1776,14 @@ def combine_fractional_pallets(fractional_pallets):
                 combined_pallet.original_pallets = current_combination
                 final_combined_pallets.append(combined_pallet)
                 next_combined_id += 1
-                print(f"  [+] Đã tạo pallet gộp: {combined_pallet}")
+                log_combine.debug("  [+] Đã tạo pallet gộp: %s", combined_pallet)
             else:
                 # Nếu không thể ghép thêm gì, pallet nền sẽ được giữ lại làm pallet lẻ
                 final_uncombined_pallets.append(base_pallet)
-                print(f"  [-] Pallet {base_pallet.id} không thể ghép, giữ lại.")
+                log_combine.debug("  [-] Pallet %s không thể ghép, giữ lại.", base_pallet.id)
 
-    print(f"\n--- HOÀN THÀNH GHÉP PALLET LẺ ---")
-    print(f"Tổng kết: {len(final_combined_pallets)} pallet đã được gộp, {len(final_uncombined_pallets)} pallet lẻ còn lại.")
+    log_combine.info("--- HOÀN THÀNH GHÉP PALLET LẺ ---")
+    log_combine.info("Tổng kết: %s pallet đã được gộp, %s pallet lẻ còn lại.", len(final_combined_pallets), len(final_uncombined_pallets))
     
     return final_combined_pallets, final_uncombined_pallets
 
@@ -817,31 +1794,26 @@ def pack_fractional_pallets(fractional_pallets, containers):
     Không tạo container mới, không cross-ship ở giai đoạn này.
     Trả về danh sách các pallet không xếp được.
     """
-    print("\n--- BẮT ĐẦU XẾP PALLET LẺ VÀO CONTAINER CÙNG CÔNG TY ---")
+    log_fractional.info("--- BẮT ĐẦU XẾP PALLET LẺ VÀO CONTAINER CÙNG CÔNG TY ---")
     pallets_to_pack = sorted(fractional_pallets, key=lambda p: p.quantity, reverse=True)
     unplaced_pallets = []
 
-    for pallet in pallets_to_pack:
-        was_placed = False
-        # Tìm container phù hợp: cùng công ty và còn chỗ trống.
-        # Sắp xếp để ưu tiên container còn ít chỗ nhất (best-fit).
-        available_containers = sorted(
-            [c for c in containers if c.main_company == pallet.company],
-            key=lambda c: c.remaining_quantity
-        )
-
-        for container in available_containers:
-            if container.can_fit(pallet):
+    with ContainerFitKernel(containers) as kernel:
+        for pallet in pallets_to_pack:
+            was_placed = False
+            # Tìm container phù hợp: cùng công ty và còn chỗ trống.
+            # Ưu tiên container còn ít chỗ nhất (best-fit), kiểm tra mọi container trong một phép tính vector.
+            container = kernel.best_fit(pallet, company=pallet.company)
+            if container is not None:
                 container.add_pallet(pallet)
-                print(f"  [+] (Cùng Cty) Xếp pallet lẻ {pallet.id} vào Container {container.id}.")
+                log_fractional.debug("  [+] (Cùng Cty) Xếp pallet lẻ %s vào Container %s.", pallet.id, container.id)
                 was_placed = True
-                break  # Đã xếp xong, chuyển sang pallet tiếp theo.
 
-        if not was_placed:
-            unplaced_pallets.append(pallet)
-            print(f"  [-] (Không vừa) Pallet lẻ {pallet.id} không tìm được chỗ, đưa vào danh sách chờ.")
-            
-    print("--- HOÀN THÀNH XẾP PALLET LẺ ---\n")
+            if not was_placed:
+                unplaced_pallets.append(pallet)
+                log_fractional.debug("  [-] (Không vừa) Pallet lẻ %s không tìm được chỗ, đưa vào danh sách chờ.", pallet.id)
+
+    log_fractional.info("--- HOÀN THÀNH XẾP PALLET LẺ ---")
     return unplaced_pallets
 
 # xử lí pallet trong danh sách chờ cho pallet nguyên
@@ -864,42 +1836,38 @@ def try_pack_pallets_into_same_company_containers(unplaced_pallets, containers):
         list[Pallet]: Một danh sách mới chỉ chứa các pallet không thể xếp được.
                        Lưu ý: Danh sách `containers` đầu vào sẽ bị thay đổi (được thêm pallet vào).
     """
-    print("\n--- BƯỚC: THỬ XẾP PALLET CHỜ VÀO CONTAINER CÙNG CÔNG TY ---")
+    log_unplaced.info("--- BƯỚC: THỬ XẾP PALLET CHỜ VÀO CONTAINER CÙNG CÔNG TY ---")
     
     # Danh sách để lưu những pallet thực sự không thể xếp được trong bước này
     pallets_still_unplaced = []
     
     # Sắp xếp các pallet cần xử lý từ lớn đến nhỏ để ưu tiên các pallet khó xếp nhất trước
     sorted_pallets_to_check = sorted(unplaced_pallets, key=lambda p: p.quantity, reverse=True)
+    container_index = ContainerIndex(containers)
 
     for pallet in sorted_pallets_to_check:
         was_placed = False
         
-        # 1. Lọc ra những container tương thích (phải cùng công ty với pallet)
-        compatible_containers = [c for c in containers if c.main_company == pallet.company]
-        
-        # 2. Sắp xếp các container tương thích để ưu tiên container gần đầy nhất (Best-Fit).
+        # 1-2. Chỉ xét container cùng công ty với pallet, ưu tiên container gần đầy nhất (Best-Fit).
         #    Mục đích là để "hoàn thiện" các container đang xếp dở trước khi dùng đến các container còn trống nhiều.
-        sorted_compatible_containers = sorted(compatible_containers, key=lambda c: c.remaining_quantity)
-        
-        # 3. Duyệt qua các container đã lọc và sắp xếp để tìm "nhà" cho pallet
-        for container in sorted_compatible_containers:
-            if container.can_fit(pallet):
-                # Nếu tìm thấy chỗ, thêm pallet vào container, đánh dấu là đã xếp và thoát khỏi vòng lặp tìm kiếm
-                container.add_pallet(pallet)
-                print(f"  [+] (Xếp đơn giản) Đã xếp pallet '{pallet.id}' (qty: {pallet.quantity}) vào container có sẵn {container.id}.")
-                was_placed = True
-                break # Đã xếp xong pallet này, chuyển sang pallet tiếp theo
+        # 3. Chỉ mục trả về ngay container đầu tiên (theo thứ tự đó) còn chứa được pallet
+        container = container_index.best_fit(pallet, company=pallet.company)
+        if container is not None:
+            container.add_pallet(pallet)
+            log_unplaced.debug("  [+] (Xếp đơn giản) Đã xếp pallet '%s' (qty: %s) vào container có sẵn %s.", pallet.id, pallet.quantity, container.id)
+            was_placed = True
         
         # 4. Nếu sau khi duyệt hết các container phù hợp mà pallet vẫn chưa được xếp
         if not was_placed:
             # Ghi nhận pallet này không tìm được nhà và thêm vào danh sách trả về
-            print(f"  [-] (Không vừa) Pallet '{pallet.id}' (qty: {pallet.quantity}) không tìm được container cùng công ty nào còn đủ chỗ.")
+            log_unplaced.debug("  [-] (Không vừa) Pallet '%s' (qty: %s) không tìm được container cùng công ty nào còn đủ chỗ.", pallet.id, pallet.quantity)
             pallets_still_unplaced.append(pallet)
+    container_index.close()
 
-    print(f"--- KẾT THÚC: Còn lại {len(pallets_still_unplaced)} pallet trong danh sách chờ sau khi thử xếp đơn giản. ---")
+    log_unplaced.info("--- KẾT THÚC: Còn lại %s pallet trong danh sách chờ sau khi thử xếp đơn giản. ---", len(pallets_still_unplaced))
     return pallets_still_unplaced
-def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, containers, unplaced_fractionals):
+def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, containers, unplaced_fractionals,
+                                                 capacity=None):
     """
     Xử lý các pallet còn lại bằng một chiến lược hai bước đã được sửa đổi:
     1.  Kiểm tra xem có thể cross-ship toàn bộ danh sách pallet chờ không.
@@ -911,13 +1879,15 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
         đã chia sẽ được xóa khỏi danh sách chờ, các pallet còn lại sẽ được trả về
         để xử lý trong các bước tiếp theo.
 
+    capacity: CapacityAggregates đang theo dõi `containers` (nếu có), dùng cho bước kiểm tra cross-ship.
+
     Returns:
         list[Pallet]: Danh sách các pallet vẫn chưa được xếp sau khi thực hiện
                       thao tác tối ưu nhất.
     """
-    print("\n--- BƯỚC: XỬ LÝ PALLET CHỜ BẰNG LOGIC CHIA TÁCH THÔNG MINH (v2) ---")
+    log_unplaced.info("--- BƯỚC: XỬ LÝ PALLET CHỜ BẰNG LOGIC CHIA TÁCH THÔNG MINH (v2) ---")
     if not pallets_still_unplaced:
-        print("   Không có pallet nào trong danh sách chờ. Bỏ qua.")
+        log_unplaced.debug("   Không có pallet nào trong danh sách chờ. Bỏ qua.")
         return []
 
     # SỬA ĐỔI: Thêm tham số is_integer_logic để điều khiển cách tách pallet
@@ -958,7 +1928,7 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
             if abs(remaining_part.quantity - fit_quantity) < EPSILON:
                 if container.can_fit(remaining_part):
                     container.add_pallet(remaining_part)
-                    print(f"       -> ({placement_type}) Đã xếp (toàn bộ) {remaining_part.id} vào container {container.id}")
+                    log_unplaced.debug("       -> (%s) Đã xếp (toàn bộ) %s vào container %s", placement_type, remaining_part.id, container.id)
                     remaining_part = None
                 continue
 
@@ -969,7 +1939,7 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
                     rest, piece_to_add = remaining_part.split(fit_quantity)
                     if piece_to_add and container.can_fit(piece_to_add):
                         container.add_pallet(piece_to_add)
-                        print(f"       -> ({placement_type}) Đã xếp (một phần) {piece_to_add.id} (qty: {piece_to_add.quantity:.2f}) vào cont {container.id}")
+                        log_unplaced.debug("       -> (%s) Đã xếp (một phần) %s (qty: %.2f) vào cont %s", placement_type, piece_to_add.id, piece_to_add.quantity, container.id)
                         remaining_part = rest
                     # Nếu không tách được thì bỏ qua, giữ nguyên `remaining_part` để thử với cont khác
 
@@ -977,10 +1947,11 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
         return remaining_part is None or remaining_part.quantity < EPSILON
 
 
-    can_cross_ship_all = check_cross_ship_capacity_for_list(pallets_still_unplaced, containers, unplaced_fractionals)
+    can_cross_ship_all = check_cross_ship_capacity_for_list(pallets_still_unplaced, containers, unplaced_fractionals,
+                                                           capacity)
 
     if can_cross_ship_all:
-        print("   [INFO] Có khả năng cross-ship toàn bộ. Áp dụng tối ưu hóa chi phí cơ hội.")
+        log_unplaced.debug("   [INFO] Có khả năng cross-ship toàn bộ. Áp dụng tối ưu hóa chi phí cơ hội.")
         
         # ### SỬA LỖI LOGIC TẠI ĐÂY ###
         def _can_be_placed_iteratively(qty_to_check, wpp, target_containers, is_integer_logic):
@@ -992,9 +1963,9 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
                 return True
             
             temp_qty_to_place = qty_to_check
-            # Mô phỏng trên một bản sao sâu để không làm thay đổi trạng thái container thật
-            sim_containers = copy.deepcopy(target_containers)
-            sorted_containers = sorted(sim_containers, key=lambda c: c.remaining_quantity)
+            # Mỗi container chỉ được xét MỘT lần, nên mô phỏng chỉ cần trừ dần số lượng cần xếp:
+            # không phải sao chép hay thay đổi trạng thái container thật
+            sorted_containers = sorted(target_containers, key=lambda c: c.remaining_quantity)
 
             for c in sorted_containers:
                 if temp_qty_to_place < EPSILON:
@@ -1017,16 +1988,6 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
                 if amount_to_place_here < EPSILON:
                     continue
 
-                # Cập nhật trạng thái của container mô phỏng để các lần lặp sau tính toán chính xác
-                # (Mô phỏng việc thêm pallet vào)
-                c.total_quantity += amount_to_place_here
-                c.total_weight += amount_to_place_here * wpp
-                # Đối với pallet nguyên, số lượng pallet logic tăng tương ứng số lượng
-                if is_integer_logic:
-                     c.total_logical_pallets += amount_to_place_here
-                elif amount_to_place_here > 0:
-                     c.total_logical_pallets +=1
-
                 temp_qty_to_place -= amount_to_place_here
             
             # Trả về True nếu đã mô phỏng xếp hết
@@ -1057,14 +2018,14 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
                     break
             
             if best_plan["keep_qty"] == -1:
-                print(f"   [WARN] Không tìm thấy kế hoạch chia tách khả thi cho pallet {pallet.id}. Pallet được giữ lại.")
+                log_unplaced.warning("   [WARN] Không tìm thấy kế hoạch chia tách khả thi cho pallet %s. Pallet được giữ lại.", pallet.id)
                 final_unplaced_list.append(pallet)
                 continue
 
             keep_qty = best_plan['keep_qty']
             cross_qty = best_plan['cross_qty']
-            print(f"   [*] Tối ưu hóa cho pallet {pallet.id} (qty: {pallet.quantity}):")
-            print(f"       - Kế hoạch TỐT NHẤT: Giữ lại: {keep_qty:.2f} | Chuyển đi: {cross_qty:.2f}")
+            log_unplaced.debug("   [*] Tối ưu hóa cho pallet %s (qty: %s):", pallet.id, pallet.quantity)
+            log_unplaced.debug("       - Kế hoạch TỐT NHẤT: Giữ lại: %.2f | Chuyển đi: %.2f", keep_qty, cross_qty)
 
             part_to_keep, part_to_cross = None, None
             if cross_qty < EPSILON:
@@ -1076,7 +2037,7 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
                 # Để `part_to_cross` có số lượng là `cross_qty`, ta phải split(cross_qty)
                 part_to_keep, part_to_cross = pallet.split(cross_qty)
                 if not part_to_keep or not part_to_cross:
-                    print(f"   [ERROR] Lỗi khi chia pallet {pallet.id}. Pallet được giữ lại.")
+                    log_unplaced.error("   [ERROR] Lỗi khi chia pallet %s. Pallet được giữ lại.", pallet.id)
                     final_unplaced_list.append(pallet)
                     continue
             
@@ -1087,17 +2048,17 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
             if not (was_kept_placed and was_cross_placed):
                 # Khôi phục lại trạng thái container nếu việc thực thi thất bại (an toàn hơn)
                 # (Phần này có thể được thêm vào nếu cần sự chặt chẽ tuyệt đối)
-                print(f"   [ERROR] Không thể xếp toàn bộ các mảnh của pallet {pallet.id} theo kế hoạch. Pallet GỐC được giữ lại.")
+                log_unplaced.error("   [ERROR] Không thể xếp toàn bộ các mảnh của pallet %s theo kế hoạch. Pallet GỐC được giữ lại.", pallet.id)
                 final_unplaced_list.append(pallet) # Thêm pallet gốc vào danh sách chưa xếp được
         
         if not final_unplaced_list:
-            print("   [SUCCESS] Hoàn tất tối ưu hóa. Tất cả pallet đã được xử lý.")
+            log_unplaced.debug("   [SUCCESS] Hoàn tất tối ưu hóa. Tất cả pallet đã được xử lý.")
         return final_unplaced_list # Trả về danh sách pallet thực sự còn lại
 
     # --- BƯỚC 2: Nếu không, tìm và thực thi kế hoạch chia tách đơn lẻ TỐT NHẤT (giữ nguyên logic cũ) ---
     else:
         # Giữ nguyên logic cũ cho trường hợp này
-        print("   [INFO] Không thể cross-ship toàn bộ. Chuyển sang logic tìm kiếm chia tách đơn lẻ tốt nhất.")
+        log_unplaced.debug("   [INFO] Không thể cross-ship toàn bộ. Chuyển sang logic tìm kiếm chia tách đơn lẻ tốt nhất.")
         all_possible_plans = []
         
         def can_fit_in_any_container(quantity, weight, target_containers):
@@ -1132,7 +2093,7 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
                 all_possible_plans.append(best_plan_for_this_pallet)
 
         if not all_possible_plans:
-            print("   [INFO] Không tìm thấy bất kỳ kế hoạch chia tách khả thi nào.")
+            log_unplaced.debug("   [INFO] Không tìm thấy bất kỳ kế hoạch chia tách khả thi nào.")
             return pallets_still_unplaced
 
         all_possible_plans.sort(key=lambda p: (-p['keep_qty'], p['pallet'].quantity))
@@ -1144,8 +2105,8 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
         is_integer_logic = best_overall_plan['is_integer']
 
 
-        print(f"   [*] (LỰA CHỌN TỐI ƯU) Sẽ thực thi kế hoạch cho pallet {pallet_to_split.id}:")
-        print(f"       - Giữ lại: {keep_qty:.2f} | Chuyển đi: {cross_qty:.2f}")
+        log_unplaced.debug("   [*] (LỰA CHỌN TỐI ƯU) Sẽ thực thi kế hoạch cho pallet %s:", pallet_to_split.id)
+        log_unplaced.debug("       - Giữ lại: %.2f | Chuyển đi: %.2f", keep_qty, cross_qty)
         
         own_company_containers = [c for c in containers if c.main_company == pallet_to_split.company]
         other_company_containers = [c for c in containers if c.main_company != pallet_to_split.company]
@@ -1156,7 +2117,7 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
             for container in sorted(target_containers_list, key=lambda c:c.remaining_quantity):
                 if container.can_fit(pallet_to_split):
                     container.add_pallet(pallet_to_split)
-                    print(f"       -> Đã xếp (toàn bộ) {pallet_to_split.id} vào container {container.id}")
+                    log_unplaced.debug("       -> Đã xếp (toàn bộ) %s vào container %s", pallet_to_split.id, container.id)
                     return [p for p in pallets_still_unplaced if p.id != pallet_to_split.id]
         
         part_to_keep, part_to_cross = pallet_to_split.split(cross_qty)
@@ -1165,14 +2126,14 @@ def handle_unplaced_pallets_with_smart_splitting(pallets_still_unplaced, contain
         was_cross_placed = _place_pallet_iteratively(part_to_cross, other_company_containers, "Chuyển đi", is_integer_logic)
 
         if not (was_kept_placed and was_cross_placed):
-            print(f"   [LỖI NGHIÊM TRỌNG] Mặc dù đã lên kế hoạch nhưng không thể xếp các mảnh của {pallet_to_split.id}.")
+            log_unplaced.error("   [LỖI NGHIÊM TRỌNG] Mặc dù đã lên kế hoạch nhưng không thể xếp các mảnh của %s.", pallet_to_split.id)
             return pallets_still_unplaced
 
         final_unplaced_list = [p for p in pallets_still_unplaced if p.id != pallet_to_split.id]
-        print(f"--- KẾT THÚC: Còn lại {len(final_unplaced_list)} pallet trong danh sách chờ. ---")
+        log_unplaced.info("--- KẾT THÚC: Còn lại %s pallet trong danh sách chờ. ---", len(final_unplaced_list))
         return final_unplaced_list
 
-def handle_remaining_integers_iteratively(final_unplaced_list, containers, next_container_id):
+def handle_remaining_integers_iteratively(final_unplaced_list, containers, next_container_id, capacity=None):
     """
     Xử lý danh sách cuối cùng gồm các pallet nguyên chưa được xếp bằng cách tạo các container mới
     và sau đó áp dụng lặp lại toàn bộ bộ logic xếp hàng cho đến khi tất cả pallet được xếp xong.
@@ -1192,14 +2153,15 @@ def handle_remaining_integers_iteratively(final_unplaced_list, containers, next_
         final_unplaced_list (list[Pallet]): Danh sách các pallet nguyên không thể xếp được.
         containers (list[Container]): Danh sách hiện tại của tất cả các container.
         next_container_id (int): ID có sẵn tiếp theo để tạo container mới.
+        capacity (CapacityAggregates, optional): Đang theo dõi `containers`; container mới được thêm vào.
 
     Returns:
         tuple[list[Container], int]: Một tuple chứa danh sách container đã được cập nhật
                                      và next_container_id mới.
     """
-    print("\n--- BẮT ĐẦU QUY TRÌNH XỬ LÝ LẶP LẠI CUỐI CÙNG CHO CÁC PALLET NGUYÊN ---")
+    log_unplaced.info("--- BẮT ĐẦU QUY TRÌNH XỬ LÝ LẶP LẠI CUỐI CÙNG CHO CÁC PALLET NGUYÊN ---")
     if not final_unplaced_list:
-        print("Không có pallet nào trong danh sách cuối cùng. Bỏ qua.")
+        log_unplaced.debug("Không có pallet nào trong danh sách cuối cùng. Bỏ qua.")
         return containers, next_container_id
 
     # Danh sách pallet chúng ta sẽ xử lý, danh sách này sẽ thu hẹp lại sau mỗi bước thành công.
@@ -1208,7 +2170,7 @@ def handle_remaining_integers_iteratively(final_unplaced_list, containers, next_
     # Lặp cho đến khi tất cả pallet được xử lý hoặc chúng ta bị kẹt trong vòng lặp.
     while pallets_to_process:
         initial_count = len(pallets_to_process)
-        print(f"\n[BẮT ĐẦU VÒNG LẶP] Số pallet còn lại cần xử lý: {initial_count}")
+        log_unplaced.info("[BẮT ĐẦU VÒNG LẶP] Số pallet còn lại cần xử lý: %s", initial_count)
 
         # --- BƯỚC 1: TẠO CONTAINER MỚI & XẾP HÀNG VỚI LOGIC CHI PHÍ CƠ HỘI ---
         # Bước này mô phỏng logic cốt lõi của việc tạo container mới cho các mặt hàng chưa được xếp.
@@ -1228,8 +2190,10 @@ def handle_remaining_integers_iteratively(final_unplaced_list, containers, next_
             while pallets_to_pack_in_new:
                 # Tạo một container mới cho công ty.
                 new_container = Container(container_id=f"C{next_container_id}", main_company=company)
-                print(f"  [+] Đang tạo container mới {new_container.id} cho công ty {company} để xử lý pallet thừa.")
+                log_unplaced.debug("  [+] Đang tạo container mới %s cho công ty %s để xử lý pallet thừa.", new_container.id, company)
                 containers.append(new_container)
+                if capacity is not None:
+                    capacity.add(new_container)
                 next_container_id += 1
                 
                 # Các pallet còn lại cho công ty này sau khi container mới này được lấp đầy.
@@ -1247,13 +2211,14 @@ def handle_remaining_integers_iteratively(final_unplaced_list, containers, next_
                     # Tìm các pallet ứng cử viên nhỏ hơn để so sánh.
                     candidate_pallets = [p for p in pallets_to_pack_in_new]
                     
-                    # Mô phỏng việc xếp một nhóm các pallet nhỏ hơn.
-                    sim_container = copy.deepcopy(new_container)
+                    # Mô phỏng việc xếp một nhóm các pallet nhỏ hơn (thử trên container thật rồi hoàn tác).
                     small_pallet_group = []
-                    for candidate in candidate_pallets:
-                        if sim_container.can_fit(candidate):
-                            sim_container.add_pallet(candidate)
-                            small_pallet_group.append(candidate)
+                    with ContainerTransaction([new_container]) as trial:
+                        for candidate in candidate_pallets:
+                            if new_container.can_fit(candidate):
+                                new_container.add_pallet(candidate)
+                                small_pallet_group.append(candidate)
+                        trial.rollback()
                     
                     # Kiểm tra xem nhóm pallet nhỏ hơn có phải là lựa chọn tốt hơn không.
                     group_is_better = (
@@ -1263,14 +2228,14 @@ def handle_remaining_integers_iteratively(final_unplaced_list, containers, next_
 
                     if group_is_better:
                         # Tạm hoãn pallet lớn và xếp nhóm nhỏ hơn vào thay thế.
-                        print(f"    -> (Chi phí cơ hội) Tạm hoãn {current_pallet.id}, xếp nhóm nhỏ hơn vào {new_container.id}.")
+                        log_unplaced.debug("    -> (Chi phí cơ hội) Tạm hoãn %s, xếp nhóm nhỏ hơn vào %s.", current_pallet.id, new_container.id)
                         temp_unplaced_list.append(current_pallet)
                         for p_small in small_pallet_group:
                             new_container.add_pallet(p_small)
                             pallets_to_pack_in_new.remove(p_small)
                     else:
                         # Xếp pallet lớn vì đó là lựa chọn tốt nhất.
-                        print(f"    -> Đang xếp {current_pallet.id} vào {new_container.id}.")
+                        log_unplaced.debug("    -> Đang xếp %s vào %s.", current_pallet.id, new_container.id)
                         new_container.add_pallet(current_pallet)
                 
                 # Cập nhật danh sách cho container mới tiềm năng tiếp theo của công ty này.
@@ -1281,45 +2246,61 @@ def handle_remaining_integers_iteratively(final_unplaced_list, containers, next_
 
         pallets_to_process = still_unplaced_after_new_cont
         if not pallets_to_process:
-            print("[THÔNG BÁO] Tất cả pallet đã được xếp sau khi tạo container mới.")
+            log_unplaced.debug("[THÔNG BÁO] Tất cả pallet đã được xếp sau khi tạo container mới.")
             break
 
         # --- BƯỚC 2: THỬ XẾP HÀNG ĐƠN GIẢN VÀO BẤT KỲ CONTAINER CÙNG CÔNG TY NÀO ---
-        print("\n  [BƯỚC 2] Thử xếp các pallet còn lại vào bất kỳ container nào cùng công ty...")
+        log_unplaced.info("  [BƯỚC 2] Thử xếp các pallet còn lại vào bất kỳ container nào cùng công ty...")
         pallets_to_process = try_pack_pallets_into_same_company_containers(pallets_to_process, containers)
         if not pallets_to_process:
-            print("[THÔNG BÁO] Tất cả pallet đã được xếp sau vòng xếp hàng đơn giản.")
+            log_unplaced.debug("[THÔNG BÁO] Tất cả pallet đã được xếp sau vòng xếp hàng đơn giản.")
             break
 
         # --- BƯỚC 3: ÁP DỤNG CHIA TÁCH THÔNG MINH VÀ XẾP CHÉO ---
-        print("\n  [BƯỚC 3] Áp dụng logic chia tách thông minh cho phần còn lại...")
-        pallets_to_process = handle_unplaced_pallets_with_smart_splitting(pallets_to_process, containers)
+        log_unplaced.info("  [BƯỚC 3] Áp dụng logic chia tách thông minh cho phần còn lại...")
+        pallets_to_process = handle_unplaced_pallets_with_smart_splitting(pallets_to_process, containers,
+                                                                          capacity=capacity)
         if not pallets_to_process:
-            print("[THÔNG BÁO] Tất cả pallet đã được xếp sau vòng chia tách thông minh.")
+            log_unplaced.debug("[THÔNG BÁO] Tất cả pallet đã được xếp sau vòng chia tách thông minh.")
             break
 
         # --- KIỂM TRA TIẾN ĐỘ ---
         # Nếu số lượng pallet không thay đổi sau một chu kỳ đầy đủ, chúng ta đang bị kẹt.
         if len(pallets_to_process) == initial_count:
-            print(f"[CẢNH BÁO] Không có tiến triển trong vòng lặp. Thoát vòng lặp để tránh lặp vô hạn. {len(pallets_to_process)} pallet vẫn chưa được xếp.")
+            log_unplaced.warning("[CẢNH BÁO] Không có tiến triển trong vòng lặp. Thoát vòng lặp để tránh lặp vô hạn. %s pallet vẫn chưa được xếp.", len(pallets_to_process))
             # Trong một kịch bản thực tế, bạn có thể có một phương án dự phòng cuối cùng ở đây,
             # chẳng hạn như buộc tạo thêm một container cho những pallet cuối cùng này.
             break
 
-    print("--- HOÀN TẤT QUY TRÌNH XỬ LÝ LẶP LẠI CUỐI CÙNG ---")
+    log_unplaced.info("--- HOÀN TẤT QUY TRÌNH XỬ LÝ LẶP LẠI CUỐI CÙNG ---")
     return containers, next_container_id
-def check_cross_ship_capacity_for_list(pallets_to_check, containers, unplaced_fractionals):
+def _free_capacity_excluding(containers, companies, capacity=None):
+    """(qty, trọng lượng) còn trống của các container có công ty chính không thuộc `companies`."""
+    if capacity is not None:
+        if DEBUG_CONTAINER_TOTALS:
+            capacity.check_members(containers)
+        free_qty, free_wgt, _ = capacity.free_excluding(companies)
+        return free_qty, free_wgt
+    other_company_containers = [c for c in containers if c.main_company not in companies]
+    return (sum(c.remaining_quantity for c in other_company_containers),
+            sum(c.remaining_weight for c in other_company_containers))
+
+
+def check_cross_ship_capacity_for_list(pallets_to_check, containers, unplaced_fractionals, capacity=None):
     """
     Kiểm tra xem TỔNG sức chứa còn lại của các container khác công ty
     có đủ để chứa TOÀN BỘ danh sách pallet chờ hay không.
 
     *** CẢI TIẾN: Sẽ không cross-ship pallet nguyên nếu vẫn còn BẤT KỲ pallet lẻ/gộp
     nào đang trong danh sách chờ (không phân biệt công ty). ***
+
+    capacity: CapacityAggregates đang theo dõi `containers` (nếu có) để lấy sức chứa còn trống
+    theo công ty thay vì cộng lại trên mọi container.
     """
     if not pallets_to_check:
         return True
 
-    print("\n--- BƯỚC: KIỂM TRA KHẢ NĂNG CROSS-SHIP TOÀN BỘ DANH SÁCH CHỜ (NGUYÊN) ---")
+    log_unplaced.info("--- BƯỚC: KIỂM TRA KHẢ NĂNG CROSS-SHIP TOÀN BỘ DANH SÁCH CHỜ (NGUYÊN) ---")
 
     # 1. Tính toán tổng yêu cầu từ danh sách chờ pallet nguyên
     total_qty_needed = sum(p.quantity for p in pallets_to_check)
@@ -1327,25 +2308,23 @@ def check_cross_ship_capacity_for_list(pallets_to_check, containers, unplaced_fr
     
     # 2. TÍNH NĂNG MỚI: Kiểm tra xem có BẤT KỲ pallet lẻ/gộp nào đang chờ không
     if unplaced_fractionals: # Chỉ cần kiểm tra xem danh sách có trống không
-        print("  - PHÁT HIỆN: Vẫn còn pallet lẻ/gộp trong danh sách chờ chung.")
-        print("  -> KẾT LUẬN: KHÔNG cross-ship pallet nguyên để ưu tiên gom hàng.")
+        log_unplaced.debug("  - PHÁT HIỆN: Vẫn còn pallet lẻ/gộp trong danh sách chờ chung.")
+        log_unplaced.debug("  -> KẾT LUẬN: KHÔNG cross-ship pallet nguyên để ưu tiên gom hàng.")
         return False # Ngăn chặn cross-ship
 
     # 3. Tính tổng sức chứa còn lại của các công ty KHÁC (nếu logic trên cho phép đi tiếp)
     companies_in_wait_list = set(p.company for p in pallets_to_check)
-    other_company_containers = [c for c in containers if c.main_company not in companies_in_wait_list]
-    total_rem_qty = sum(c.remaining_quantity for c in other_company_containers)
-    total_rem_wgt = sum(c.remaining_weight for c in other_company_containers)
+    total_rem_qty, total_rem_wgt = _free_capacity_excluding(containers, companies_in_wait_list, capacity)
     
-    print(f"  - Yêu cầu từ pallet nguyên: {total_qty_needed:.2f} qty | {total_wgt_needed:.2f} wgt")
-    print(f"  - Khả dụng ở các công ty khác: {total_rem_qty:.2f} qty | {total_rem_wgt:.2f} wgt")
+    log_unplaced.debug("  - Yêu cầu từ pallet nguyên: %.2f qty | %.2f wgt", total_qty_needed, total_wgt_needed)
+    log_unplaced.debug("  - Khả dụng ở các công ty khác: %.2f qty | %.2f wgt", total_rem_qty, total_rem_wgt)
 
     # 4. So sánh và trả về kết quả
     if total_rem_qty >= total_qty_needed and total_rem_wgt >= total_wgt_needed:
-        print("  -> KẾT LUẬN: Đủ khả năng cross-ship toàn bộ. Sẽ chuyển sang logic chia tách thông minh.")
+        log_unplaced.debug("  -> KẾT LUẬN: Đủ khả năng cross-ship toàn bộ. Sẽ chuyển sang logic chia tách thông minh.")
         return True
     else:
-        print("  -> KẾT LUẬN: Không đủ khả năng cross-ship. Sẽ đến bước chia tách thông minh để xếp vừa vào container có sẵn.")
+        log_unplaced.debug("  -> KẾT LUẬN: Không đủ khả năng cross-ship. Sẽ đến bước chia tách thông minh để xếp vừa vào container có sẵn.")
         return False
 def attempt_partial_cross_ship(unplaced_pallets, containers,unplaced_fractionals):
     """
@@ -1357,10 +2336,10 @@ def attempt_partial_cross_ship(unplaced_pallets, containers,unplaced_fractionals
        - Nếu BẤT KỲ pallet nào thất bại trong quá trình thực thi, toàn bộ hoạt động sẽ bị HỦY
          và trạng thái container được khôi phục.
     """
-    print("\n--- BƯỚC MỚI: THỬ CROSS-SHIP TỪNG PHẦN ĐỂ TỐI ƯU HÓA KHÔNG GIAN (All-or-Nothing) ---")
+    log_unplaced.info("--- BƯỚC MỚI: THỬ CROSS-SHIP TỪNG PHẦN ĐỂ TỐI ƯU HÓA KHÔNG GIAN (All-or-Nothing) ---")
     if unplaced_fractionals:
-        print("  - PHÁT HIỆN: Vẫn còn pallet lẻ/gộp trong danh sách chờ.")
-        print("  -> KẾT LUẬN: Bỏ qua bước cross-ship từng phần để ưu tiên xử lý pallet lẻ trước.")
+        log_unplaced.debug("  - PHÁT HIỆN: Vẫn còn pallet lẻ/gộp trong danh sách chờ.")
+        log_unplaced.debug("  -> KẾT LUẬN: Bỏ qua bước cross-ship từng phần để ưu tiên xử lý pallet lẻ trước.")
         return unplaced_pallets
     if not unplaced_pallets:
         return []
@@ -1370,9 +2349,8 @@ def attempt_partial_cross_ship(unplaced_pallets, containers,unplaced_fractionals
         """Kiểm tra xem một số lượng pallet có thể được xếp vào các container mục tiêu bằng cách chỉ sử dụng các phần nguyên không."""
         if qty_to_check < EPSILON: return True
         temp_qty_to_place = qty_to_check
-        # Tạo bản sao sâu của container để mô phỏng mà không thay đổi trạng thái thật
-        sim_containers = copy.deepcopy(target_containers)
-        sorted_containers = sorted(sim_containers, key=lambda c: c.remaining_quantity)
+        # Mỗi container chỉ được xét MỘT lần: chỉ cần trừ dần số lượng, không cần bản sao container
+        sorted_containers = sorted(target_containers, key=lambda c: c.remaining_quantity)
 
         for c in sorted_containers:
             if temp_qty_to_place < EPSILON: break
@@ -1386,10 +2364,6 @@ def attempt_partial_cross_ship(unplaced_pallets, containers,unplaced_fractionals
             if amount_to_place_here < 1.0 - EPSILON:
                 continue
 
-            # Cập nhật trạng thái container mô phỏng
-            c.total_quantity += amount_to_place_here
-            c.total_weight += amount_to_place_here * wpp
-            c.total_logical_pallets += math.ceil(amount_to_place_here)
             temp_qty_to_place -= amount_to_place_here
 
         return temp_qty_to_place < EPSILON
@@ -1417,7 +2391,7 @@ def attempt_partial_cross_ship(unplaced_pallets, containers,unplaced_fractionals
             if abs(remaining_part.quantity - fit_quantity) < EPSILON:
                 if container.can_fit(remaining_part):
                     container.add_pallet(remaining_part)
-                    print(f"       -> ({placement_type}) Đã xếp (toàn bộ) {remaining_part.id} vào container {container.id}")
+                    log_unplaced.debug("       -> (%s) Đã xếp (toàn bộ) %s vào container %s", placement_type, remaining_part.id, container.id)
                     remaining_part = None
                 continue
             else:
@@ -1425,13 +2399,13 @@ def attempt_partial_cross_ship(unplaced_pallets, containers,unplaced_fractionals
                     rest, piece_to_add = remaining_part.split(fit_quantity)
                     if piece_to_add and container.can_fit(piece_to_add):
                         container.add_pallet(piece_to_add)
-                        print(f"       -> ({placement_type}) Đã xếp (một phần) {piece_to_add.id} (qty: {piece_to_add.quantity:.0f}) vào cont {container.id}")
+                        log_unplaced.debug("       -> (%s) Đã xếp (một phần) %s (qty: %.0f) vào cont %s", placement_type, piece_to_add.id, piece_to_add.quantity, container.id)
                         remaining_part = rest
 
         return remaining_part is None or remaining_part.quantity < EPSILON
 
     # --- GIAI ĐOẠN 1: LẬP KẾ HOẠCH (KHÔNG THỰC THI) ---
-    print("   [PHASE 1] Lập kế hoạch tối ưu cho tất cả pallet chờ...")
+    log_unplaced.debug("   [PHASE 1] Lập kế hoạch tối ưu cho tất cả pallet chờ...")
     all_plans = []
     
     for pallet in unplaced_pallets:
@@ -1451,69 +2425,69 @@ def attempt_partial_cross_ship(unplaced_pallets, containers,unplaced_fractionals
                 break
         
         if best_plan["keep_qty"] == -1:
-            print(f"   [!] Không tìm thấy kế hoạch chia tách khả thi cho pallet {pallet.id}.")
-            print("   [!] HỦY BỎ TOÀN BỘ kế hoạch cross-ship từng phần. Sẽ chuyển sang tạo container mới.")
+            log_unplaced.debug("   [!] Không tìm thấy kế hoạch chia tách khả thi cho pallet %s.", pallet.id)
+            log_unplaced.debug("   [!] HỦY BỎ TOÀN BỘ kế hoạch cross-ship từng phần. Sẽ chuyển sang tạo container mới.")
             return unplaced_pallets
 
         all_plans.append(best_plan)
     
     # --- GIAI ĐOẠN 2: THỰC THI (All-or-Nothing) ---
-    print("   [PHASE 2] Tất cả pallet đều có kế hoạch khả thi. Bắt đầu thực thi...")
+    log_unplaced.debug("   [PHASE 2] Tất cả pallet đều có kế hoạch khả thi. Bắt đầu thực thi...")
     
-    # Tạo một bản sao lưu trạng thái của các container trước khi thực hiện bất kỳ thay đổi nào
-    containers_backup = copy.deepcopy(containers)
     execution_failed = False
     failed_pallet_id = None
 
     pallets_to_process_dict = {p.id: p for p in unplaced_pallets}
 
-    for plan in all_plans:
-        original_pallet = pallets_to_process_dict[plan['pallet'].id]
-        keep_qty = plan['keep_qty']
-        cross_qty = plan['cross_qty']
+    # Giao dịch bao toàn bộ giai đoạn thực thi (thay cho bản sao lưu deepcopy): lỗi giữa chừng
+    # (kể cả ngoại lệ) đều hoàn tác container về trạng thái trước khi thực thi
+    with ContainerTransaction(containers) as transaction:
+        for plan in all_plans:
+            original_pallet = pallets_to_process_dict[plan['pallet'].id]
+            keep_qty = plan['keep_qty']
+            cross_qty = plan['cross_qty']
         
-        print(f"   [*] Thực thi kế hoạch cho {original_pallet.id} (qty: {original_pallet.quantity:.0f}):")
-        print(f"       - Giữ lại: {keep_qty:.0f} | Chuyển đi: {cross_qty:.0f}")
+            log_unplaced.debug("   [*] Thực thi kế hoạch cho %s (qty: %.0f):", original_pallet.id, original_pallet.quantity)
+            log_unplaced.debug("       - Giữ lại: %.0f | Chuyển đi: %.0f", keep_qty, cross_qty)
+
+            own_company_containers = [c for c in containers if c.main_company == original_pallet.company]
+            other_company_containers = [c for c in containers if c.main_company != original_pallet.company]
+            part_to_keep, part_to_cross = None, None
 
-        own_company_containers = [c for c in containers if c.main_company == original_pallet.company]
-        other_company_containers = [c for c in containers if c.main_company != original_pallet.company]
-        part_to_keep, part_to_cross = None, None
+            if cross_qty < EPSILON:
+                part_to_keep = original_pallet
+            elif keep_qty < EPSILON:
+                part_to_cross = original_pallet
+            else:
+                # Sử dụng pallet gốc từ dict để chia tách
+                part_to_keep, part_to_cross = original_pallet.split(cross_qty)
+                if not part_to_keep or not part_to_cross:
+                    log_unplaced.error("   [LỖI] Lỗi khi chia pallet %s.", original_pallet.id)
+                    failed_pallet_id = original_pallet.id
+                    execution_failed = True
+                    break
+        
+            was_kept_placed = _place_pallet_iteratively(part_to_keep, own_company_containers, "Giữ lại")
+            was_cross_placed = _place_pallet_iteratively(part_to_cross, other_company_containers, "Chuyển đi")
 
-        if cross_qty < EPSILON:
-            part_to_keep = original_pallet
-        elif keep_qty < EPSILON:
-            part_to_cross = original_pallet
-        else:
-            # Sử dụng pallet gốc từ dict để chia tách
-            part_to_keep, part_to_cross = original_pallet.split(cross_qty)
-            if not part_to_keep or not part_to_cross:
-                print(f"   [LỖI] Lỗi khi chia pallet {original_pallet.id}.")
+            if not (was_kept_placed and was_cross_placed):
+                log_unplaced.error("   [LỖI] Không thể xếp toàn bộ các mảnh của pallet %s theo kế hoạch.", original_pallet.id)
                 failed_pallet_id = original_pallet.id
                 execution_failed = True
                 break
-        
-        was_kept_placed = _place_pallet_iteratively(part_to_keep, own_company_containers, "Giữ lại")
-        was_cross_placed = _place_pallet_iteratively(part_to_cross, other_company_containers, "Chuyển đi")
 
-        if not (was_kept_placed and was_cross_placed):
-            print(f"   [LỖI] Không thể xếp toàn bộ các mảnh của pallet {original_pallet.id} theo kế hoạch.")
-            failed_pallet_id = original_pallet.id
-            execution_failed = True
-            break
-            
+        if execution_failed:
+            # Khôi phục trạng thái container (và cờ is_cross_ship của pallet) từ nhật ký hoàn tác
+            transaction.rollback()
+
     # --- GIAI ĐOẠN 3: TỔNG KẾT ---
     if execution_failed:
-        print(f"   [!] HỦY BỎ: Do lỗi với pallet {failed_pallet_id}, toàn bộ hoạt động tối ưu hóa đã bị hủy.")
-        print("   [!] Khôi phục trạng thái container về trước khi thực thi.")
-        
-        # Khôi phục trạng thái container bằng cách xóa list hiện tại và điền lại từ bản sao lưu
-        containers.clear()
-        for c_backup in containers_backup:
-            containers.append(c_backup)
+        log_unplaced.debug("   [!] HỦY BỎ: Do lỗi với pallet %s, toàn bộ hoạt động tối ưu hóa đã bị hủy.", failed_pallet_id)
+        log_unplaced.debug("   [!] Đã khôi phục trạng thái container về trước khi thực thi.")
         
         # === BỔ SUNG KHẮC PHỤC LỖI ===
         # Reset lại cờ is_cross_ship cho các pallet đã bị thay đổi trong quá trình thử nghiệm thất bại.
-        print("   [!] Đang reset lại trạng thái cho các pallet bị ảnh hưởng...")
+        log_unplaced.debug("   [!] Đang reset lại trạng thái cho các pallet bị ảnh hưởng...")
         for p in unplaced_pallets:
             if p.is_cross_ship:
                 p.is_cross_ship = False
@@ -1522,10 +2496,11 @@ def attempt_partial_cross_ship(unplaced_pallets, containers,unplaced_fractionals
         # Trả về danh sách pallet chờ ban đầu đã được làm sạch
         return unplaced_pallets
     else:
-        print("   [THÀNH CÔNG] Hoàn tất tối ưu hóa. Tất cả pallet chờ đã được xử lý.")
+        log_unplaced.debug("   [THÀNH CÔNG] Hoàn tất tối ưu hóa. Tất cả pallet chờ đã được xử lý.")
         # Nếu thành công, tất cả pallet đã được xếp, trả về danh sách rỗng
         return []
-def create_and_pack_one_new_container(pallets_to_pack, containers, next_container_id, unplaced_fractionals):
+def create_and_pack_one_new_container(pallets_to_pack, containers, next_container_id, unplaced_fractionals,
+                                      capacity=None):
     """
     Tạo ra MỘT container mới và áp dụng logic tối ưu "chi phí cơ hội"
     (tái sử dụng từ hàm pack_integer_pallets) để xếp hàng vào đó.
@@ -1533,9 +2508,11 @@ def create_and_pack_one_new_container(pallets_to_pack, containers, next_containe
     LOGIC MỚI: Ưu tiên tạo container cho công ty có cả pallet nguyên và pallet lẻ/gộp
     đang trong danh sách chờ. Nếu không có, sẽ dùng logic cũ.
     
+    capacity: CapacityAggregates đang theo dõi `containers` (nếu có); container mới được thêm vào.
+
     Trả về danh sách những pallet vẫn không xếp được.
     """
-    print("\n--- BƯỚC: TẠO MỘT CONTAINER MỚI VÀ XẾP TỐI ƯU (LOGIC CHI PHÍ CƠ HỘI) ---")
+    log_unplaced.info("--- BƯỚC: TẠO MỘT CONTAINER MỚI VÀ XẾP TỐI ƯU (LOGIC CHI PHÍ CƠ HỘI) ---")
     if not pallets_to_pack and not unplaced_fractionals:
         return [], containers, next_container_id
 
@@ -1551,8 +2528,8 @@ def create_and_pack_one_new_container(pallets_to_pack, containers, next_containe
 
     # **ĐIỀU KIỆN ƯU TIÊN MỚI**
     if common_companies:
-        print("  [LOGIC ƯU TIÊN MỚI] Dựa trên các công ty có cả pallet nguyên và lẻ/gộp đang chờ.")
-        print(f"    -> Các công ty ứng viên: {', '.join(sorted(list(common_companies)))}")
+        log_unplaced.debug("  [LOGIC ƯU TIÊN MỚI] Dựa trên các công ty có cả pallet nguyên và lẻ/gộp đang chờ.")
+        log_unplaced.debug("    -> Các công ty ứng viên: %s", ', '.join(sorted(list(common_companies))))
         
         # Áp dụng logic cũ trên tập hợp các công ty chung này để chọn ra công ty tốt nhất
         # Ưu tiên 1: Công ty có tổng qty lẻ lớn nhất trong nhóm chung
@@ -1563,40 +2540,42 @@ def create_and_pack_one_new_container(pallets_to_pack, containers, next_containe
         
         if company_qty_sum:
             priority_company = max(company_qty_sum, key=company_qty_sum.get)
-            print(f"    -> Công ty '{priority_company}' được ưu tiên vì có tổng qty lẻ lớn nhất trong nhóm chung ({company_qty_sum[priority_company]:.2f} qty).")
+            log_unplaced.debug("    -> Công ty '%s' được ưu tiên vì có tổng qty lẻ lớn nhất trong nhóm chung (%.2f qty).", priority_company, company_qty_sum[priority_company])
         else: # Fallback hiếm gặp: có công ty chung nhưng không có pallet lẻ (phòng ngừa)
             company_counts = Counter(p.company for p in pallets_to_pack if p.company in common_companies)
             priority_company = company_counts.most_common(1)[0][0]
-            print(f"    -> Công ty '{priority_company}' được ưu tiên vì có nhiều pallet nguyên nhất trong nhóm chung.")
+            log_unplaced.debug("    -> Công ty '%s' được ưu tiên vì có nhiều pallet nguyên nhất trong nhóm chung.", priority_company)
 
     # **FALLBACK VỀ LOGIC CŨ**
     else:
-        print("  [LOGIC CŨ] Không có công ty nào xuất hiện đồng thời ở cả hai danh sách chờ. Áp dụng logic cũ.")
+        log_unplaced.debug("  [LOGIC CŨ] Không có công ty nào xuất hiện đồng thời ở cả hai danh sách chờ. Áp dụng logic cũ.")
         if unplaced_fractionals:
-            print("    -> Dựa trên tổng số lượng pallet lẻ/gộp đang chờ.")
+            log_unplaced.debug("    -> Dựa trên tổng số lượng pallet lẻ/gộp đang chờ.")
             company_qty_sum = defaultdict(float)
             for p in unplaced_fractionals:
                 company_qty_sum[p.company] += p.quantity
             
             if company_qty_sum:
                 priority_company = max(company_qty_sum, key=company_qty_sum.get)
-                print(f"    -> Công ty '{priority_company}' được ưu tiên vì có tổng số lượng pallet lẻ/gộp lớn nhất ({company_qty_sum[priority_company]:.2f} qty).")
+                log_unplaced.debug("    -> Công ty '%s' được ưu tiên vì có tổng số lượng pallet lẻ/gộp lớn nhất (%.2f qty).", priority_company, company_qty_sum[priority_company])
 
         if not priority_company and pallets_to_pack:
-            print("    -> Không có pallet lẻ/gộp. Dùng logic cũ dựa trên số lượng pallet nguyên.")
+            log_unplaced.debug("    -> Không có pallet lẻ/gộp. Dùng logic cũ dựa trên số lượng pallet nguyên.")
             company_counts = Counter(p.company for p in pallets_to_pack)
             priority_company = company_counts.most_common(1)[0][0]
-            print(f"    -> Công ty '{priority_company}' được ưu tiên vì có nhiều pallet nguyên nhất ({company_counts[priority_company]} pallet).")
+            log_unplaced.debug("    -> Công ty '%s' được ưu tiên vì có nhiều pallet nguyên nhất (%s pallet).", priority_company, company_counts[priority_company])
         
         elif not priority_company:
-            print("  [CẢNH BÁO] Không có pallet nào trong cả hai danh sách chờ để xác định công ty ưu tiên.")
+            log_unplaced.warning("  [CẢNH BÁO] Không có pallet nào trong cả hai danh sách chờ để xác định công ty ưu tiên.")
             return [], containers, next_container_id
     # --- KẾT THÚC LOGIC ƯU TIÊN ---
 
     # 2. Tạo container mới và thêm ngay vào danh sách container chung
     new_container = Container(container_id=f"C{next_container_id}", main_company=priority_company)
-    print(f"  [+] Đã tạo container mới {new_container.id} cho công ty ưu tiên '{priority_company}'.")
+    log_unplaced.debug("  [+] Đã tạo container mới %s cho công ty ưu tiên '%s'.", new_container.id, priority_company)
     containers.append(new_container)
+    if capacity is not None:
+        capacity.add(new_container)
     next_container_id += 1
     
     # 3. Tách pallet: chỉ tối ưu cho các pallet cùng công ty với container mới
@@ -1604,7 +2583,7 @@ def create_and_pack_one_new_container(pallets_to_pack, containers, next_containe
     other_company_pallets = [p for p in pallets_to_pack if p.company != priority_company]
 
     # 4. TÁI SỬ DỤNG LOGIC TỐI ƯU từ hàm pack_integer_pallets
-    print(f"  [*] Áp dụng logic 'chi phí cơ hội' để xếp {len(pallets_for_this_company)} pallet vào {new_container.id}...")
+    log_unplaced.debug("  [*] Áp dụng logic 'chi phí cơ hội' để xếp %s pallet vào %s...", len(pallets_for_this_company), new_container.id)
     
     _, unplaced_from_packing, _ = pack_integer_pallets(
         integer_pallets=pallets_for_this_company,
@@ -1615,11 +2594,11 @@ def create_and_pack_one_new_container(pallets_to_pack, containers, next_containe
     # 5. Tổng hợp lại danh sách chờ cuối cùng
     final_unplaced_list = unplaced_from_packing + other_company_pallets
 
-    print(f"\n  --- KẾT QUẢ XẾP VÀO CONTAINER MỚI ({new_container.id}) ---")
+    log_unplaced.info("  --- KẾT QUẢ XẾP VÀO CONTAINER MỚI (%s) ---", new_container.id)
     if not final_unplaced_list:
-         print(f"  [SUCCESS] Đã xếp thành công tất cả pallet chờ có liên quan của công ty ưu tiên.")
+         log_unplaced.debug("  [SUCCESS] Đã xếp thành công tất cả pallet chờ có liên quan của công ty ưu tiên.")
     else:
-         print(f"  [INFO] Còn lại {len(final_unplaced_list)} pallet không vừa, sẽ được giữ trong danh sách chờ.")
+         log_unplaced.debug("  [INFO] Còn lại %s pallet không vừa, sẽ được giữ trong danh sách chờ.", len(final_unplaced_list))
 
     return final_unplaced_list, containers, next_container_id
 # xử lí pallet trong danh sách chờ cùng công ty lẻ
@@ -1639,39 +2618,33 @@ def try_pack_unplaced_fractionals_same_company(unplaced_fractionals, containers)
         list[Pallet]: Danh sách các pallet vẫn không thể xếp được sau bước này,
                       sẽ được chuyển tiếp cho các hàm xử lý phức tạp hơn.
     """
-    print("\n--- BƯỚC: CỐ GẮNG XẾP NGUYÊN VẸN PALLET LẺ/GỘP VÀO CONT CÙNG CTY ---")
+    log_unplaced.info("--- BƯỚC: CỐ GẮNG XẾP NGUYÊN VẸN PALLET LẺ/GỘP VÀO CONT CÙNG CTY ---")
     
     # Danh sách để lưu những pallet thực sự không thể xếp được trong bước này
     still_unplaced = []
     
     # Sắp xếp các pallet cần xử lý từ lớn đến nhỏ để ưu tiên các pallet khó xếp nhất trước
     pallets_to_pack = sorted(unplaced_fractionals, key=lambda p: p.quantity, reverse=True)
+    container_index = ContainerIndex(containers)
 
     for pallet in pallets_to_pack:
         was_placed = False
         
-        # 1. Lọc ra những container tương thích (cùng công ty)
-        # 2. Sắp xếp chúng để ưu tiên container gần đầy nhất (Best-Fit)
-        compatible_containers = sorted(
-            [c for c in containers if c.main_company == pallet.company],
-            key=lambda c: c.remaining_quantity
-        )
-        
-        # 3. Duyệt qua các container phù hợp để tìm chỗ
-        for container in compatible_containers:
-            if container.can_fit(pallet):
-                # Nếu vừa, thêm vào, đánh dấu và chuyển sang pallet tiếp theo
-                container.add_pallet(pallet)
-                print(f"  [+] (Xếp đơn giản) Đã xếp pallet lẻ/gộp '{pallet.id}' vào container có sẵn {container.id}.")
-                was_placed = True
-                break
+        # 1-3. Container cùng công ty gần đầy nhất còn chứa được pallet (Best-Fit, tra qua chỉ mục)
+        container = container_index.best_fit(pallet, company=pallet.company)
+        if container is not None:
+            # Nếu vừa, thêm vào, đánh dấu và chuyển sang pallet tiếp theo
+            container.add_pallet(pallet)
+            log_unplaced.debug("  [+] (Xếp đơn giản) Đã xếp pallet lẻ/gộp '%s' vào container có sẵn %s.", pallet.id, container.id)
+            was_placed = True
         
         # 4. Nếu duyệt hết mà vẫn không xếp được
         if not was_placed:
-            print(f"  [-] (Không vừa) Pallet '{pallet.id}' không tìm được chỗ, sẽ chuyển sang giai đoạn lắp ghép.")
+            log_unplaced.debug("  [-] (Không vừa) Pallet '%s' không tìm được chỗ, sẽ chuyển sang giai đoạn lắp ghép.", pallet.id)
             still_unplaced.append(pallet)
+    container_index.close()
 
-    print(f"--- KẾT THÚC: Còn lại {len(still_unplaced)} pallet cần xử lý lắp ghép phức tạp hơn. ---")
+    log_unplaced.info("--- KẾT THÚC: Còn lại %s pallet cần xử lý lắp ghép phức tạp hơn. ---", len(still_unplaced))
     return still_unplaced
 def repack_unplaced_pallets(unplaced_pallets, containers):
     """
@@ -1679,9 +2652,9 @@ def repack_unplaced_pallets(unplaced_pallets, containers):
     đã có sẵn trong các container, ưu tiên cùng công ty.
     *** PHIÊN BẢN CẢI TIẾN: Đảm bảo an toàn 100% về các giới hạn của container. ***
     """
-    print("\n--- BẮT ĐẦU GIAI ĐOẠN LẮP GHÉP VÀO CÁC PALLET GHÉP LẺ CÙNG CÔNG TY ---")
+    log_unplaced.info("--- BẮT ĐẦU GIAI ĐOẠN LẮP GHÉP VÀO CÁC PALLET GHÉP LẺ CÙNG CÔNG TY ---")
     if not unplaced_pallets:
-        print("Không có pallet nào cần xử lý. Hoàn tất.")
+        log_unplaced.debug("Không có pallet nào cần xử lý. Hoàn tất.")
         return []
 
     final_leftovers = []
@@ -1690,7 +2663,7 @@ def repack_unplaced_pallets(unplaced_pallets, containers):
     unplaced_singles = [p for p in unplaced_pallets if not p.is_combined]
 
     # --- BƯỚC 1: XỬ LÝ CÁC PALLET GHÉP CHƯA ĐƯỢC XẾP ---
-    print(f"\n[PHASE 1] Xử lý {len(unplaced_combined)} pallet GHÉP trong danh sách chờ...")
+    log_unplaced.debug("[PHASE 1] Xử lý %s pallet GHÉP trong danh sách chờ...", len(unplaced_combined))
     for combined_pallet in unplaced_combined:
         sub_pallets_to_place = list(combined_pallet.original_pallets)
         successfully_placed_all_sub_pallets = True
@@ -1722,7 +2695,7 @@ def repack_unplaced_pallets(unplaced_pallets, containers):
                     if num_dominant > 1:
                         continue
 
-                    print(f"  [+] LẮP GHÉP: Mảnh {sub_pallet.id} (từ {combined_pallet.id}) vào Pallet {target_pallet.id} trong Cont {container.id}")
+                    log_unplaced.debug("  [+] LẮP GHÉP: Mảnh %s (từ %s) vào Pallet %s trong Cont %s", sub_pallet.id, combined_pallet.id, target_pallet.id, container.id)
                     
                     target_pallet.original_pallets.append(sub_pallet)
                     target_pallet.is_combined = True
@@ -1736,17 +2709,17 @@ def repack_unplaced_pallets(unplaced_pallets, containers):
 
             if not was_sub_pallet_placed:
                 successfully_placed_all_sub_pallets = False
-                print(f"  [-] KHÔNG THỂ LẮP: Mảnh {sub_pallet.id} (từ {combined_pallet.id}) không tìm được chỗ.")
+                log_unplaced.debug("  [-] KHÔNG THỂ LẮP: Mảnh %s (từ %s) không tìm được chỗ.", sub_pallet.id, combined_pallet.id)
                 break
 
         if successfully_placed_all_sub_pallets:
             placed_original_pallets.add(combined_pallet)
-            print(f"  [OK] Đã lắp ghép thành công TẤT CẢ các mảnh của {combined_pallet.id}.")
+            log_unplaced.debug("  [OK] Đã lắp ghép thành công TẤT CẢ các mảnh của %s.", combined_pallet.id)
         else:
             final_leftovers.append(combined_pallet)
 
     # --- BƯỚC 2: XỬ LÝ CÁC PALLET LẺ CHƯA ĐƯỢC XẾP ---
-    print(f"\n[PHASE 2] Xử lý {len(unplaced_singles)} pallet LẺ trong danh sách chờ...")
+    log_unplaced.debug("[PHASE 2] Xử lý %s pallet LẺ trong danh sách chờ...", len(unplaced_singles))
     for single_pallet in unplaced_singles:
         was_placed = False
         for container in [c for c in containers if c.main_company == single_pallet.company]:
@@ -1770,7 +2743,7 @@ def repack_unplaced_pallets(unplaced_pallets, containers):
                 if num_dominant > 1:
                     continue
 
-                print(f"  [+] LẮP GHÉP: Pallet lẻ {single_pallet.id} vào Pallet {target_pallet.id} trong Cont {container.id}")
+                log_unplaced.debug("  [+] LẮP GHÉP: Pallet lẻ %s vào Pallet %s trong Cont %s", single_pallet.id, target_pallet.id, container.id)
                 
                 target_pallet.original_pallets.append(single_pallet)
                 target_pallet.is_combined = True
@@ -1784,10 +2757,10 @@ def repack_unplaced_pallets(unplaced_pallets, containers):
         
         if not was_placed:
             final_leftovers.append(single_pallet)
-            print(f"  [-] KHÔNG THỂ LẮP: Pallet lẻ {single_pallet.id} không tìm được chỗ.")
+            log_unplaced.debug("  [-] KHÔNG THỂ LẮP: Pallet lẻ %s không tìm được chỗ.", single_pallet.id)
 
-    print("\n--- HOÀN THÀNH GIAI ĐOẠN LẮP GHÉP NÂNG CAO ---")
-    print(f"Tổng kết: {len(placed_original_pallets)} pallet gốc đã được xếp. Còn lại: {len(final_leftovers)} pallet.")
+    log_unplaced.info("--- HOÀN THÀNH GIAI ĐOẠN LẮP GHÉP NÂNG CAO ---")
+    log_unplaced.info("Tổng kết: %s pallet gốc đã được xếp. Còn lại: %s pallet.", len(placed_original_pallets), len(final_leftovers))
     return final_leftovers
 
 def split_and_fit_leftovers(leftover_pallets, containers, next_container_id):
@@ -1798,9 +2771,9 @@ def split_and_fit_leftovers(leftover_pallets, containers, next_container_id):
       pallet gộp không thể xếp được tất cả các mảnh của nó, toàn bộ quá trình sẽ
       dừng lại và trả về các pallet còn lại.
     """
-    print("\n--- BẮT ĐẦU GIAI ĐOẠN LẮP GHÉP KHÁC CÔNG TY (LOGIC 2 GIAI ĐOẠN) ---")
+    log_unplaced.info("--- BẮT ĐẦU GIAI ĐOẠN LẮP GHÉP KHÁC CÔNG TY (LOGIC 2 GIAI ĐOẠN) ---")
     if not leftover_pallets:
-        print("   Không có pallet nào cần xử lý. Hoàn tất.")
+        log_unplaced.debug("   Không có pallet nào cần xử lý. Hoàn tất.")
         return containers, next_container_id, []
 
     # Tách danh sách chờ ban đầu
@@ -1810,7 +2783,7 @@ def split_and_fit_leftovers(leftover_pallets, containers, next_container_id):
     pallets_still_unplaced = []
 
     # --- GIAI ĐOẠN 1: XỬ LÝ CÁC PALLET LẺ ĐƠN LẺ ---
-    print(f"\n[PHASE 1] Thử ghép chéo {len(unplaced_singles)} pallet LẺ đơn lẻ...")
+    log_unplaced.debug("[PHASE 1] Thử ghép chéo %s pallet LẺ đơn lẻ...", len(unplaced_singles))
     
     for single_pallet in sorted(unplaced_singles, key=lambda p: p.quantity, reverse=True):
         was_placed = False
@@ -1845,7 +2818,7 @@ def split_and_fit_leftovers(leftover_pallets, containers, next_container_id):
                     target_pallet.original_pallets = [original_target_copy]
                 # --- KẾT THÚC SỬA LỖI ---
                 
-                print(f"  [+] (Phase 1) Lắp ghép pallet lẻ {single_pallet.id} vào Pallet {target_pallet.id} trong Cont {container.id}")
+                log_unplaced.debug("  [+] (Phase 1) Lắp ghép pallet lẻ %s vào Pallet %s trong Cont %s", single_pallet.id, target_pallet.id, container.id)
                 
                 target_pallet.original_pallets.append(single_pallet)
                 target_pallet.is_combined = True
@@ -1866,65 +2839,69 @@ def split_and_fit_leftovers(leftover_pallets, containers, next_container_id):
         if not was_placed:
             pallets_still_unplaced.append(single_pallet)
 
-    print(f"   -> Kết thúc Phase 1. Còn lại {len(pallets_still_unplaced)} pallet lẻ chưa được xếp.")
+    log_unplaced.debug("   -> Kết thúc Phase 1. Còn lại %s pallet lẻ chưa được xếp.", len(pallets_still_unplaced))
 
     # --- GIAI ĐOẠN 2: XỬ LÝ CÁC PALLET GỘP (VÀ CÁC PALLET LẺ CÒN SÓT LẠI) ---
     pallets_for_phase_2 = unplaced_combined + pallets_still_unplaced
     if not pallets_for_phase_2:
-        print("\n[PHASE 2] Không còn pallet nào để xử lý. Hoàn tất.")
+        log_unplaced.debug("[PHASE 2] Không còn pallet nào để xử lý. Hoàn tất.")
         return containers, next_container_id, []
 
-    print(f"\n[PHASE 2] Thử lắp ghép {len(pallets_for_phase_2)} pallet gộp/còn lại (All-or-Nothing)...")
+    log_unplaced.debug("[PHASE 2] Thử lắp ghép %s pallet gộp/còn lại (All-or-Nothing)...", len(pallets_for_phase_2))
     
     for i, combined_pallet in enumerate(pallets_for_phase_2):
-        print(f"\n   [*] Đang xử lý pallet: {combined_pallet.id} (gồm {len(combined_pallet.original_pallets)} mảnh)")
+        log_unplaced.debug("   [*] Đang xử lý pallet: %s (gồm %s mảnh)", combined_pallet.id, len(combined_pallet.original_pallets))
         
-        sim_containers = copy.deepcopy(containers)
         placement_plan = []
         all_sub_pallets_planned = True
         
         sub_pallets_to_plan = sorted(combined_pallet.original_pallets, key=lambda p: p.quantity, reverse=True)
         
-        for sub_pallet in sub_pallets_to_plan:
-            was_sub_planned = False
-            
-            for sim_container in sim_containers:
-                for sim_target_pallet in [p for p in sim_container.pallets if p.quantity < 1.0 - EPSILON]:
-                    
-                    if sim_container.total_weight + sub_pallet.total_weight > MAX_WEIGHT + EPSILON:
-                        continue
-                    
-                    potential_list = sim_target_pallet.original_pallets + [sub_pallet]
-                    potential_qty = sum(p.quantity for p in potential_list)
-                    if potential_qty > 0.9 + EPSILON:
-                        continue
-                    
-                    num_dominant = sum(1 for p in potential_list if p.quantity >= (potential_qty / 2.0) - EPSILON)
-                    if num_dominant > 1:
-                        continue
+        # Lập kế hoạch ngay trên container thật trong một giao dịch, hoàn tác khi xong
+        # (thay cho deepcopy toàn bộ container cho mỗi pallet gộp)
+        with ContainerTransaction(containers) as planning:
+            for sub_pallet in sub_pallets_to_plan:
+                was_sub_planned = False
+                
+                for sim_container in containers:
+                    for sim_target_pallet in [p for p in sim_container.pallets if p.quantity < 1.0 - EPSILON]:
+                        
+                        if sim_container.total_weight + sub_pallet.total_weight > MAX_WEIGHT + EPSILON:
+                            continue
+                        
+                        potential_list = sim_target_pallet.original_pallets + [sub_pallet]
+                        potential_qty = sum(p.quantity for p in potential_list)
+                        if potential_qty > 0.9 + EPSILON:
+                            continue
+                        
+                        num_dominant = sum(1 for p in potential_list if p.quantity >= (potential_qty / 2.0) - EPSILON)
+                        if num_dominant > 1:
+                            continue
 
-                    placement_plan.append({'sub_pallet_id': sub_pallet.id, 'target_pallet_id': sim_target_pallet.id})
-                    
-                    sim_target_pallet.original_pallets.append(sub_pallet)
-                    sim_container._recalculate_totals() 
-                    
-                    was_sub_planned = True
-                    break
-                if was_sub_planned:
+                        placement_plan.append({'sub_pallet_id': sub_pallet.id, 'target_pallet_id': sim_target_pallet.id})
+                        
+                        # Danh sách mới (không sửa danh sách cũ tại chỗ) để hoàn tác chỉ cần gán lại
+                        planning.set_attr(sim_target_pallet, 'original_pallets', potential_list)
+                        sim_container._recalculate_totals() 
+                        
+                        was_sub_planned = True
+                        break
+                    if was_sub_planned:
+                        break
+                
+                if not was_sub_planned:
+                    all_sub_pallets_planned = False
                     break
-            
-            if not was_sub_planned:
-                all_sub_pallets_planned = False
-                break
+            planning.rollback()
         
         if all_sub_pallets_planned:
-            print(f"   [OK] Lên kế hoạch thành công cho {combined_pallet.id}. Bắt đầu thực thi...")
+            log_unplaced.debug("   [OK] Lên kế hoạch thành công cho %s. Bắt đầu thực thi...", combined_pallet.id)
             for action in placement_plan:
                 sub_p = next(p for p in combined_pallet.original_pallets if p.id == action['sub_pallet_id'])
-                target_p = next((p for c in containers for p in c.pallets if p.id == action['target_pallet_id']), None)
+                container_to_update = next((c for c in containers if c.has_pallet(action['target_pallet_id'])), None)
+                target_p = container_to_update.get_pallet(action['target_pallet_id']) if container_to_update else None
                 
                 if target_p:
-                    container_to_update = next(c for c in containers if target_p in c.pallets)
                     
                     # --- BẮT ĐẦU SỬA LỖI (Lần 2, cho Giai đoạn 2) ---
                     if not target_p.is_combined:
@@ -1933,7 +2910,7 @@ def split_and_fit_leftovers(leftover_pallets, containers, next_container_id):
                         target_p.original_pallets = [original_target_copy]
                     # --- KẾT THÚC SỬA LỖI ---
                     
-                    print(f"      -> Ghép mảnh {sub_p.id} vào Pallet {target_p.id} trong Cont {container_to_update.id}")
+                    log_unplaced.debug("      -> Ghép mảnh %s vào Pallet %s trong Cont %s", sub_p.id, target_p.id, container_to_update.id)
                     
                     target_p.original_pallets.append(sub_p)
                     target_p.is_combined = True
@@ -1944,20 +2921,21 @@ def split_and_fit_leftovers(leftover_pallets, containers, next_container_id):
                         target_p.product_name = f"COMBINED ({len(target_p.original_pallets)} items)"
 
                     container_to_update._recalculate_totals()
-            print(f"   [SUCCESS] Đã thực thi xong kế hoạch cho {combined_pallet.id}.")
+            log_unplaced.debug("   [SUCCESS] Đã thực thi xong kế hoạch cho %s.", combined_pallet.id)
 
         else:
-            print(f"   [FAILURE] Không thể tìm được chỗ cho tất cả các mảnh của {combined_pallet.id}.")
-            print("   -> DỪNG bước lắp ghép và chuyển các pallet còn lại sang bước Cross-Ship.")
+            log_unplaced.debug("   [FAILURE] Không thể tìm được chỗ cho tất cả các mảnh của %s.", combined_pallet.id)
+            log_unplaced.debug("   -> DỪNG bước lắp ghép và chuyển các pallet còn lại sang bước Cross-Ship.")
             
             final_unplaced_list = pallets_for_phase_2[i:]
             return containers, next_container_id, final_unplaced_list
 
-    print("\n--- HOÀN THÀNH GIAI ĐOẠN LẮP GHÉP ---")
-    print("   Tất cả pallet trong danh sách chờ đã được lắp ghép thành công.")
+    log_unplaced.info("--- HOÀN THÀNH GIAI ĐOẠN LẮP GHÉP ---")
+    log_unplaced.debug("   Tất cả pallet trong danh sách chờ đã được lắp ghép thành công.")
     return containers, next_container_id, []
 ### CROSS SHIP 
-def cross_ship_remaining_pallets(unplaced_pallets, containers, next_container_id, unplaced_integer_pallets):
+def cross_ship_remaining_pallets(unplaced_pallets, containers, next_container_id, unplaced_integer_pallets,
+                                 capacity=None):
     """
     SỬA ĐỔI: Xử lý pallet lẻ/gộp cuối cùng với logic điều kiện nghiêm ngặt.
     1. KIỂM TRA ƯU TIÊN: Nếu còn pallet NGUYÊN đang chờ, hàm sẽ dừng ngay lập tức
@@ -1968,53 +2946,54 @@ def cross_ship_remaining_pallets(unplaced_pallets, containers, next_container_id
        - NẾU ĐỦ NĂNG LỰC: Tiến hành cross-ship toàn bộ danh sách (xếp đơn giản và lắp ghép).
        - NẾU KHÔNG ĐỦ: Chỉ tạo MỘT container mới cho pallet lớn nhất trong danh sách,
          phần còn lại sẽ được đưa vào danh sách chờ cho vòng lặp lớn tiếp theo.
+    capacity: CapacityAggregates đang theo dõi `containers` (nếu có), dùng cho bước 2;
+              container mới được thêm vào.
     """
-    print("\n--- BẮT ĐẦU GIAI ĐOẠN CUỐI: CROSS-SHIP CÓ ĐIỀU KIỆN HOẶC TẠO CONT MỚI ---")
+    log_unplaced.info("--- BẮT ĐẦU GIAI ĐOẠN CUỐI: CROSS-SHIP CÓ ĐIỀU KIỆN HOẶC TẠO CONT MỚI ---")
     if not unplaced_pallets:
-        print("   Không có pallet lẻ/gộp nào cần xử lý. Hoàn tất.")
+        log_unplaced.debug("   Không có pallet lẻ/gộp nào cần xử lý. Hoàn tất.")
         return [], next_container_id
 
     # --- BƯỚC 1: KIỂM TRA ƯU TIÊN (ĐIỀU KIỆN DỪNG) ---
     if unplaced_integer_pallets:
-        print("   [ƯU TIÊN] Phát hiện còn pallet NGUYÊN đang chờ.")
-        print("   -> Tạm dừng cross-ship pallet lẻ để vòng lặp lớn xử lý pallet nguyên trước.")
+        log_unplaced.debug("   [ƯU TIÊN] Phát hiện còn pallet NGUYÊN đang chờ.")
+        log_unplaced.debug("   -> Tạm dừng cross-ship pallet lẻ để vòng lặp lớn xử lý pallet nguyên trước.")
         # Trả về danh sách pallet lẻ y nguyên, không xử lý gì cả
         return unplaced_pallets, next_container_id
 
     # --- BƯỚC 2: KIỂM TRA NĂNG LỰC CROSS-SHIP TOÀN BỘ ---
-    print("   [*] Không có pallet nguyên nào đang chờ. Đánh giá năng lực cross-ship...")
+    log_unplaced.debug("   [*] Không có pallet nguyên nào đang chờ. Đánh giá năng lực cross-ship...")
     # Tính toán tổng yêu cầu từ danh sách chờ
     total_qty_needed = sum(p.quantity for p in unplaced_pallets)
     total_wgt_needed = sum(p.total_weight for p in unplaced_pallets)
 
     # Tính tổng sức chứa còn lại của các container khác công ty
     companies_in_wait_list = set(p.company for p in unplaced_pallets)
-    other_company_containers = [c for c in containers if c.main_company not in companies_in_wait_list]
-    total_rem_qty = sum(c.remaining_quantity for c in other_company_containers)
-    total_rem_wgt = sum(c.remaining_weight for c in other_company_containers)
+    total_rem_qty, total_rem_wgt = _free_capacity_excluding(containers, companies_in_wait_list, capacity)
 
-    print(f"   - Yêu cầu từ pallet lẻ/gộp: {total_qty_needed:.2f} qty | {total_wgt_needed:.2f} wgt")
-    print(f"   - Khả dụng ở các công ty khác: {total_rem_qty:.2f} qty | {total_rem_wgt:.2f} wgt")
+    log_unplaced.debug("   - Yêu cầu từ pallet lẻ/gộp: %.2f qty | %.2f wgt", total_qty_needed, total_wgt_needed)
+    log_unplaced.debug("   - Khả dụng ở các công ty khác: %.2f qty | %.2f wgt", total_rem_qty, total_rem_wgt)
 
     # --- BƯỚC 3: RA QUYẾT ĐỊNH ---
     # NẾU CÓ THỂ CHỨA HẾT -> TIẾN HÀNH CROSS-SHIP
     if total_rem_qty >= total_qty_needed and total_rem_wgt >= total_wgt_needed:
-        print("   [QUYẾT ĐỊNH] Đủ năng lực. Tiến hành cross-ship TOÀN BỘ danh sách chờ.")
+        log_unplaced.debug("   [QUYẾT ĐỊNH] Đủ năng lực. Tiến hành cross-ship TOÀN BỘ danh sách chờ.")
         
         # Tái sử dụng logic cross-ship chi tiết từ hàm gốc (xếp đơn giản + lắp ghép)
         # Mục tiêu là xếp hết tất cả pallet trong `unplaced_pallets`
         pallets_to_process = list(unplaced_pallets)
         still_unplaced_after_cross_ship = []
+        other_company_containers = [c for c in containers if c.main_company not in companies_in_wait_list]
 
         # Logic xếp đơn giản
         placed_pallets = set()
-        for pallet in sorted(pallets_to_process, key=lambda p: p.quantity, reverse=True):
-            for container in sorted(other_company_containers, key=lambda c: c.remaining_quantity):
-                if container.can_fit(pallet):
+        with ContainerIndex(other_company_containers) as other_company_index:
+            for pallet in sorted(pallets_to_process, key=lambda p: p.quantity, reverse=True):
+                container = other_company_index.best_fit(pallet)
+                if container is not None:
                     container.add_pallet(pallet)
                     placed_pallets.add(pallet)
-                    print(f"     [+] CROSS-SHIP (Đơn giản): Pallet {pallet.id} -> Cont {container.id}")
-                    break
+                    log_unplaced.debug("     [+] CROSS-SHIP (Đơn giản): Pallet %s -> Cont %s", pallet.id, container.id)
         
         pallets_to_repack = [p for p in pallets_to_process if p not in placed_pallets]
 
@@ -2030,7 +3009,7 @@ def cross_ship_remaining_pallets(unplaced_pallets, containers, next_container_id
                      if container.can_fit(pallet):
                         container.add_pallet(pallet)
                         was_placed = True
-                        print(f"     [+] CROSS-SHIP (Lắp ghép): Pallet {pallet.id} -> Cont {container.id}")
+                        log_unplaced.debug("     [+] CROSS-SHIP (Lắp ghép): Pallet %s -> Cont %s", pallet.id, container.id)
                         break
                 if was_placed:
                     break
@@ -2038,13 +3017,13 @@ def cross_ship_remaining_pallets(unplaced_pallets, containers, next_container_id
                  still_unplaced_after_cross_ship.append(pallet)
 
         if still_unplaced_after_cross_ship:
-             print(f"   [CẢNH BÁO] Mặc dù đủ năng lực nhưng {len(still_unplaced_after_cross_ship)} pallet không thể xếp được do phân mảnh.")
+             log_unplaced.warning("   [CẢNH BÁO] Mặc dù đủ năng lực nhưng %s pallet không thể xếp được do phân mảnh.", len(still_unplaced_after_cross_ship))
         
         return still_unplaced_after_cross_ship, next_container_id
 
     # NẾU KHÔNG THỂ CHỨA HẾT -> TẠO CONTAINER MỚI CHO PALLET LỚN NHẤT
     else:
-        print("   [QUYẾT ĐỊNH] Không đủ năng lực. Tạo container mới cho pallet lớn nhất.")
+        log_unplaced.debug("   [QUYẾT ĐỊNH] Không đủ năng lực. Tạo container mới cho pallet lớn nhất.")
         
         # Sắp xếp để tìm pallet lớn nhất
         sorted_pallets = sorted(unplaced_pallets, key=lambda p: p.quantity, reverse=True)
@@ -2061,14 +3040,16 @@ def cross_ship_remaining_pallets(unplaced_pallets, containers, next_container_id
         new_container.add_pallet(pallet_to_place)
         # Thêm container mới vào danh sách container chung
         containers.append(new_container)
+        if capacity is not None:
+            capacity.add(new_container)
         
-        print(f"   [+] Đã tạo và xếp vào container MỚI {new_container.id} cho pallet {pallet_to_place.id}")
+        log_unplaced.debug("   [+] Đã tạo và xếp vào container MỚI %s cho pallet %s", new_container.id, pallet_to_place.id)
         
         # Cập nhật ID cho lần tạo tiếp theo
         next_container_id += 1
         
         # Trả về phần còn lại của danh sách chờ và ID container đã cập nhật
-        print(f"   -> {len(sorted_pallets)} pallet còn lại sẽ chờ vòng lặp lớn tiếp theo.")
+        log_unplaced.debug("   -> %s pallet còn lại sẽ chờ vòng lặp lớn tiếp theo.", len(sorted_pallets))
         return sorted_pallets, next_container_id
     
 # ==============================================================================
@@ -2086,6 +3067,8 @@ def calculate_max_fit(pallet, container):
     Tính toán số lượng tối đa của pallet có thể nhét vào container
     dựa trên cả TRỌNG LƯỢNG và SỐ DÒNG.
     """
+    if FIXED_POINT_CAPACITY:
+        return _calculate_max_fit_fixed(pallet, container)
     # 1. Giới hạn theo dòng (Lines)
     # Lưu ý: Với pallet nguyên, 1 qty = 1 dòng. Với pallet lẻ, 1 qty (<=1) = 1 dòng.
     remaining_lines = MAX_PALLETS - container.total_logical_pallets
@@ -2113,11 +3096,36 @@ def calculate_max_fit(pallet, container):
 
     return max(0.0, actual_fit)
 
+
+def _calculate_max_fit_fixed(pallet, container):
+    """calculate_max_fit với số nguyên (phần nghìn pallet, gam): cùng các giới hạn, không cần sai số."""
+    remaining_lines = MAX_PALLETS - container.total_logical_pallets
+    if remaining_lines <= 0:
+        return 0.0
+
+    is_whole = pallet.quantity_units >= QUANTITY_SCALE
+    max_units = pallet.quantity_units
+    max_units = min(max_units, int(remaining_lines) * QUANTITY_SCALE if is_whole else QUANTITY_SCALE)
+
+    weight_per_pallet_units = to_weight_units(pallet.weight_per_pallet)
+    if weight_per_pallet_units > 0:
+        remaining_weight_units = MAX_WEIGHT_UNITS - container.total_weight_units
+        max_units = min(max_units, remaining_weight_units * QUANTITY_SCALE // weight_per_pallet_units)
+
+    if is_whole:
+        max_units -= max_units % QUANTITY_SCALE
+    if max_units <= 0:
+        return 0.0
+    # Vừa cả pallet: trả đúng số lượng gốc để nơi gọi không tách ra phần dư do làm tròn
+    if max_units == pallet.quantity_units:
+        return pallet.quantity
+    return max_units / QUANTITY_SCALE
+
 # ==============================================================================
 # PHASE 5.1: OVERFLOW FIXER (CỨU HỘ CONTAINER BỊ NỔ)
 # ==============================================================================
 
-def fix_container_overflows(containers):
+def fix_container_overflows(containers, kernel=None):
     """
     Duyệt qua tất cả container, nếu cái nào bị quá dòng (>20) hoặc quá cân (>24000),
     lập tức đẩy bớt hàng sang các container còn trống.
@@ -2125,20 +3133,29 @@ def fix_container_overflows(containers):
     LOGIC SỬA ĐỔI:
     - Nếu là Pallet Nguyên (Qty >= 1): Được phép tách ra các phần NGUYÊN để chuyển (ví dụ 5 -> chuyển 2, giữ 3).
     - Nếu là Pallet Lẻ/Gộp (Qty < 1 hoặc is_combined): KHÔNG ĐƯỢC TÁCH. Chỉ được chuyển nếu target chứa được TOÀN BỘ.
+
+    kernel: ContainerFitKernel dựng trên đúng danh sách `containers` (nếu nơi gọi đã có).
     """
+    if kernel is None:
+        if not any(c.total_logical_pallets > MAX_PALLETS or c.total_weight > MAX_WEIGHT for c in containers):
+            return False
+        with ContainerFitKernel(containers) as kernel:
+            return fix_container_overflows(containers, kernel)
+
     has_action = False
     
     # Tìm các container bị lỗi (Source) và các container còn chỗ (Target)
-    overloaded_conts = [c for c in containers if c.total_logical_pallets > MAX_PALLETS or c.total_weight > MAX_WEIGHT]
+    overloaded = kernel.overloaded_mask()
     
-    if not overloaded_conts:
+    if not overloaded.any():
         return False
 
-    print("   [FIX] >>> Phát hiện Container bị quá tải. Đang tiến hành cân bằng lại...")
+    log_waste.debug("   [FIX] >>> Phát hiện Container bị quá tải. Đang tiến hành cân bằng lại...")
+    overloaded_conts = [kernel.containers[i] for i in np.flatnonzero(overloaded)]
 
     # Sắp xếp target: Ưu tiên thằng nào còn nhiều dòng trống nhất
-    available_targets = [c for c in containers if c not in overloaded_conts]
-    available_targets.sort(key=lambda c: c.remaining_logical_pallets, reverse=True)
+    target_positions = np.flatnonzero(~overloaded)
+    target_positions = target_positions[np.argsort(-kernel.remaining_lines[target_positions], kind='stable')]
 
     for source in overloaded_conts:
         # Lấy các pallet ra để chuyển đi. Ưu tiên pallet nhỏ/nhẹ để dễ nhét
@@ -2151,58 +3168,39 @@ def fix_container_overflows(containers):
             # Kiểm tra xem pallet này có phải là pallet nguyên không
             is_integer_pallet = p_move.quantity >= 1.0 - EPSILON and not p_move.is_combined
 
-            for target in available_targets:
-                # Tính toán xem target nhận được bao nhiêu
-                qty_can_accept = calculate_max_fit(p_move, target)
-                
-                # Nếu không thể nhận chút nào -> Bỏ qua
-                if qty_can_accept < EPSILON:
-                    continue
+            # Tính toán xem từng target nhận được bao nhiêu (một phép tính cho mọi target)
+            qty_can_accept = kernel.max_fit(p_move)[target_positions]
+
+            # --- LOGIC CHẶT CHẼ: KIỂM TRA ĐIỀU KIỆN TÁCH ---
+            # Trường hợp 1: Target nhận được TOÀN BỘ pallet (bất kể nguyên hay lẻ)
+            fits_whole = np.abs(p_move.quantity - qty_can_accept) < EPSILON
+            # Trường hợp 2: Pallet Nguyên và Target chỉ nhận được một phần NGUYÊN
+            # (calculate_max_fit đã đảm bảo số nhận được là số nguyên nếu input là pallet nguyên);
+            # target còn < 1 pallet thì không tách vụn pallet nguyên ra lẻ.
+            # Trường hợp 3: Pallet Lẻ/Gộp nhưng Target không chứa hết -> KHÔNG TÁCH
+            fits_part = is_integer_pallet & (qty_can_accept >= 1.0 - EPSILON)
+            # Nếu không thể nhận chút nào -> Bỏ qua
+            accepted = np.flatnonzero((qty_can_accept >= EPSILON) & (fits_whole | fits_part))
+            if not len(accepted):
+                continue
 
-                # --- LOGIC CHẶT CHẼ: KIỂM TRA ĐIỀU KIỆN TÁCH ---
-                should_move = False
-                should_split = False
+            # --- THỰC HIỆN HÀNH ĐỘNG (target phù hợp đầu tiên) ---
+            k = accepted[0]
+            target = kernel.containers[target_positions[k]]
+            source.remove_pallet(p_move)
 
-                if abs(p_move.quantity - qty_can_accept) < EPSILON:
-                    # Trường hợp 1: Target nhận được TOÀN BỘ pallet (bất kể nguyên hay lẻ)
-                    should_move = True
-                    should_split = False
-                
-                elif is_integer_pallet:
-                    # Trường hợp 2: Pallet Nguyên và Target chỉ nhận được một phần NGUYÊN
-                    # (Hàm calculate_max_fit đã đảm bảo qty_can_accept là số nguyên nếu input là pallet nguyên)
-                    if qty_can_accept >= 1.0 - EPSILON:
-                        should_move = True
-                        should_split = True
-                    else:
-                        # Target còn quá ít chỗ (< 1 pallet), không tách vụn pallet nguyên ra lẻ
-                        should_move = False
-                
-                else:
-                    # Trường hợp 3: Pallet Lẻ/Gộp nhưng Target không chứa hết -> KHÔNG TÁCH
-                    should_move = False
+            if fits_whole[k]:
+                # Chuyển toàn bộ
+                target.add_pallet(p_move)
+                log_waste.debug("      -> FIX: Chuyển toàn bộ %s (Qty: %.2f) từ %s sang %s", p_move.id, p_move.quantity, source.id, target.id)
+            else:
+                # Tách ra chuyển một phần NGUYÊN
+                keep, move = p_move.split(float(qty_can_accept[k]))
+                source.add_pallet(keep) # Trả lại phần giữ
+                target.add_pallet(move) # Chuyển phần tách
+                log_waste.debug("      -> FIX: Tách NGUYÊN chuyển %.0f của %s từ %s sang %s", move.quantity, p_move.id, source.id, target.id)
 
-                # --- THỰC HIỆN HÀNH ĐỘNG ---
-                if should_move:
-                    source.remove_pallet(p_move)
-                    
-                    if not should_split:
-                        # Chuyển toàn bộ
-                        target.add_pallet(p_move)
-                        print(f"      -> FIX: Chuyển toàn bộ {p_move.id} (Qty: {p_move.quantity:.2f}) từ {source.id} sang {target.id}")
-                    else:
-                        # Tách ra chuyển một phần NGUYÊN
-                        keep, move = p_move.split(qty_can_accept)
-                        source.add_pallet(keep) # Trả lại phần giữ
-                        target.add_pallet(move) # Chuyển phần tách
-                        print(f"      -> FIX: Tách NGUYÊN chuyển {move.quantity:.0f} của {p_move.id} từ {source.id} sang {target.id}")
-                    
-                    source._recalculate_totals()
-                    target._recalculate_totals()
-                    has_action = True
-                    
-                    # Nếu sau khi chuyển, target đầy, cần break để check lại source
-                    break 
+            has_action = True
 
     return has_action
 
@@ -2240,16 +3238,14 @@ def execute_smart_balance(active_containers):
                         sender.remove_pallet(p)
                         if abs(p.quantity - qty_fit) < EPSILON:
                             receiver.add_pallet(p)
-                            print(f"      [BAL] MOVE: {p.id} ({p.quantity:.2f}) từ {sender.id} -> {receiver.id}")
+                            log_waste.debug("      [BAL] MOVE: %s (%.2f) từ %s -> %s", p.id, p.quantity, sender.id, receiver.id)
                         else:
                             # Tách ra chuyển
                             keep, move = p.split(qty_fit)
                             sender.add_pallet(keep)
                             receiver.add_pallet(move)
-                            print(f"      [BAL] MOVE-SPLIT: {move.quantity:.2f} của {p.id} từ {sender.id} -> {receiver.id}")
+                            log_waste.debug("      [BAL] MOVE-SPLIT: %.2f của %s từ %s -> %s", move.quantity, p.id, sender.id, receiver.id)
                         
-                        sender._recalculate_totals()
-                        receiver._recalculate_totals()
                         return True # Restart loop để cập nhật state
 
             # --- CHIẾN THUẬT 2: ADVANCED SWAP (HOÁN ĐỔI NÂNG CAO) ---
@@ -2289,14 +3285,9 @@ def execute_smart_balance(active_containers):
                             new_w_sender <= MAX_WEIGHT and new_w_receiver <= MAX_WEIGHT):
                             
                             # Thực hiện Swap
-                            sender.remove_pallet(p_send)
-                            receiver.remove_pallet(p_recv)
-                            sender.add_pallet(p_recv)
-                            receiver.add_pallet(p_send)
-                            
-                            sender._recalculate_totals()
-                            receiver._recalculate_totals()
-                            print(f"      [BAL] SWAP: {sender.id} đổi {p_send.id} (W:{p_send.total_weight:.0f}) <-> {receiver.id} lấy {p_recv.id} (W:{p_recv.total_weight:.0f})")
+                            sender.swap_pallet(p_send, p_recv)
+                            receiver.swap_pallet(p_recv, p_send)
+                            log_waste.debug("      [BAL] SWAP: %s đổi %s (W:%.0f) <-> %s lấy %s (W:%.0f)", sender.id, p_send.id, p_send.total_weight, receiver.id, p_recv.id, p_recv.total_weight)
                             return True
 
                         # --- LOGIC 2.2: SPLIT-SWAP (TÁCH ĐỂ ĐỔI - QUAN TRỌNG CHO DEADLOCK) ---
@@ -2332,9 +3323,7 @@ def execute_smart_balance(active_containers):
                                 
                                 receiver.add_pallet(move) # Nhận 1 đơn vị tách ra
                                 
-                                sender._recalculate_totals()
-                                receiver._recalculate_totals()
-                                print(f"      [BAL] SPLIT-SWAP: Tách 1.0 của {p_send.id} từ {sender.id} đổi lấy {p_recv.id} từ {receiver.id}")
+                                log_waste.debug("      [BAL] SPLIT-SWAP: Tách 1.0 của %s từ %s đổi lấy %s từ %s", p_send.id, sender.id, p_recv.id, receiver.id)
                                 return True
 
     return False
@@ -2342,7 +3331,7 @@ def execute_smart_balance(active_containers):
 # PHASE 4: DEEP INJECTION (NHÉT HÀNG TỪ WASTE VÀO)
 # ==============================================================================
 
-def attempt_injection(item_to_solve, active_containers):
+def attempt_injection(item_to_solve, active_containers, kernel=None):
     """
     Thử nhét item vào các container active.
     
@@ -2351,41 +3340,43 @@ def attempt_injection(item_to_solve, active_containers):
       + Cho phép tách thành các phần NGUYÊN để nhét vào (ví dụ còn 5, nhét 2 vào cont A, giữ 3 lại).
     - Nếu item_to_solve là Pallet Lẻ/Gộp:
       + Bắt buộc phải tìm được container chứa vừa TOÀN BỘ. Không được tách nhỏ.
+
+    kernel: ContainerFitKernel dựng trên đúng danh sách `active_containers` (nếu nơi gọi đã có).
     """
+    if kernel is None:
+        with ContainerFitKernel(active_containers) as kernel:
+            return attempt_injection(item_to_solve, active_containers, kernel)
+
     # Sort container theo tiêu chí: cái nào còn vừa đúng chỗ thì ưu tiên (Best Fit)
-    best_conts = sorted(active_containers, key=lambda c: c.remaining_weight) 
+    order = np.argsort(kernel.remaining_weight, kind='stable')
     
     # Kiểm tra xem pallet đang xử lý có phải nguyên không
     is_integer_pallet = item_to_solve.quantity >= 1.0 - EPSILON and not item_to_solve.is_combined
 
-    for cont in best_conts:
-        qty_fit = calculate_max_fit(item_to_solve, cont)
-        
-        # Nếu không vừa tí nào -> bỏ qua
-        if qty_fit < EPSILON:
-            continue
-
-        # 1. Fit toàn bộ (áp dụng cho cả Pallet Nguyên và Lẻ/Gộp)
-        if abs(qty_fit - item_to_solve.quantity) < EPSILON:
-             cont.add_pallet(item_to_solve)
-             cont._recalculate_totals()
-             print(f"      [INJECT] Fit toàn bộ {item_to_solve.id} (Qty: {item_to_solve.quantity:.2f}) vào {cont.id}")
-             return True, None
-        
-        # 2. Fit một phần (CHỈ ÁP DỤNG CHO PALLET NGUYÊN -> TÁCH NGUYÊN)
-        if is_integer_pallet:
-             # qty_fit lúc này đã được làm tròn xuống (floor) trong hàm calculate_max_fit
-             if qty_fit >= 1.0 - EPSILON:
-                 keep, move = item_to_solve.split(qty_fit)
-                 cont.add_pallet(move)
-                 cont._recalculate_totals()
-                 print(f"      [INJECT] Fit phần NGUYÊN {move.quantity:.0f} của {item_to_solve.id} vào {cont.id}")
-                 # Trả về True và phần còn lại (keep) để tiếp tục xử lý
-                 return True, keep 
-        
-        # Nếu là Pallet Lẻ/Gộp mà không fit toàn bộ -> Không làm gì cả, thử container tiếp theo
-
-    return False, item_to_solve
+    qty_fit = kernel.max_fit(item_to_solve)[order]
+    # 1. Fit toàn bộ (áp dụng cho cả Pallet Nguyên và Lẻ/Gộp)
+    fits_whole = np.abs(qty_fit - item_to_solve.quantity) < EPSILON
+    # 2. Fit một phần (CHỈ ÁP DỤNG CHO PALLET NGUYÊN -> TÁCH NGUYÊN);
+    # qty_fit lúc này đã được làm tròn xuống (floor) như trong calculate_max_fit.
+    # Pallet Lẻ/Gộp mà không fit toàn bộ -> không dùng container đó
+    fits_part = is_integer_pallet & (qty_fit >= 1.0 - EPSILON)
+    # Nếu không vừa tí nào -> bỏ qua
+    accepted = np.flatnonzero((qty_fit >= EPSILON) & (fits_whole | fits_part))
+    if not len(accepted):
+        return False, item_to_solve
+
+    k = accepted[0]
+    cont = kernel.containers[order[k]]
+    if fits_whole[k]:
+        cont.add_pallet(item_to_solve)
+        log_waste.debug("      [INJECT] Fit toàn bộ %s (Qty: %.2f) vào %s", item_to_solve.id, item_to_solve.quantity, cont.id)
+        return True, None
+
+    keep, move = item_to_solve.split(float(qty_fit[k]))
+    cont.add_pallet(move)
+    log_waste.debug("      [INJECT] Fit phần NGUYÊN %.0f của %s vào %s", move.quantity, item_to_solve.id, cont.id)
+    # Trả về True và phần còn lại (keep) để tiếp tục xử lý
+    return True, keep
 
 # ==============================================================================
 # MAIN SOLVER: XỬ LÝ ITERATIVE
@@ -2430,7 +3421,6 @@ def force_insert_by_shifting(item_to_insert, active_containers):
         if cost == 0: 
             # Thực ra đã vừa rồi, gọi hàm inject bình thường là xong (trường hợp hiếm)
             target_cont.add_pallet(item_to_insert)
-            target_cont._recalculate_totals()
             return True
 
         # Tìm các "nạn nhân" để di dời
@@ -2498,18 +3488,16 @@ def force_insert_by_shifting(item_to_insert, active_containers):
         
         # 4. Thực thi nếu thành công
         if can_relocate_all_victims:
-            print(f"      [SHIFT] Dọn chỗ Container {target_cont.id} để đón {item_to_insert.id}:")
+            log_waste.debug("      [SHIFT] Dọn chỗ Container %s để đón %s:", target_cont.id, item_to_insert.id)
             # a. Di dời victims
             for vic, dest in relocation_plan:
                 target_cont.remove_pallet(vic)
                 dest.add_pallet(vic)
-                print(f"        -> Đẩy {vic.id} sang {dest.id}")
-                dest._recalculate_totals()
+                log_waste.debug("        -> Đẩy %s sang %s", vic.id, dest.id)
             
             # b. Thêm item mới vào
             target_cont.add_pallet(item_to_insert)
-            target_cont._recalculate_totals()
-            print(f"        -> [OK] Đã chèn {item_to_insert.id} vào {target_cont.id}")
+            log_waste.debug("        -> [OK] Đã chèn %s vào %s", item_to_insert.id, target_cont.id)
             return True
 
     return False
@@ -2521,38 +3509,44 @@ def solve_waste_container_iteratively(containers):
     """
     current_containers = containers
     iteration = 1
+    # Sức chứa còn trống được cập nhật dần qua mọi lần thử, không cộng lại trên mọi container mỗi vòng
+    capacity = CapacityAggregates(containers)
     
-    while True:
-        previous_count = len(current_containers)
-        
-        # Nếu chỉ còn 1 container hoặc ít hơn thì không cần lặp nữa
-        if previous_count <= 1:
-            return current_containers
+    try:
+        while True:
+            previous_count = len(current_containers)
+            
+            # Nếu chỉ còn 1 container hoặc ít hơn thì không cần lặp nữa
+            if previous_count <= 1:
+                return current_containers
 
-        print(f"\n🔥🔥🔥 [GLOBAL LOOP {iteration}] Kiểm tra khả năng loại bỏ Container cuối cùng (Hiện có: {previous_count}) 🔥🔥🔥")
-        
-        # Gọi hàm xử lý logic cũ (đã được đổi tên bên dưới)
-        # Hàm này sẽ thử "tiêu hủy" container cuối cùng hiện tại
-        current_containers = _core_logic_solve_waste(current_containers)
-        
-        new_count = len(current_containers)
-        
-        # KIỂM TRA: Nếu số lượng container GIẢM ĐI (tức là đã tiêu hủy thành công)
-        if new_count < previous_count:
-            print(f"   >>> [AUTO-NEXT] Thành công loại bỏ 1 container. Hệ thống tự động lặp lại để kiểm tra container tiếp theo...")
-            iteration += 1
-            continue # Lặp lại ngay lập tức để xử lý "người sống sót" cuối cùng mới
-        else:
-            # Nếu số lượng không đổi -> Nghĩa là không thể xử lý được nữa -> Dừng
-            print(f"   >>> [STOP] Không thể loại bỏ thêm container nào nữa (Container cuối cùng đã tối ưu). Kết thúc.")
-            return current_containers
-def _core_logic_solve_waste(containers):
+            log_waste.info("🔥🔥🔥 [GLOBAL LOOP %s] Kiểm tra khả năng loại bỏ Container cuối cùng (Hiện có: %s) 🔥🔥🔥", iteration, previous_count)
+            
+            # Gọi hàm xử lý logic cũ (đã được đổi tên bên dưới)
+            # Hàm này sẽ thử "tiêu hủy" container cuối cùng hiện tại
+            current_containers = _core_logic_solve_waste(current_containers, capacity)
+            
+            new_count = len(current_containers)
+            
+            # KIỂM TRA: Nếu số lượng container GIẢM ĐI (tức là đã tiêu hủy thành công)
+            if new_count < previous_count:
+                log_waste.info("   >>> [AUTO-NEXT] Thành công loại bỏ 1 container. Hệ thống tự động lặp lại để kiểm tra container tiếp theo...")
+                iteration += 1
+                continue # Lặp lại ngay lập tức để xử lý "người sống sót" cuối cùng mới
+            else:
+                # Nếu số lượng không đổi -> Nghĩa là không thể xử lý được nữa -> Dừng
+                log_waste.info("   >>> [STOP] Không thể loại bỏ thêm container nào nữa (Container cuối cùng đã tối ưu). Kết thúc.")
+                return current_containers
+    finally:
+        capacity.close()
+def _core_logic_solve_waste(containers, capacity=None):
     """
     Hàm xử lý container lãng phí phiên bản V3.2 - AGGRESSIVE SWAP
+    capacity: CapacityAggregates đang theo dõi `containers` (nếu có) cho bước check khả thi tổng thể.
     """
-    print("\n" + "="*60)
-    print("BẮT ĐẦU QUY TRÌNH ITERATIVE SOLVER (V3.2 - AGGRESSIVE SWAP)")
-    print("="*60)
+    log_waste.info("============================================================")
+    log_waste.info("BẮT ĐẦU QUY TRÌNH ITERATIVE SOLVER (V3.2 - AGGRESSIVE SWAP)")
+    log_waste.info("============================================================")
 
     if len(containers) <= 1:
         return containers
@@ -2563,14 +3557,22 @@ def _core_logic_solve_waste(containers):
     # --- CHECK KHẢ THI TỔNG THỂ ---
     req_lines = waste_container.total_logical_pallets
     req_weight = waste_container.total_weight
-    avail_lines = sum(MAX_PALLETS - c.total_logical_pallets for c in active_containers)
-    avail_weight = sum(MAX_WEIGHT - c.total_weight for c in active_containers)
+    if capacity is not None:
+        # Tổng còn trống của mọi container trừ phần của container lãng phí
+        if DEBUG_CONTAINER_TOTALS:
+            capacity.check_members(containers)
+        _, free_weight, free_lines = capacity.free()
+        avail_lines = free_lines - waste_container.remaining_logical_pallets
+        avail_weight = free_weight - waste_container.remaining_weight
+    else:
+        avail_lines = sum(MAX_PALLETS - c.total_logical_pallets for c in active_containers)
+        avail_weight = sum(MAX_WEIGHT - c.total_weight for c in active_containers)
     
-    print(f"   [CHECK] Nhu cầu: {req_lines} dòng, {req_weight:.2f}kg")
-    print(f"   [CHECK] Khả dụng: {avail_lines} dòng, {avail_weight:.2f}kg")
+    log_waste.debug("   [CHECK] Nhu cầu: %s dòng, %.2fkg", req_lines, req_weight)
+    log_waste.debug("   [CHECK] Khả dụng: %s dòng, %.2fkg", avail_lines, avail_weight)
     
     if avail_lines < req_lines or avail_weight < req_weight - EPSILON:
-         print("   -> [STOP] Không đủ không gian tổng thể. Trả về.")
+         log_waste.debug("   -> [STOP] Không đủ không gian tổng thể. Trả về.")
          return containers
 
     # Lấy items từ Waste ra
@@ -2582,79 +3584,82 @@ def _core_logic_solve_waste(containers):
     loop_count = 0
     max_loops = 50 # Giảm số loop nhưng làm chất lượng hơn
     
-    while (items_queue or failed_items_buffer) and loop_count < max_loops:
-        loop_count += 1
+    # Tổng của các container active dưới dạng mảng, cập nhật theo từng lần thêm/xóa pallet
+    with ContainerFitKernel(active_containers) as kernel:
+        while (items_queue or failed_items_buffer) and loop_count < max_loops:
+            loop_count += 1
         
-        if not items_queue and failed_items_buffer:
-            items_queue = failed_items_buffer
-            failed_items_buffer = []
-            print(f"\n   >>> [LOOP {loop_count}] Retry {len(items_queue)} items thất bại...")
+            if not items_queue and failed_items_buffer:
+                items_queue = failed_items_buffer
+                failed_items_buffer = []
+                log_waste.info("   >>> [LOOP %s] Retry %s items thất bại...", loop_count, len(items_queue))
             
-            # MỖI LẦN RETRY, GỌI CÂN BẰNG TẢI TRỌNG TRƯỚC
-            print("   >>> [RETRY] Kích hoạt Smart Balance để dọn đường...")
-            balanced = False
-            # Chạy cân bằng vài lần để ổn định hệ thống
-            for _ in range(3): 
-                if execute_smart_balance(active_containers):
-                    balanced = True
-                else:
-                    break # Không còn gì để cân bằng
-            if balanced:
-                print("   >>> [RETRY] Hệ thống đã được cân bằng lại. Thử nhét tiếp.")
-
-        if not items_queue:
-            break
+                # MỖI LẦN RETRY, GỌI CÂN BẰNG TẢI TRỌNG TRƯỚC
+                log_waste.info("   >>> [RETRY] Kích hoạt Smart Balance để dọn đường...")
+                balanced = False
+                # Chạy cân bằng vài lần để ổn định hệ thống
+                for _ in range(3): 
+                    if execute_smart_balance(active_containers):
+                        balanced = True
+                    else:
+                        break # Không còn gì để cân bằng
+                if balanced:
+                    log_waste.info("   >>> [RETRY] Hệ thống đã được cân bằng lại. Thử nhét tiếp.")
 
-        current_item = items_queue.pop(0)
-        print(f"\n   [-] Xử lý item: {current_item.id} (Qty: {current_item.quantity:.2f})")
+            if not items_queue:
+                break
 
-        # CHIẾN THUẬT 1: NHÉT TRỰC TIẾP
-        success, remaining = attempt_injection(current_item, active_containers)
-        if success:
-            if remaining and remaining.quantity > EPSILON:
-                items_queue.insert(0, remaining)
-            print("      -> Direct Inject: OK")
-            continue
+            current_item = items_queue.pop(0)
+            log_waste.debug("   [-] Xử lý item: %s (Qty: %.2f)", current_item.id, current_item.quantity)
 
-        # CHIẾN THUẬT 2: SỬA LỖI & CÂN BẰNG NGAY LẬP TỨC
-        fix_container_overflows(active_containers)
-        if execute_smart_balance(active_containers):
-            # Nếu cân bằng có tác dụng, thử nhét lại ngay
-            success_retry, remaining_retry = attempt_injection(current_item, active_containers)
-            if success_retry:
-                if remaining_retry and remaining_retry.quantity > EPSILON:
-                    items_queue.insert(0, remaining_retry)
-                print("      -> Inject after Balance: OK")
+            # CHIẾN THUẬT 1: NHÉT TRỰC TIẾP
+            success, remaining = attempt_injection(current_item, active_containers, kernel)
+            if success:
+                if remaining and remaining.quantity > EPSILON:
+                    items_queue.insert(0, remaining)
+                log_waste.debug("      -> Direct Inject: OK")
                 continue
 
-        # CHIẾN THUẬT 3: CƯỠNG CHẾ DỊCH CHUYỂN
-        if force_insert_by_shifting(current_item, active_containers):
-            continue
+            # CHIẾN THUẬT 2: SỬA LỖI & CÂN BẰNG NGAY LẬP TỨC
+            fix_container_overflows(active_containers, kernel)
+            if execute_smart_balance(active_containers):
+                # Nếu cân bằng có tác dụng, thử nhét lại ngay
+                success_retry, remaining_retry = attempt_injection(current_item, active_containers, kernel)
+                if success_retry:
+                    if remaining_retry and remaining_retry.quantity > EPSILON:
+                        items_queue.insert(0, remaining_retry)
+                    log_waste.debug("      -> Inject after Balance: OK")
+                    continue
 
-        # CHIẾN THUẬT 4: TÁCH NHỎ (NẾU LÀ PALLET NGUYÊN)
-        if current_item.quantity >= 2.0 - EPSILON and not current_item.is_combined:
-            print("      -> Quá to. Tách nhỏ ra để thử...")
-            keep, move_1 = current_item.split(1.0)
-            if force_insert_by_shifting(move_1, active_containers):
-                items_queue.insert(0, keep)
+            # CHIẾN THUẬT 3: CƯỠNG CHẾ DỊCH CHUYỂN
+            if force_insert_by_shifting(current_item, active_containers):
                 continue
+
+            # CHIẾN THUẬT 4: TÁCH NHỎ (NẾU LÀ PALLET NGUYÊN)
+            if current_item.quantity >= 2.0 - EPSILON and not current_item.is_combined:
+                log_waste.debug("      -> Quá to. Tách nhỏ ra để thử...")
+                keep, move_1 = current_item.split(1.0)
+                if force_insert_by_shifting(move_1, active_containers):
+                    items_queue.insert(0, keep)
+                    continue
+                else:
+                     # Nếu tách ra vẫn ko nhét được thì trả lại để thử ở loop sau (sau khi balance)
+                     failed_items_buffer.append(current_item) 
             else:
-                 # Nếu tách ra vẫn ko nhét được thì trả lại để thử ở loop sau (sau khi balance)
-                 failed_items_buffer.append(current_item) 
-        else:
-             failed_items_buffer.append(current_item)
+                 failed_items_buffer.append(current_item)
 
-    # KẾT THÚC
-    fix_container_overflows(active_containers)
+        # KẾT THÚC
+        fix_container_overflows(active_containers, kernel)
 
     if failed_items_buffer:
-        print(f"\n   [CẢNH BÁO] Vẫn còn dư {len(failed_items_buffer)} items.")
+        log_waste.warning("   [CẢNH BÁO] Vẫn còn dư %s items.", len(failed_items_buffer))
         for item in failed_items_buffer:
             waste_container.add_pallet(item)
-        waste_container._recalculate_totals()
         active_containers.append(waste_container)
     else:
-        print("\n   -> [SUCCESS] Đã giải quyết hoàn toàn Waste Container.")
+        log_waste.debug("   -> [SUCCESS] Đã giải quyết hoàn toàn Waste Container.")
+        if capacity is not None:
+            capacity.remove(waste_container)
 
     return active_containers
 def optimize_cross_company_combination(combined_pallets, uncombined_pallets, next_combined_id_start):
@@ -2670,41 +3675,47 @@ def optimize_cross_company_combination(combined_pallets, uncombined_pallets, nex
     Returns:
         tuple: (danh_sách_pallet_gộp_cuối_cùng, danh_sách_pallet_lẻ_còn_lại, id_gộp_tiếp_theo)
     """
-    print("\n--- BẮT ĐẦU TỐI ƯU HÓA GHÉP LIÊN CÔNG TY (NGƯỠNG 0.9) ---")
+    log_combine.info("--- BẮT ĐẦU TỐI ƯU HÓA GHÉP LIÊN CÔNG TY (NGƯỠNG 0.9) ---")
 
     all_fractionals = combined_pallets + uncombined_pallets
     if not all_fractionals:
-        print("   -> Không có pallet lẻ/gộp nào để tối ưu hóa.")
+        log_combine.debug("   -> Không có pallet lẻ/gộp nào để tối ưu hóa.")
         return [], [], next_combined_id_start
 
-    available_pallets = sorted(all_fractionals, key=lambda p: p.quantity, reverse=True)
+    # Sắp xếp theo số lượng: pallet nền là pallet lớn nhất còn lại, ứng viên là pallet lớn nhất còn vừa
+    available_pallets = QuantitySortedIndex(sorted(all_fractionals, key=lambda p: p.quantity, reverse=True))
     
     newly_combined_pallets = []
     final_uncombined_pallets = []
     
     while available_pallets:
-        base_pallet = available_pallets.pop(0)
+        base_pallet = available_pallets.pop_largest()
         current_sub_pallets = list(base_pallet.original_pallets)
 
-        candidates = sorted(available_pallets, key=lambda p: p.quantity, reverse=True)
-        
-        for candidate in list(candidates):
-            if candidate not in available_pallets:
-                continue
+        # Lần lượt lấy ứng viên LỚN NHẤT còn vừa phần trống (tra bằng bisect). Ứng viên lớn hơn đã
+        # không vừa thì sẽ không bao giờ vừa nữa (phần trống chỉ giảm), nên kết quả giống như duyệt
+        # toàn bộ ứng viên từ lớn đến nhỏ. Một ứng viên có phần >= 0.5 luôn có qty >= 0.5, lớn hơn
+        # phần trống khi tổ hợp đã có phần >= 0.5, nên hầu như không phải bỏ qua ứng viên nào.
+        while True:
+            room = 0.9 + EPSILON - sum(p.quantity for p in current_sub_pallets)
+            candidate = None
+            for option in available_pallets.descending(room + EPSILON):
+                potential_combination = current_sub_pallets + option.original_pallets
+                
+                potential_quantity = sum(p.quantity for p in potential_combination)
+                if potential_quantity > 0.9 + EPSILON:
+                    continue
 
-            candidate_sub_pallets = candidate.original_pallets
-            potential_combination = current_sub_pallets + candidate_sub_pallets
-            
-            potential_quantity = sum(p.quantity for p in potential_combination)
-            if potential_quantity > 0.9 + EPSILON:
-                continue
+                num_large_pallets = sum(1 for p in potential_combination if p.quantity >= 0.5)
+                if num_large_pallets > 1:
+                    continue
+                candidate = option
+                break
 
-            num_large_pallets = sum(1 for p in potential_combination if p.quantity >= 0.5)
-            if num_large_pallets > 1:
-                continue
-            
-            print(f"  [+] Ghép nối thành công: Pallet '{base_pallet.id}' và '{candidate.id}'")
-            current_sub_pallets.extend(candidate_sub_pallets)
+            if candidate is None:
+                break
+            log_combine.debug("  [+] Ghép nối thành công: Pallet '%s' và '%s'", base_pallet.id, candidate.id)
+            current_sub_pallets.extend(candidate.original_pallets)
             available_pallets.remove(candidate)
 
         if len(current_sub_pallets) > len(base_pallet.original_pallets):
@@ -2728,11 +3739,11 @@ def optimize_cross_company_combination(combined_pallets, uncombined_pallets, nex
             combined_pallet._recalculate_from_originals() # Tính toán lại để cập nhật thông tin
             newly_combined_pallets.append(combined_pallet)
             next_combined_id_start += 1
-            print(f"    -> Đã tạo pallet gộp mới: {combined_pallet}")
+            log_combine.debug("    -> Đã tạo pallet gộp mới: %s", combined_pallet)
         else:
             final_uncombined_pallets.append(base_pallet)
 
-    print(f"--- KẾT THÚC TỐI ƯU HÓA LIÊN CÔNG TY ---")
+    log_combine.info("--- KẾT THÚC TỐI ƯU HÓA LIÊN CÔNG TY ---")
     
     # Trả về các pallet mới được gộp và các pallet còn lại không thể gộp thêm
     return newly_combined_pallets, final_uncombined_pallets, next_combined_id_start
@@ -2745,11 +3756,11 @@ def optimize_combination_relaxed_threshold(combined_pallets, uncombined_pallets,
     Ưu tiên 1: Gộp trong cùng công ty.
     Ưu tiên 2: Gộp liên công ty.
     """
-    print(f"\n--- BẮT ĐẦU TỐI ƯU HÓA NỚI LỎNG NGƯỠNG GỘP (<= {threshold}) ---")
+    log_combine.info("--- BẮT ĐẦU TỐI ƯU HÓA NỚI LỎNG NGƯỠNG GỘP (<= %s) ---", threshold)
     
     # CHỈ LẤY các pallet lẻ (chưa được ghép) để xét
     if not uncombined_pallets:
-        print("   -> Không có pallet lẻ nào để tối ưu hóa nới lỏng.")
+        log_combine.debug("   -> Không có pallet lẻ nào để tối ưu hóa nới lỏng.")
         return combined_pallets, uncombined_pallets, next_combined_id_start
 
     # Sắp xếp từ lớn đến nhỏ để ưu tiên nhét pallet to trước
@@ -2758,48 +3769,67 @@ def optimize_combination_relaxed_threshold(combined_pallets, uncombined_pallets,
     # Khởi tạo danh sách kết quả chứa sẵn các pallet đã gộp an toàn từ trước
     final_combined_pallets = list(combined_pallets)
     
+    def sub_pallets_of(pallet):
+        return pallet.original_pallets if pallet.is_combined else [pallet]
+
     def try_merge(pallets_list, require_same_company):
         nonlocal next_combined_id_start
         merged_this_round = []
         unmerged_this_round = []
-        
-        while pallets_list:
-            base_pallet = pallets_list.pop(0)
-            current_sub_pallets = list(base_pallet.original_pallets) if base_pallet.is_combined else [base_pallet]
+
+        # Pallet chờ xử lý, sắp xếp theo số lượng (pallet nền = lớn nhất còn lại). Khi bắt buộc cùng
+        # công ty, ứng viên được chia theo công ty (pallet gồm nhiều công ty không ghép được với ai);
+        # tra "ứng viên lớn nhất còn vừa" bằng bisect thay cho duyệt lại toàn bộ danh sách.
+        ordered_pallets = sorted(pallets_list, key=lambda p: p.quantity, reverse=True)
+        remaining = QuantitySortedIndex(ordered_pallets)
+        candidates_by_company = defaultdict(QuantitySortedIndex)
+        if require_same_company:
+            for p in ordered_pallets:
+                companies = set(str(sp.company) for sp in sub_pallets_of(p))
+                if len(companies) == 1:
+                    candidates_by_company[companies.pop()].add(p)
+
+        while remaining:
+            base_pallet = remaining.pop_largest()
+            current_sub_pallets = list(sub_pallets_of(base_pallet))
             base_companies = set(str(p.company) for p in current_sub_pallets)
 
-            candidates = sorted(pallets_list, key=lambda p: p.quantity, reverse=True)
-            
-            for candidate in list(candidates):
-                if candidate not in pallets_list:
-                    continue
-                
-                candidate_sub_pallets = candidate.original_pallets if candidate.is_combined else [candidate]
-                candidate_companies = set(str(p.company) for p in candidate_sub_pallets)
-                
-                # Kiểm tra điều kiện cùng công ty
-                if require_same_company:
-                    if len(base_companies.union(candidate_companies)) > 1:
+            if not require_same_company:
+                candidates = remaining
+            elif len(base_companies) == 1:
+                candidates = candidates_by_company[next(iter(base_companies))]
+                candidates.remove(base_pallet)
+            else:
+                candidates = None
+
+            while candidates:
+                room = threshold + EPSILON - sum(p.quantity for p in current_sub_pallets)
+                candidate = None
+                for option in candidates.descending(room + EPSILON):
+                    potential_combination = current_sub_pallets + sub_pallets_of(option)
+                    potential_quantity = sum(p.quantity for p in potential_combination)
+
+                    # Điều kiện quan trọng: <= 0.95
+                    if potential_quantity > threshold + EPSILON:
                         continue
-                
-                potential_combination = current_sub_pallets + candidate_sub_pallets
-                potential_quantity = sum(p.quantity for p in potential_combination)
-                
-                # Điều kiện quan trọng: <= 0.95
-                if potential_quantity > threshold + EPSILON:
-                    continue
-                    
-                # Giữ quy tắc an toàn: tối đa 1 pallet >= 0.5 trong nhóm gộp
-                num_large_pallets = sum(1 for p in potential_combination if p.quantity >= 0.5)
-                if num_large_pallets > 1:
-                    continue
 
+                    # Giữ quy tắc an toàn: tối đa 1 pallet >= 0.5 trong nhóm gộp
+                    num_large_pallets = sum(1 for p in potential_combination if p.quantity >= 0.5)
+                    if num_large_pallets > 1:
+                        continue
+                    candidate = option
+                    break
+
+                if candidate is None:
+                    break
                 match_type = "Cùng Cty" if require_same_company else "Khác Cty"
-                print(f"  [+] ({match_type} - Ngưỡng {threshold}) Ghép nối thành công: '{base_pallet.id}' và '{candidate.id}' -> Tổng: {potential_quantity:.2f}")
+                log_combine.debug("  [+] (%s - Ngưỡng %s) Ghép nối thành công: '%s' và '%s' -> Tổng: %.2f", match_type, threshold, base_pallet.id, candidate.id, potential_quantity)
                 
+                candidate_sub_pallets = sub_pallets_of(candidate)
                 current_sub_pallets.extend(candidate_sub_pallets)
-                pallets_list.remove(candidate)
-                base_companies.update(candidate_companies)
+                remaining.remove(candidate)
+                candidates.remove(candidate)
+                base_companies.update(str(p.company) for p in candidate_sub_pallets)
 
             # Nếu có sự kết hợp mới xảy ra
             if len(current_sub_pallets) > (len(base_pallet.original_pallets) if base_pallet.is_combined else 1):
@@ -2829,12 +3859,12 @@ def optimize_combination_relaxed_threshold(combined_pallets, uncombined_pallets,
         return merged_this_round, unmerged_this_round
 
     # Giai đoạn 1: Ưu tiên cùng công ty trên tệp pallet lẻ
-    print(f"  > GIAI ĐOẠN 1: Thử ghép CÙNG CÔNG TY (Ngưỡng <= {threshold})")
+    log_combine.debug("  > GIAI ĐOẠN 1: Thử ghép CÙNG CÔNG TY (Ngưỡng <= %s)", threshold)
     new_combined_same, unmerged_pass_1 = try_merge(available_pallets, require_same_company=True)
     final_combined_pallets.extend(new_combined_same)
     
     # Giai đoạn 2: Liên công ty cho những pallet lẻ còn rớt lại
-    print(f"  > GIAI ĐOẠN 2: Thử ghép LIÊN CÔNG TY (Ngưỡng <= {threshold})")
+    log_combine.debug("  > GIAI ĐOẠN 2: Thử ghép LIÊN CÔNG TY (Ngưỡng <= %s)", threshold)
     new_combined_cross, final_unmerged = try_merge(unmerged_pass_1, require_same_company=False)
     final_combined_pallets.extend(new_combined_cross)
     
@@ -2842,7 +3872,7 @@ def optimize_combination_relaxed_threshold(combined_pallets, uncombined_pallets,
     final_uncombined_pallets = [p for p in final_unmerged if not p.is_combined]
     final_combined_pallets.extend([p for p in final_unmerged if p.is_combined])
 
-    print(f"--- KẾT THÚC TỐI ƯU HÓA NỚI LỎNG ---")
+    log_combine.info("--- KẾT THÚC TỐI ƯU HÓA NỚI LỎNG ---")
     return final_combined_pallets, final_uncombined_pallets, next_combined_id_start
 def optimize_by_splitting_and_filling_fractionals(combined_pallets, uncombined_pallets):
     """
@@ -2851,10 +3881,10 @@ def optimize_by_splitting_and_filling_fractionals(combined_pallets, uncombined_p
     - CƠ CHẾ ALL-OR-NOTHING: Chỉ tiến hành cắt nếu có thể phân bổ được TOÀN BỘ pallet lẻ đó.
       Nếu sau khi phân bổ nháp mà vẫn còn thừa, sẽ HỦY bỏ việc cắt và giữ nguyên pallet gốc.
     """
-    print("\n--- BƯỚC 5.6: TÁCH NHỎ PALLET LẺ ĐỂ LẤP ĐẦY PALLET GỘP (ALL-OR-NOTHING) ---")
+    log_combine.info("--- BƯỚC 5.6: TÁCH NHỎ PALLET LẺ ĐỂ LẤP ĐẦY PALLET GỘP (ALL-OR-NOTHING) ---")
     
     if not uncombined_pallets or not combined_pallets:
-        print("   -> Bỏ qua: Không có đủ pallet lẻ hoặc pallet gộp để thực hiện bước này.")
+        log_combine.debug("   -> Bỏ qua: Không có đủ pallet lẻ hoặc pallet gộp để thực hiện bước này.")
         return combined_pallets, uncombined_pallets
 
     final_uncombined = []
@@ -2866,7 +3896,7 @@ def optimize_by_splitting_and_filling_fractionals(combined_pallets, uncombined_p
     
     for single_pallet in pallets_to_split:
         if single_pallet.quantity >= 0.9 - EPSILON:
-            print(f"  [SKIP] Giữ nguyên {single_pallet.id} (qty: {single_pallet.quantity:.2f}) vì đã đạt ngưỡng >= 0.9.")
+            log_combine.debug("  [SKIP] Giữ nguyên %s (qty: %.2f) vì đã đạt ngưỡng >= 0.9.", single_pallet.id, single_pallet.quantity)
             final_uncombined.append(single_pallet)
             continue
 
@@ -2904,7 +3934,7 @@ def optimize_by_splitting_and_filling_fractionals(combined_pallets, uncombined_p
         # 2. Đánh giá kế hoạch (All-or-Nothing)
         if current_qty_to_distribute < 0.01:
             # THÀNH CÔNG: Có thể nhét hết toàn bộ pallet này vào các lỗ hổng.
-            print(f"  [OK] Đã tìm được chỗ cho TOÀN BỘ {single_pallet.id}. Bắt đầu cắt...")
+            log_combine.debug("  [OK] Đã tìm được chỗ cho TOÀN BỘ %s. Bắt đầu cắt...", single_pallet.id)
             current_piece = single_pallet
             
             for target_cp, split_qty in plan:
@@ -2918,7 +3948,7 @@ def optimize_by_splitting_and_filling_fractionals(combined_pallets, uncombined_p
                     current_piece, piece_to_add = current_piece.split(split_qty)
                     
                 if piece_to_add:
-                    print(f"    -> [+] ({match_type}) Tách {piece_to_add.quantity:.2f} từ {single_pallet.id} -> Ghép vào {target_cp.id} (lên {target_cp.quantity + piece_to_add.quantity:.2f})")
+                    log_combine.debug("    -> [+] (%s) Tách %.2f từ %s -> Ghép vào %s (lên %.2f)", match_type, piece_to_add.quantity, single_pallet.id, target_cp.id, target_cp.quantity + piece_to_add.quantity)
                     
                     target_cp.original_pallets.append(piece_to_add)
                     target_cp._recalculate_from_originals()
@@ -2929,14 +3959,14 @@ def optimize_by_splitting_and_filling_fractionals(combined_pallets, uncombined_p
                         target_cp.product_name = f"COMBINED ({len(target_cp.original_pallets)} items)"
         else:
             # THẤT BẠI: Vẫn còn dư, việc chia tách là vô nghĩa.
-            print(f"  [ROLLBACK] Không thể phân phối hết {single_pallet.id} (còn dư {current_qty_to_distribute:.2f}). Giữ nguyên hình dáng ban đầu: {single_pallet.quantity:.2f}")
+            log_combine.debug("  [ROLLBACK] Không thể phân phối hết %s (còn dư %.2f). Giữ nguyên hình dáng ban đầu: %.2f", single_pallet.id, current_qty_to_distribute, single_pallet.quantity)
             final_uncombined.append(single_pallet)
             
             # Hoàn trả lại không gian mô phỏng (Undo) cho các pallet gộp đã bị nhét nháp ở trên
             for target_cp, split_qty in plan:
                 available_space[target_cp.id] = round(available_space[target_cp.id] + split_qty, 2)
             
-    print(f"--- KẾT THÚC BƯỚC 5.6: Còn lại {len(final_uncombined)} pallet lẻ chưa được ghép hết. ---")
+    log_combine.info("--- KẾT THÚC BƯỚC 5.6: Còn lại %s pallet lẻ chưa được ghép hết. ---", len(final_uncombined))
     return combined_pallets, final_uncombined
 
 def optimize_cross_company_combination_v2(containers):
@@ -2948,34 +3978,38 @@ def optimize_cross_company_combination_v2(containers):
     import math
     from collections import defaultdict
 
-    print("\n" + "="*70)
-    print("BƯỚC 6.5: TỐI ƯU HÓA PALLET LẪN LỘN GIỮA CÁC CÔNG TY (CROSS-SHIP OPTIMIZER)")
-    print("="*70)
+    log_cross_ship.info("======================================================================")
+    log_cross_ship.info("BƯỚC 6.5: TỐI ƯU HÓA PALLET LẪN LỘN GIỮA CÁC CÔNG TY (CROSS-SHIP OPTIMIZER)")
+    log_cross_ship.info("======================================================================")
 
     # =========================================================================
     # BƯỚC 1: Đánh giá Ranh giới Toàn cục (Global Boundary Check)
     # =========================================================================
+    log_cross_ship.info("[BƯỚC 1] Đánh giá Ranh giới Toàn cục (Global Boundary Check):")
+    # Chỉ để ghi log: bỏ qua lượt duyệt mọi pallet khi không bật DEBUG
     company_stats = defaultdict(lambda: {'qty': 0.0, 'wgt': 0.0})
-    for c in containers:
-        for p in c.pallets:
-            company_stats[str(p.company)]['qty'] += p.quantity
-            company_stats[str(p.company)]['wgt'] += p.total_weight
+    if log_cross_ship.isEnabledFor(logging.DEBUG):
+        for c in containers:
+            for p in c.pallets:
+                company_stats[str(p.company)]['qty'] += p.quantity
+                company_stats[str(p.company)]['wgt'] += p.total_weight
 
-    print("\n[BƯỚC 1] Đánh giá Ranh giới Toàn cục (Global Boundary Check):")
     for comp, stats in company_stats.items():
         min_conts = math.ceil(stats['qty'] / MAX_PALLETS)
         cross_ship_qty = stats['qty'] % MAX_PALLETS
         # Xử lý sai số dấu phẩy động
         if abs(cross_ship_qty) < EPSILON or abs(cross_ship_qty - MAX_PALLETS) < EPSILON:
             cross_ship_qty = 0.0
-        print(f"  - Công ty {comp}: Tổng Qty = {stats['qty']:.2f}, Wgt = {stats['wgt']:.2f}")
-        print(f"    -> Cần tối thiểu {min_conts} container. Lượng Cross-ship bắt buộc: {cross_ship_qty:.2f} Qty")
+        log_cross_ship.debug("  - Công ty %s: Tổng Qty = %.2f, Wgt = %.2f", comp, stats['qty'], stats['wgt'])
+        log_cross_ship.debug("    -> Cần tối thiểu %s container. Lượng Cross-ship bắt buộc: %.2f Qty", min_conts, cross_ship_qty)
 
-    print("\n[BƯỚC 2 & 3 & 4] Phân loại, Vòng lặp Hoán đổi Ưu tiên và Validate:")
+    log_cross_ship.info("[BƯỚC 2 & 3 & 4] Phân loại, Vòng lặp Hoán đổi Ưu tiên và Validate:")
     
     has_changes = True
     loop_limit = 50
     current_loop = 0
+    # Danh sách container không đổi trong bước này: nhóm sẵn theo công ty chính
+    containers_by_company = CapacityAggregates(containers, track_changes=False)
 
     while has_changes and current_loop < loop_limit:
         has_changes = False
@@ -2993,7 +4027,7 @@ def optimize_cross_company_combination_v2(containers):
                 target_company = str(p_move.company)
                 
                 # Tìm Container A (Nơi mà Pallet này thực sự thuộc về)
-                conts_A = [c for c in containers if str(c.main_company) == target_company]
+                conts_A = containers_by_company.containers_of(target_company)
                 
                 swap_successful = False
                 
@@ -3007,14 +4041,12 @@ def optimize_cross_company_combination_v2(containers):
                         new_wgt_A_direct <= MAX_WEIGHT + EPSILON and 
                         new_qty_A_direct <= MAX_PALLETS + EPSILON):
                         
-                        print(f"  [MOVE OK] Đủ không gian trống, chuyển trực tiếp thành công:")
-                        print(f"    <- Chuyển Pallet {p_move.id} ({p_move.quantity:.2f} Qty, Cty {p_move.company}) từ Cont {cont_B.id} sang Cont {cont_A.id}")
+                        log_cross_ship.debug("  [MOVE OK] Đủ không gian trống, chuyển trực tiếp thành công:")
+                        log_cross_ship.debug("    <- Chuyển Pallet %s (%.2f Qty, Cty %s) từ Cont %s sang Cont %s", p_move.id, p_move.quantity, p_move.company, cont_B.id, cont_A.id)
                         
                         cont_B.remove_pallet(p_move)
                         cont_A.add_pallet(p_move)
                         
-                        cont_A._recalculate_totals()
-                        cont_B._recalculate_totals()
                         
                         has_changes = True
                         swap_successful = True
@@ -3079,9 +4111,9 @@ def optimize_cross_company_combination_v2(containers):
 
                             if is_valid_A and is_valid_B:
                                 # PASS: Thực hiện hoán đổi thật (Commit)
-                                print(f"  [SWAP OK] Thực hiện hoán đổi thành công:")
-                                print(f"    <- Chuyển Pallet {p_move.id} ({p_move.quantity:.2f} Qty, Cty {p_move.company}) từ Cont {cont_B.id} sang Cont {cont_A.id}")
-                                print(f"    -> Cắt & Chuyển Flexible {p_flex_move.id} ({p_flex_move.quantity:.2f} Qty, Cty {p_flex_move.company}) từ Cont {cont_A.id} sang Cont {cont_B.id}")
+                                log_cross_ship.debug("  [SWAP OK] Thực hiện hoán đổi thành công:")
+                                log_cross_ship.debug("    <- Chuyển Pallet %s (%.2f Qty, Cty %s) từ Cont %s sang Cont %s", p_move.id, p_move.quantity, p_move.company, cont_B.id, cont_A.id)
+                                log_cross_ship.debug("    -> Cắt & Chuyển Flexible %s (%.2f Qty, Cty %s) từ Cont %s sang Cont %s", p_flex_move.id, p_flex_move.quantity, p_flex_move.company, cont_A.id, cont_B.id)
 
                                 cont_B.remove_pallet(p_move)
                                 cont_A.remove_pallet(p_flex) 
@@ -3091,9 +4123,6 @@ def optimize_cross_company_combination_v2(containers):
                                 if p_flex_keep:
                                     cont_A.add_pallet(p_flex_keep) # Trả lại phần giữ lại cho Cont A
 
-                                # Đồng bộ lại tổng số
-                                cont_A._recalculate_totals()
-                                cont_B._recalculate_totals()
                                 
                                 has_changes = True
                                 swap_successful = True
@@ -3110,18 +4139,18 @@ def optimize_cross_company_combination_v2(containers):
     # =========================================================================
     # BƯỚC 5: Chấp nhận Tối ưu Cục bộ (Fallback Strategy)
     # =========================================================================
-    print("\n[BƯỚC 5] Chấp nhận Tối ưu Cục bộ (Fallback Strategy):")
+    log_cross_ship.info("[BƯỚC 5] Chấp nhận Tối ưu Cục bộ (Fallback Strategy):")
     cross_ship_count = 0
     for c in containers:
         mixed = [p for p in c.pallets if str(p.company) != str(c.main_company)]
         if mixed:
             cross_ship_count += len(mixed)
-            print(f"  - Container {c.id} (Main: {c.main_company}) vẫn đang chứa {len(mixed)} pallet khác công ty. (Chấp nhận do chạm ngưỡng Ranh giới Vật lý)")
+            log_cross_ship.debug("  - Container %s (Main: %s) vẫn đang chứa %s pallet khác công ty. (Chấp nhận do chạm ngưỡng Ranh giới Vật lý)", c.id, c.main_company, len(mixed))
             
     if cross_ship_count == 0:
-        print("  -> TUYỆT VỜI! Đã phân tách 100% các công ty thành công. Không còn lẫn lộn.")
+        log_cross_ship.debug("  -> TUYỆT VỜI! Đã phân tách 100%% các công ty thành công. Không còn lẫn lộn.")
     else:
-        print(f"  -> Đã gom tối đa. Tổng số lượng cụm pallet cross-ship còn lại trên toàn hệ thống: {cross_ship_count}")
+        log_cross_ship.debug("  -> Đã gom tối đa. Tổng số lượng cụm pallet cross-ship còn lại trên toàn hệ thống: %s", cross_ship_count)
 
-    print("="*70)
+    log_cross_ship.info("======================================================================")
     return containers
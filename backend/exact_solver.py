@@ -0,0 +1,246 @@
+# backend/exact_solver.py
+"""
+Bài toán xếp thùng (bin packing) 3 chiều chính xác cho đơn hàng nhỏ, giải bằng
+branch-and-bound thuần Python (không cần solver ngoài).
+
+Mỗi món hàng có kích thước (qty, trọng lượng, số dòng Packing List); mỗi container chứa tối đa
+(MAX_PALLETS, MAX_WEIGHT, MAX_PALLETS dòng), cùng cách so sánh với sai số như Container.can_fit:
+tổng qty/trọng lượng của mỗi container là tổng CHÍNH XÁC (math.fsum) của các món, giống tổng cộng
+dồn của Container, nên một cách xếp tìm được luôn được Container chấp nhận.
+
+Mục tiêu (theo thứ tự ưu tiên):
+1. số container ít nhất;
+2. số dòng xếp chéo ít nhất: trong mỗi container, các dòng không thuộc công ty chính bị tính là
+   xếp chéo. Công ty chính của container mới là công ty có nhiều dòng nhất trong container (pallet
+   gộp liên công ty "A+B" luôn bị tính là xếp chéo); container có sẵn giữ công ty chính của nó.
+
+Tìm kiếm theo chiều sâu trên các món đã sắp xếp giảm dần theo kích thước:
+- mỗi món được thử vào từng container đang mở (bỏ qua các container có cùng trạng thái với một
+  container đã thử - đối xứng), rồi mới thử mở container mới; container không làm tăng số dòng
+  xếp chéo được thử trước;
+- hai món giống hệt nhau liên tiếp không được đổi chỗ cho nhau (đối xứng);
+- cắt nhánh bằng cận dưới: số container đang mở + phần dung lượng còn thiếu của các món chưa
+  xếp, sau khi trừ dung lượng trống của các container còn xếp thêm được; khi cận này bằng số
+  container của lời giải tốt nhất, cắt tiếp theo số dòng xếp chéo hiện có (chỉ tăng khi xếp thêm);
+- dừng sớm khi lời giải đạt cận dưới toàn cục và không có dòng xếp chéo, hoặc khi hết thời gian
+  (trả lời giải tốt nhất tìm được nhưng không chứng minh được là tối ưu).
+"""
+import math
+import time
+from collections import namedtuple
+
+# assignment: chỉ số container cho từng món (theo thứ tự đầu vào), None nếu không tìm được lời
+# giải tốt hơn upper_bound; bins: số container; cross_lines: số dòng xếp chéo;
+# proven: đã duyệt hết (lời giải là tối ưu); order: thứ tự các món được xếp (chỉ số đầu vào) - xếp
+# lại vào Container theo đúng thứ tự này thì mọi phép kiểm tra can_fit trùng với lúc tìm kiếm
+SearchResult = namedtuple('SearchResult', ['assignment', 'bins', 'cross_lines', 'proven', 'nodes', 'timed_out',
+                                           'order'])
+
+_TIME_CHECK_INTERVAL = 256
+
+
+class _SearchTimeout(Exception):
+    pass
+
+
+class _SearchDone(Exception):
+    pass
+
+
+def _parts(value):
+    """Giá trị của container có sẵn: một số, hoặc danh sách giá trị các món bên trong."""
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def solve_bin_packing(items, capacity, tolerance, fixed_bins=(), upper_bound=None, lower_bound=0,
+                      time_budget=5.0, upper_bound_cross=None):
+    """
+    items     : danh sách (qty, weight, lines, company).
+    capacity  : (max_qty, max_weight, max_lines).
+    tolerance : sai số cho phép khi so sánh qty và weight với capacity (0 khi kích thước là số
+                nguyên, xem FIXED_POINT_CAPACITY).
+    fixed_bins: các container đã có sẵn (qty, weight, lines, company) đã dùng; luôn được tính vào
+                số container và được xếp thêm món vào. qty/weight có thể là danh sách giá trị của
+                các món bên trong (để tổng chính xác giống Container); các dòng có sẵn được tính là
+                của công ty chính `company`. Chỉ số 0..len(fixed_bins)-1 trong assignment.
+    upper_bound: chỉ tìm lời giải dùng ÍT HƠN số container này (None: không giới hạn).
+    upper_bound_cross: số dòng xếp chéo của lời giải đang có với upper_bound container; khi có,
+                lời giải dùng ĐÚNG upper_bound container nhưng ít dòng xếp chéo hơn cũng được nhận
+                (hòa thì giữ lời giải đang có).
+    lower_bound: cận dưới đã biết của số container (ví dụ bounds.container_lower_bounds).
+    """
+    cap_q, cap_w, cap_l = capacity
+    deadline = time.perf_counter() + time_budget
+    n = len(items)
+
+    # Món lớn trước: kích thước chuẩn hóa lớn nhất trong 3 chiều
+    order = sorted(range(n), key=lambda i: (-max(items[i][0] / cap_q, items[i][1] / cap_w, items[i][2] / cap_l),
+                                            -items[i][0], -items[i][1], str(items[i][3])))
+    q = [items[i][0] for i in order]
+    w = [items[i][1] for i in order]
+    l = [items[i][2] for i in order]
+    company = [str(items[i][3]) for i in order]
+    same_as_prev = [k > 0 and (q[k], w[k], l[k], company[k]) == (q[k - 1], w[k - 1], l[k - 1], company[k - 1])
+                    for k in range(n)]
+
+    # Tổng còn lại và giá trị nhỏ nhất còn lại (từ món k trở đi) cho từng chiều
+    rem_q, rem_w, rem_l = [0.0] * (n + 1), [0.0] * (n + 1), [0] * (n + 1)
+    min_q, min_w, min_l = [math.inf] * (n + 1), [math.inf] * (n + 1), [math.inf] * (n + 1)
+    for k in range(n - 1, -1, -1):
+        rem_q[k], rem_w[k], rem_l[k] = rem_q[k + 1] + q[k], rem_w[k + 1] + w[k], rem_l[k + 1] + l[k]
+        min_q[k], min_w[k], min_l[k] = min(min_q[k + 1], q[k]), min(min_w[k + 1], w[k]), min(min_l[k + 1], l[k])
+
+    # Trạng thái từng container: danh sách giá trị các món (tổng = math.fsum), số dòng theo công ty
+    parts_q = [_parts(b[0]) for b in fixed_bins]
+    parts_w = [_parts(b[1]) for b in fixed_bins]
+    used_q = [math.fsum(p) for p in parts_q]
+    used_w = [math.fsum(p) for p in parts_w]
+    used_l = [b[2] for b in fixed_bins]
+    fixed_main = [str(b[3]) for b in fixed_bins]
+    lines_by_company = [{str(b[3]): b[2]} for b in fixed_bins]
+    cross = [0] * len(fixed_bins)
+    assign = [0] * n
+
+    target = max(lower_bound, len(fixed_bins))
+    best = {
+        'bins': upper_bound if upper_bound is not None else math.inf,
+        # Không có upper_bound_cross: chỉ nhận lời giải ít container hơn upper_bound
+        'cross': (upper_bound_cross if upper_bound_cross is not None else 0) if upper_bound is not None else math.inf,
+        'assign': None,
+    }
+    cross_total = [0]
+    nodes = [0]
+
+    def improves(bins, cross_lines):
+        return bins < best['bins'] or (bins == best['bins'] and cross_lines < best['cross'])
+
+    def bin_cross(b):
+        counts = lines_by_company[b]
+        main = fixed_main[b] if b < len(fixed_main) else None
+        kept = counts.get(main, 0) if main is not None else max(counts.values(), default=0)
+        return used_l[b] - kept
+
+    def place(b, k):
+        parts_q[b].append(q[k])
+        parts_w[b].append(w[k])
+        used_q[b] = math.fsum(parts_q[b])
+        used_w[b] = math.fsum(parts_w[b])
+        used_l[b] += l[k]
+        if '+' not in company[k]:
+            lines_by_company[b][company[k]] = lines_by_company[b].get(company[k], 0) + l[k]
+        previous = cross[b]
+        cross[b] = bin_cross(b)
+        cross_total[0] += cross[b] - previous
+        return previous
+
+    def unplace(b, k, previous):
+        parts_q[b].pop()
+        parts_w[b].pop()
+        used_q[b] = math.fsum(parts_q[b])
+        used_w[b] = math.fsum(parts_w[b])
+        used_l[b] -= l[k]
+        if '+' not in company[k]:
+            lines_by_company[b][company[k]] -= l[k]
+            if not lines_by_company[b][company[k]]:
+                del lines_by_company[b][company[k]]
+        cross_total[0] += previous - cross[b]
+        cross[b] = previous
+
+    def bound(k):
+        """Cận dưới số container khi đã xếp xong k món đầu."""
+        free_q = free_w = free_l = 0.0
+        for b in range(len(used_q)):
+            rq, rw, rl = cap_q - used_q[b], cap_w - used_w[b], cap_l - used_l[b]
+            # Container không còn chứa nổi món nhỏ nhất còn lại: chỗ trống của nó bị bỏ phí
+            if rq + tolerance >= min_q[k] and rw + tolerance >= min_w[k] and rl >= min_l[k]:
+                free_q += rq
+                free_w += rw
+                free_l += rl
+        extra = max(
+            (rem_q[k] - free_q) / cap_q,
+            (rem_w[k] - free_w) / cap_w,
+            (rem_l[k] - free_l) / cap_l,
+            0.0,
+        )
+        return len(used_q) + math.ceil(extra - 1e-9)
+
+    def search(k):
+        nodes[0] += 1
+        if nodes[0] % _TIME_CHECK_INTERVAL == 0 and time.perf_counter() > deadline:
+            raise _SearchTimeout
+        if k == n:
+            if improves(len(used_q), cross_total[0]):
+                best['bins'] = len(used_q)
+                best['cross'] = cross_total[0]
+                best['assign'] = list(assign)
+                if best['bins'] <= target and best['cross'] == 0:
+                    raise _SearchDone
+            return
+        # Số dòng xếp chéo hiện có là cận dưới: xếp thêm món không làm nó giảm
+        if not improves(bound(k), cross_total[0]):
+            return
+
+        qk, wk, lk = q[k], w[k], l[k]
+        start = assign[k - 1] if same_as_prev[k] else 0
+        feasible = []
+        tried = set()
+        for b in range(start, len(used_q)):
+            # Cùng phép so sánh với Container.can_fit (tổng chính xác + món mới)
+            if (used_q[b] + qk > cap_q + tolerance or used_w[b] + wk > cap_w + tolerance
+                    or used_l[b] + lk > cap_l):
+                continue
+            state = (round(used_q[b], 6), round(used_w[b], 3), used_l[b],
+                     fixed_main[b] if b < len(fixed_main) else None,
+                     tuple(sorted(lines_by_company[b].items())))
+            if state in tried:
+                continue
+            tried.add(state)
+            feasible.append(b)
+
+        # Container không làm tăng số dòng xếp chéo trước, sau đó xếp chéo
+        ranked = []
+        for b in feasible:
+            previous = place(b, k)
+            ranked.append((cross[b] - previous, b))
+            unplace(b, k, previous)
+        ranked.sort()
+        for _, b in ranked:
+            previous = place(b, k)
+            assign[k] = b
+            search(k + 1)
+            unplace(b, k, previous)
+
+        # Mở container mới (mọi container mới đều như nhau nên chỉ cần thử một lần)
+        parts_q.append([])
+        parts_w.append([])
+        used_q.append(0.0)
+        used_w.append(0.0)
+        used_l.append(0)
+        lines_by_company.append({})
+        cross.append(0)
+        b = len(used_q) - 1
+        previous = place(b, k)
+        if improves(len(used_q), cross_total[0]):
+            assign[k] = b
+            search(k + 1)
+        unplace(b, k, previous)
+        for state in (parts_q, parts_w, used_q, used_w, used_l, lines_by_company, cross):
+            state.pop()
+
+    proven = timed_out = False
+    try:
+        search(0)
+        proven = True
+    except _SearchDone:
+        proven = True
+    except _SearchTimeout:
+        timed_out = True
+
+    assignment = None
+    if best['assign'] is not None:
+        assignment = [None] * n
+        for k, original_index in enumerate(order):
+            assignment[original_index] = best['assign'][k]
+    found = assignment is not None
+    return SearchResult(assignment, best['bins'] if found else None, best['cross'] if found else None,
+                        proven, nodes[0], timed_out, order)
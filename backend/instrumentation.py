@@ -0,0 +1,157 @@
+# backend/instrumentation.py
+"""
+Đo thời gian từng giai đoạn và đếm thao tác của pipeline tối ưu hóa.
+
+- PipelineStats: số liệu của MỘT lần chạy: thời gian từng giai đoạn (PIPELINE_STAGES),
+  số lần gọi can_fit / add_pallet / split, số vòng lặp BƯỚC 6, số container được tạo
+  và bị loại bỏ.
+- Trong lúc pipeline chạy, PipelineStats hiện hành được đặt trong một ContextVar nên các
+  job chạy song song (nhiều luồng) không cộng lẫn số liệu của nhau. Ngoài pipeline
+  (không có PipelineStats hiện hành) các bộ đếm không làm gì.
+- StatsRegistry: tổng hợp nhiều lần chạy, xuất ra snapshot (dict / file JSON).
+"""
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+COUNTER_NAMES = (
+    'can_fit_calls',
+    'add_pallet_calls',
+    'split_calls',
+    'step6_iterations',
+    'containers_created',
+    'containers_eliminated',
+)
+
+_current_stats = contextvars.ContextVar('pipeline_stats', default=None)
+# Dùng trong các hàm nóng (Container.can_fit, ...): current_stats() trả None khi không đo
+current_stats = _current_stats.get
+
+
+class PipelineStats:
+    """Số liệu của một lần chạy pipeline. Pickle được (gửi qua lại tiến trình worker)."""
+    __slots__ = COUNTER_NAMES + ('stage_seconds', 'total_seconds', '_stage', '_stage_started', '_started')
+
+    def __init__(self):
+        for name in COUNTER_NAMES:
+            setattr(self, name, 0)
+        self.stage_seconds = {}
+        self.total_seconds = None
+        self._stage = None
+        self._stage_started = None
+        self._started = time.perf_counter()
+
+    def start_stage(self, stage):
+        """Kết thúc giai đoạn đang đo (nếu có) và bắt đầu đo `stage`. Gọi lại cùng stage không làm gì."""
+        if stage == self._stage:
+            return
+        now = time.perf_counter()
+        self._close_stage(now)
+        self._stage = stage
+        self._stage_started = now
+
+    def finish(self):
+        now = time.perf_counter()
+        self._close_stage(now)
+        self._stage = None
+        self.total_seconds = now - self._started
+
+    def _close_stage(self, now):
+        if self._stage is not None:
+            self.stage_seconds[self._stage] = self.stage_seconds.get(self._stage, 0.0) + (now - self._stage_started)
+
+    def as_dict(self):
+        return {
+            'total_seconds': round(self.total_seconds or 0.0, 6),
+            'stages': [{'stage': stage, 'seconds': round(seconds, 6)} for stage, seconds in self.stage_seconds.items()],
+            'counters': {name: getattr(self, name) for name in COUNTER_NAMES},
+        }
+
+    # perf_counter không có ý nghĩa giữa hai tiến trình: khi pickle, thời điểm bắt đầu được
+    # chuyển thành "đã chạy được bao lâu" và dựng lại ở tiến trình nhận.
+    def __getstate__(self):
+        now = time.perf_counter()
+        state = {name: getattr(self, name) for name in COUNTER_NAMES}
+        state.update(
+            stage_seconds=dict(self.stage_seconds),
+            total_seconds=self.total_seconds,
+            stage=self._stage,
+            stage_elapsed=None if self._stage is None else now - self._stage_started,
+            elapsed=now - self._started,
+        )
+        return state
+
+    def __setstate__(self, state):
+        now = time.perf_counter()
+        for name in COUNTER_NAMES:
+            setattr(self, name, state[name])
+        self.stage_seconds = state['stage_seconds']
+        self.total_seconds = state['total_seconds']
+        self._stage = state['stage']
+        self._stage_started = None if self._stage is None else now - state['stage_elapsed']
+        self._started = now - state['elapsed']
+
+
+@contextmanager
+def collect_stats(stats=None):
+    """Đặt `stats` (hoặc một PipelineStats mới) làm số liệu hiện hành trong khối with."""
+    stats = stats if stats is not None else PipelineStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+class StatsRegistry:
+    """Tổng hợp số liệu của các lần chạy pipeline (an toàn khi nhiều luồng cùng ghi)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._runs = 0
+            self._total_seconds = 0.0
+            self._stages = {}
+            self._counters = {name: 0 for name in COUNTER_NAMES}
+            self._last_run = None
+
+    def record(self, stats_dict):
+        """Ghi nhận một lần chạy (kết quả PipelineStats.as_dict())."""
+        with self._lock:
+            self._runs += 1
+            self._total_seconds += stats_dict['total_seconds']
+            for item in stats_dict['stages']:
+                agg = self._stages.setdefault(item['stage'], {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+                agg['count'] += 1
+                agg['total_seconds'] += item['seconds']
+                agg['max_seconds'] = max(agg['max_seconds'], item['seconds'])
+            for name, value in stats_dict['counters'].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+            self._last_run = stats_dict
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'generated_at': time.time(),
+                'runs': self._runs,
+                'total_seconds': round(self._total_seconds, 6),
+                'stages': {stage: dict(agg) for stage, agg in self._stages.items()},
+                'counters': dict(self._counters),
+                'last_run': self._last_run,
+            }
+
+    def export_snapshot(self, path):
+        """Ghi snapshot ra file JSON, trả về snapshot đã ghi."""
+        snapshot = self.snapshot()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        return snapshot
+
+
+# Registry dùng chung của tiến trình server
+stats_registry = StatsRegistry()
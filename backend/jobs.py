@@ -0,0 +1,276 @@
+# backend/jobs.py
+"""
+Hàng đợi job cho chế độ bất đồng bộ của /api/process.
+
+- POST /api/process với "async": true -> submit() trả job_id ngay lập tức.
+- Pipeline chạy trong một pool có số luồng giới hạn (JOB_WORKERS); số job đang chờ
+  cũng bị giới hạn (MAX_QUEUED_JOBS) để server không bị dồn việc vô hạn.
+- GET /api/process/<job_id> -> get() trả trạng thái, giai đoạn hiện tại (BƯỚC 2 ... 6.5)
+  và kết quả khi job hoàn tất. Kết quả được giữ lại JOB_RESULT_TTL giây.
+- JOB_EXECUTOR=process: phần tính toán (BƯỚC 2 trở đi) chạy trong ProcessPoolExecutor
+  (JOB_PROCESSES tiến trình) để các request đồng thời không tranh nhau GIL. Tiến trình chính
+  vẫn đọc file (dùng chung cache workbook_cache), gửi bảng pallet đã làm sạch (DataFrame,
+  pickle) sang worker và nhận lại payload JSON; tiến độ được gửi về qua một Queue.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from data_processor import load_pallet_table
+from instrumentation import PipelineStats, stats_registry
+from logging_config import configure_logging
+from metrics import record_pipeline_run
+from pipeline import PIPELINE_STAGES, STAGE_LABELS, optimize_pallet_table, run_optimization_pipeline
+from solvers import DEFAULT_STRATEGY
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS', 20))
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 3600))
+# 'thread': chạy pipeline trong luồng của pool; 'process': đẩy phần tính toán sang tiến trình riêng
+JOB_EXECUTOR = os.environ.get('JOB_EXECUTOR', 'thread')
+JOB_PROCESSES = int(os.environ.get('JOB_PROCESSES', os.cpu_count() or 1))
+
+_STAGE_INDEX = {key: i for i, (key, _) in enumerate(PIPELINE_STAGES)}
+
+logger = logging.getLogger('packing.jobs')
+
+# --- Phần chạy trong tiến trình worker ---
+_worker_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _worker_progress_queue
+    _worker_progress_queue = progress_queue
+    # Tiến trình 'spawn' không kế thừa cấu hình logging của tiến trình chính
+    configure_logging()
+
+
+def _optimize_in_worker(job_id, pallet_table, stats, strategy=DEFAULT_STRATEGY):
+    """Chạy trong tiến trình worker: tối ưu bảng pallet, gửi tiến độ về tiến trình chính."""
+    def progress(stage, detail=None):
+        if job_id is not None:
+            _worker_progress_queue.put((job_id, stage, detail))
+
+    return optimize_pallet_table(pallet_table, progress, stats, strategy)
+
+
+class JobManager:
+    """Quản lý các job tối ưu hóa chạy nền và trạng thái tiến độ của chúng."""
+
+    def __init__(self, max_workers=JOB_WORKERS, max_queued=MAX_QUEUED_JOBS, result_ttl=JOB_RESULT_TTL,
+                 executor=JOB_EXECUTOR, processes=JOB_PROCESSES):
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.use_processes = executor == 'process'
+        self.processes = processes
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._sync_running = 0
+        self._process_pool = None
+        self._progress_queue = None
+
+        if self.use_processes:
+            # Luồng điều phối: đọc file rồi chờ kết quả từ worker, cần đủ để giữ mọi tiến trình bận
+            max_workers = max(max_workers, processes)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='process-job')
+
+    def _get_process_pool(self):
+        """
+        Tạo pool tiến trình ở lần dùng đầu tiên (không tạo lúc import: với 'spawn', tiến trình
+        con import lại module chính và sẽ tự tạo pool của riêng nó nếu làm vậy).
+        """
+        with self._lock:
+            if self._process_pool is None:
+                # 'spawn': an toàn khi tiến trình chính đã có nhiều luồng (waitress) và giống Windows
+                mp_context = multiprocessing.get_context('spawn')
+                if self._progress_queue is None:
+                    self._progress_queue = mp_context.Queue()
+                    threading.Thread(target=self._drain_progress, name='job-progress', daemon=True).start()
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=mp_context,
+                    initializer=_init_worker,
+                    initargs=(self._progress_queue,)
+                )
+            return self._process_pool
+
+    def _drain_progress(self):
+        while True:
+            try:
+                item = self._progress_queue.get()
+            except (EOFError, OSError, ValueError):
+                # Queue đã bị đóng khi tiến trình chính thoát
+                break
+            if item is None:
+                break
+            self._progress(*item)
+
+    def run(self, filepath, sheet_name, include_stats=False, strategy=DEFAULT_STRATEGY):
+        """Chạy đồng bộ (request /api/process thường) nhưng vẫn qua pool tiến trình nếu được bật."""
+        with self._lock:
+            self._sync_running += 1
+        try:
+            return self._execute(None, filepath, sheet_name, progress=None, include_stats=include_stats,
+                                 strategy=strategy)
+        finally:
+            with self._lock:
+                self._sync_running -= 1
+
+    def in_flight_count(self):
+        """Số job đang chờ hoặc đang chạy, gồm cả các request đồng bộ."""
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job['status'] in ('queued', 'running'))
+            return active + self._sync_running
+
+    def _execute(self, job_id, filepath, sheet_name, progress, include_stats=False, strategy=DEFAULT_STRATEGY):
+        """
+        Chạy pipeline, ghi số liệu (payload['stats']) vào stats_registry và /metrics, chỉ giữ lại
+        khóa 'stats' trong payload khi include_stats=True.
+        """
+        payload, http_status = self._execute_pipeline(job_id, filepath, sheet_name, progress, strategy)
+        stats = payload.pop('stats', None)
+        if payload.get('success', True):
+            record_pipeline_run(stats, len(payload.get('unplaced_pallets') or []))
+        if stats is not None:
+            stats_registry.record(stats)
+            if include_stats:
+                payload['stats'] = stats
+        return payload, http_status
+
+    def _execute_pipeline(self, job_id, filepath, sheet_name, progress, strategy):
+        if not self.use_processes:
+            return run_optimization_pipeline(filepath, sheet_name, progress=progress, strategy=strategy)
+
+        stats = PipelineStats()
+        stats.start_stage('load')
+        if progress is not None:
+            progress('load', None)
+        pallet_table, error = load_pallet_table(filepath, sheet_name)
+        if error:
+            return {"success": False, "error": error}, 400
+        pool = self._get_process_pool()
+        try:
+            return pool.submit(_optimize_in_worker, job_id, pallet_table, stats, strategy).result()
+        except BrokenProcessPool:
+            # Một worker bị chết (ví dụ hết bộ nhớ): bỏ pool này, job sau sẽ tạo pool mới
+            with self._lock:
+                if self._process_pool is pool:
+                    self._process_pool = None
+            raise
+
+    def submit(self, filepath, sheet_name, include_stats=False, strategy=DEFAULT_STRATEGY):
+        """Đưa một job vào hàng đợi. Trả về job_id, hoặc None nếu hàng đợi đã đầy."""
+        self._purge_expired()
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job['status'] in ('queued', 'running'))
+            if active >= self.max_queued:
+                return None
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'filepath': filepath,
+                'sheet_name': sheet_name,
+                'include_stats': include_stats,
+                'strategy': strategy,
+                'stage': None,
+                'stage_label': None,
+                'stage_index': None,
+                'total_stages': len(PIPELINE_STAGES),
+                'detail': None,
+                'stages': [],
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'http_status': None,
+                'result': None,
+            }
+        self._executor.submit(self._run, job_id, filepath, sheet_name, include_stats, strategy)
+        return job_id
+
+    def get(self, job_id):
+        """Bản sao trạng thái job (an toàn để jsonify), hoặc None nếu không tồn tại/đã hết hạn."""
+        self._purge_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = dict(job)
+            snapshot['stages'] = [dict(s) for s in job['stages']]
+        now = snapshot['finished_at'] or time.time()
+        if snapshot['started_at'] is not None:
+            snapshot['elapsed_seconds'] = round(now - snapshot['started_at'], 3)
+        if snapshot['stages'] and snapshot['stages'][-1]['seconds'] is None:
+            snapshot['stages'][-1]['seconds'] = round(now - snapshot['stages'][-1]['started_at'], 3)
+        return snapshot
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait, cancel_futures=True)
+        if self._progress_queue is not None:
+            self._progress_queue.put(None)
+
+    def _progress(self, job_id, stage, detail=None):
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['finished_at'] is not None:
+                return
+            if job['stage'] != stage:
+                if job['stages']:
+                    last = job['stages'][-1]
+                    last['seconds'] = round(now - last['started_at'], 3)
+                job['stages'].append({
+                    'stage': stage,
+                    'label': STAGE_LABELS.get(stage, stage),
+                    'started_at': now,
+                    'seconds': None,
+                })
+            job['stage'] = stage
+            job['stage_label'] = STAGE_LABELS.get(stage, stage)
+            job['stage_index'] = _STAGE_INDEX.get(stage)
+            job['detail'] = detail
+
+    def _finish(self, job_id, status, payload, http_status):
+        now = time.time()
+        with self._lock:
+            job = self._jobs[job_id]
+            if job['stages'] and job['stages'][-1]['seconds'] is None:
+                last = job['stages'][-1]
+                last['seconds'] = round(now - last['started_at'], 3)
+            job['status'] = status
+            job['result'] = payload
+            job['http_status'] = http_status
+            job['finished_at'] = now
+
+    def _run(self, job_id, filepath, sheet_name, include_stats=False, strategy=DEFAULT_STRATEGY):
+        with self._lock:
+            self._jobs[job_id]['status'] = 'running'
+            self._jobs[job_id]['started_at'] = time.time()
+        try:
+            payload, http_status = self._execute(
+                job_id, filepath, sheet_name,
+                progress=lambda stage, detail=None: self._progress(job_id, stage, detail),
+                include_stats=include_stats,
+                strategy=strategy
+            )
+            status = 'done' if payload.get('success', True) else 'failed'
+            self._finish(job_id, status, payload, http_status)
+        except Exception as e:
+            logger.exception("Job %s thất bại", job_id)
+            payload = {"success": False, "error": f"Đã xảy ra lỗi hệ thống không mong muốn: {str(e)}"}
+            self._finish(job_id, 'failed', payload, 500)
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['finished_at'] is not None and job['finished_at'] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -0,0 +1,47 @@
+# backend/logging_config.py
+"""
+Cấu hình logging cho backend.
+
+Tất cả logger của ứng dụng là con của 'packing' (packing.loader, packing.integer,
+packing.combine, packing.unplaced, packing.waste, packing.cross_ship, packing.solver,
+packing.api, ...). Mức log:
+- LOG_LEVEL: mức chung, mặc định WARNING (production: không in chi tiết từng pallet).
+- LOG_LEVELS: ghi đè cho từng logger, ví dụ "packing.waste=DEBUG,packing.unplaced=INFO".
+
+Khi một mức bị tắt, lời gọi log chỉ tốn một phép kiểm tra isEnabledFor: chuỗi thông báo
+được định dạng kiểu %-args nên không bao giờ được tạo ra.
+"""
+import logging
+import os
+import sys
+
+ROOT_LOGGER = 'packing'
+DEFAULT_LEVEL = 'WARNING'
+LOG_FORMAT = '%(asctime)s %(levelname)-7s [%(name)s] %(message)s'
+
+
+def configure_logging(level=None, overrides=None, stream=None):
+    """
+    Gắn handler cho logger 'packing' và đặt mức log. Gọi lại nhiều lần không tạo handler trùng.
+    level / overrides mặc định lấy từ biến môi trường LOG_LEVEL / LOG_LEVELS.
+    """
+    if level is None:
+        level = os.environ.get('LOG_LEVEL', DEFAULT_LEVEL)
+    if overrides is None:
+        overrides = os.environ.get('LOG_LEVELS', '')
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(str(level).upper())
+    if not any(getattr(h, '_packing_handler', False) for h in root.handlers):
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handler._packing_handler = True
+        root.addHandler(handler)
+        # Không chuyển tiếp lên root logger để tránh in trùng (ví dụ khi waitress cấu hình root)
+        root.propagate = False
+
+    for item in overrides.split(','):
+        if '=' in item:
+            name, name_level = item.split('=', 1)
+            logging.getLogger(name.strip()).setLevel(name_level.strip().upper())
+    return root
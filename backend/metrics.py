@@ -0,0 +1,188 @@
+# backend/metrics.py
+"""
+Metrics dạng Prometheus cho backend (GET /metrics), không cần thư viện hay dịch vụ ngoài.
+
+Hỗ trợ 3 loại metric cơ bản của định dạng text exposition 0.0.4:
+- Counter   : chỉ tăng.
+- Gauge     : giá trị tức thời (có thể lấy từ một hàm lúc scrape).
+- Histogram : đếm theo bucket (le), kèm _sum và _count.
+Mọi metric có thể có nhãn (labels). Các thao tác ghi an toàn khi nhiều luồng cùng gọi.
+"""
+import math
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000, 10_000_000, 25_000_000, 50_000_000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: cần đúng các nhãn {self.labelnames}, nhận được {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples())
+        return lines
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """Giá trị (không nhãn) được đọc từ function() mỗi lần scrape."""
+        self._function = function
+
+    def _render_samples(self):
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted((key, {'counts': list(s['counts']), 'sum': s['sum'], 'count': s['count']})
+                           for key, s in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for upper, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(upper))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    'packing_http_request_duration_seconds', 'Thời gian xử lý request theo endpoint.',
+    ('endpoint', 'method'), LATENCY_BUCKETS))
+REQUESTS_TOTAL = registry.register(Counter(
+    'packing_http_requests_total', 'Số request theo endpoint và mã trạng thái HTTP.',
+    ('endpoint', 'method', 'status')))
+UPLOAD_BYTES = registry.register(Histogram(
+    'packing_upload_bytes', 'Kích thước file Excel được upload (byte).', (), BYTES_BUCKETS))
+STAGE_DURATION = registry.register(Histogram(
+    'packing_pipeline_stage_duration_seconds', 'Thời gian từng giai đoạn của pipeline tối ưu hóa.',
+    ('stage',), STAGE_BUCKETS))
+PIPELINE_DURATION = registry.register(Histogram(
+    'packing_pipeline_duration_seconds', 'Tổng thời gian một lần chạy pipeline tối ưu hóa.',
+    (), LATENCY_BUCKETS))
+PIPELINE_OPERATIONS = registry.register(Counter(
+    'packing_pipeline_operations_total', 'Bộ đếm thao tác của pipeline (can_fit, add_pallet, split, ...).',
+    ('operation',)))
+UNPLACED_PALLETS = registry.register(Histogram(
+    'packing_unplaced_pallets', 'Số pallet không xếp được trong mỗi kết quả /api/process.',
+    (), COUNT_BUCKETS))
+JOBS_IN_FLIGHT = registry.register(Gauge(
+    'packing_jobs_in_flight', 'Số job tối ưu hóa đang chờ hoặc đang chạy (đồng bộ và bất đồng bộ).'))
+
+
+def record_pipeline_run(stats, unplaced_count):
+    """Ghi nhận một lần chạy pipeline (stats = PipelineStats.as_dict())."""
+    if stats is not None:
+        PIPELINE_DURATION.observe(stats['total_seconds'])
+        for item in stats['stages']:
+            STAGE_DURATION.observe(item['seconds'], stage=item['stage'])
+        for operation, value in stats['counters'].items():
+            PIPELINE_OPERATIONS.inc(value, operation=operation)
+    UNPLACED_PALLETS.observe(unplaced_count)
+
+
+def render_latest():
+    return registry.render()
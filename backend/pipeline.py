@@ -0,0 +1,179 @@
+# backend/pipeline.py
+"""
+Pipeline tối ưu hóa của /api/process: đọc dữ liệu, chạy chiến lược xếp được chọn (solvers.py,
+mặc định 'Iterative Solver V3') rồi đánh số container và tạo payload JSON.
+
+Được tách khỏi app.py để dùng chung cho:
+- request đồng bộ /api/process,
+- hàng đợi job bất đồng bộ (jobs.py), nơi tiến độ từng bước được báo qua callback `progress`.
+"""
+import gc
+import re
+
+from data_processor import *
+from instrumentation import PipelineStats, collect_stats
+from solvers import DEFAULT_STRATEGY, get_strategy
+
+# Các giai đoạn được báo cáo tiến độ, theo đúng thứ tự chạy: (khóa, mô tả)
+PIPELINE_STAGES = [
+    ('load', 'GIAI ĐOẠN 1: TẢI DỮ LIỆU'),
+    ('step_2', 'BƯỚC 2: TÁCH PALLET THÀNH PHẦN NGUYÊN VÀ LẺ'),
+    ('step_3', 'BƯỚC 3: XỬ LÝ PALLET NGUYÊN QUÁ KHỔ'),
+    ('step_4', 'BƯỚC 4: XẾP PALLET NGUYÊN CÓ KÍCH THƯỚC BÌNH THƯỜNG'),
+    ('step_5', 'BƯỚC 5: GỘP PALLET LẺ CÙNG CÔNG TY'),
+    ('step_5_5', 'BƯỚC 5.5: TỐI ƯU HÓA GHÉP LIÊN CÔNG TY'),
+    ('step_5_5b', 'BƯỚC 5.5b: NỚI LỎNG NGƯỠNG GỘP LÊN 0.95'),
+    ('step_5_6', 'BƯỚC 5.6: TÁCH NHỎ PALLET LẺ ĐỂ LẤP ĐẦY PALLET GỘP'),
+    ('pack_fractional', 'XẾP PALLET LẺ/GỘP VÀO CONTAINER'),
+    ('step_6', 'BƯỚC 6: VÒNG LẶP XỬ LÝ TOÀN BỘ PALLET CHỜ'),
+    ('waste', 'TỐI ƯU HÓA CONTAINER LÃNG PHÍ (ITERATIVE SOLVER V3)'),
+    ('step_6_5', 'BƯỚC 6.5: TỐI ƯU HÓA CROSS-SHIP'),
+    ('exact', 'TÌM LỜI GIẢI ÍT CONTAINER NHẤT (BRANCH-AND-BOUND, CHẾ ĐỘ EXACT)'),
+    ('finalize', 'GIAI ĐOẠN 7: HOÀN THIỆN VÀ TRẢ KẾT QUẢ'),
+]
+STAGE_LABELS = dict(PIPELINE_STAGES)
+
+
+def _generate_response_from_containers(containers):
+    """
+    Chuyển đổi danh sách các đối tượng Container thành định dạng JSON
+    mà frontend có thể hiểu được.
+    """
+    response_data = []
+    for container in containers:
+        container_dict = {
+            "id": container.id,
+            "main_company": container.main_company,
+            "total_quantity": round(container.total_quantity, 4),
+            "total_weight": round(container.total_weight, 2),
+            "total_logical_pallets": container.total_logical_pallets,
+            "contents": []
+        }
+
+        for pallet in sorted(container.pallets, key=lambda p: p.id):
+            content_block = {}
+            # Xử lý pallet gộp
+            if pallet.is_combined and len(pallet.original_pallets) > 1:
+                content_block['type'] = 'CombinedPallet'
+                content_block['id'] = pallet.id
+                content_block['quantity'] = round(pallet.quantity, 4)
+                content_block['total_weight'] = round(pallet.total_weight, 2)
+                content_block['is_cross_ship'] = pallet.is_cross_ship
+                content_block['items'] = []
+                for sub_pallet in sorted(pallet.original_pallets, key=lambda p: p.id):
+                    content_block['items'].append({
+                        "id": sub_pallet.id,
+                        "product_code": sub_pallet.product_code,
+                        "product_name": sub_pallet.product_name,
+                        "company": sub_pallet.company,
+                        "quantity": round(sub_pallet.quantity, 4),
+                        "total_weight": round(sub_pallet.total_weight, 2),
+                        "is_split": sub_pallet.is_split,
+                        "split_from_id": sub_pallet.split_from_id
+                    })
+            # Xử lý pallet đơn (không gộp hoặc gộp từ 1 pallet)
+            else:
+                # Nếu là pallet gộp nhưng chỉ có 1 item (do bị tách ra), vẫn hiển thị như pallet đơn
+                single_item = pallet.original_pallets[0] if pallet.is_combined else pallet
+                content_block['type'] = 'SinglePallet'
+                content_block['id'] = single_item.id
+                content_block['product_code'] = single_item.product_code
+                content_block['product_name'] = single_item.product_name
+                content_block['company'] = single_item.company
+                content_block['quantity'] = round(single_item.quantity, 4)
+                content_block['total_weight'] = round(single_item.total_weight, 2)
+                content_block['is_cross_ship'] = pallet.is_cross_ship # Lấy trạng thái cross-ship từ pallet cha
+                content_block['is_split'] = single_item.is_split
+                content_block['split_from_id'] = single_item.split_from_id
+
+            container_dict['contents'].append(content_block)
+        response_data.append(container_dict)
+
+    return {"success": True, "data": response_data}
+
+
+def run_optimization_pipeline(filepath, sheet_name, progress=None, strategy=DEFAULT_STRATEGY):
+    """
+    Chạy toàn bộ pipeline xếp pallet cho một sheet.
+    Trả về (payload, http_status): payload là dict JSON trả cho frontend.
+    progress(stage, detail) (tùy chọn) được gọi khi bắt đầu mỗi giai đoạn trong PIPELINE_STAGES
+    và ở đầu mỗi vòng lặp của BƯỚC 6.
+    Nếu đọc file thành công, payload có thêm khóa 'stats' (xem optimize_pallet_table).
+    strategy: tên chiến lược xếp (solvers.available_strategies()).
+    """
+    # --- GIAI ĐOẠN 1: TẢI DỮ LIỆU ---
+    stats = PipelineStats()
+    stats.start_stage('load')
+    if progress is not None:
+        progress('load', None)
+    pallet_table, error = load_pallet_table(filepath, sheet_name)
+    if error:
+        return {"success": False, "error": error}, 400
+    return optimize_pallet_table(pallet_table, progress, stats, strategy)
+
+
+def optimize_pallet_table(pallet_table, progress=None, stats=None, strategy=DEFAULT_STRATEGY):
+    """
+    Phần tính toán của pipeline (BƯỚC 2 -> GIAI ĐOẠN 7) trên bảng pallet đã làm sạch
+    (kết quả của load_pallet_table). Không đọc file nên chạy được trong tiến trình khác:
+    đầu vào là DataFrame (pickle gọn), đầu ra là payload JSON.
+    payload['stats'] chứa thời gian từng giai đoạn và các bộ đếm (PipelineStats.as_dict());
+    người gọi quyết định có trả khóa này cho frontend hay không.
+    ValueError nếu `strategy` không phải chiến lược đã đăng ký.
+    """
+    stats = stats if stats is not None else PipelineStats()
+
+    def report(stage, detail=None):
+        stats.start_stage(stage)
+        if progress is not None:
+            progress(stage, detail)
+
+    with collect_stats(stats):
+        payload, http_status = _run_pipeline_stages(pallet_table, report, stats, strategy)
+    stats.finish()
+    payload['stats'] = stats.as_dict()
+    return payload, http_status
+
+
+def _run_pipeline_stages(pallet_table, report, stats, strategy):
+    solve = get_strategy(strategy)
+    all_pallets = build_pallets_from_frame(pallet_table)
+    if not all_pallets:
+        return {"success": False, "error": "Không có dữ liệu pallet hợp lệ để xử lý."}, 400
+
+    # --- BƯỚC 2 -> 6.5: CHIẾN LƯỢC XẾP ĐƯỢC CHỌN (mặc định 'v3') ---
+    result = solve(all_pallets, report, stats)
+    fully_optimized_containers = result.containers
+    unplaced_integer_pallets = result.unplaced_integer
+    unplaced_fractional_pallets = result.unplaced_fractional
+
+    # --- GIAI ĐOẠN 7: HOÀN THIỆN VÀ TRẢ KẾT QUẢ ---
+    report('finalize')
+    fully_optimized_containers.sort(key=lambda c: int(re.search(r'\d+', c.id).group()))
+    for i, container in enumerate(fully_optimized_containers, 1):
+        container.id = f"Cont_{i}"
+    # Mọi container được tạo ra mà không còn trong kết quả cuối đều đã bị loại bỏ (gộp/tiêu hủy)
+    stats.containers_eliminated = max(0, stats.containers_created - len(fully_optimized_containers))
+
+    response_dict = _generate_response_from_containers(fully_optimized_containers)
+    final_response = {
+        "success": response_dict.get("success", True),
+        "results": response_dict.get("data", [])
+    }
+
+    unplaced_info = []
+    for p in (unplaced_integer_pallets or []):
+        unplaced_info.append(f"Pallet nguyên: {p.id} ({p.quantity} qty, {p.total_weight} wgt)")
+    for p in (unplaced_fractional_pallets or []):
+         unplaced_info.append(f"Pallet lẻ/gộp: {p.id} ({p.quantity} qty, {p.total_weight} wgt)")
+
+    if unplaced_info:
+        final_response["warning"] = "Không thể xếp hết tất cả pallet. Các pallet còn lại là:"
+        final_response["unplaced_pallets"] = unplaced_info
+
+    if result.info is not None:
+        final_response["solver"] = result.info
+
+    gc.collect()
+    return final_response, 200
+
@@ -0,0 +1,488 @@
+# backend/solvers.py
+"""
+Các chiến lược xếp pallet (solver) dùng chung một giao diện, chọn theo tên qua tham số
+"strategy" của /api/process.
+
+Một chiến lược là một hàm solve(pallets, report, stats) -> PackingResult:
+- pallets : danh sách Pallet đã tạo từ bảng dữ liệu (build_pallets_from_frame);
+- report  : report(stage, detail=None), gọi khi bắt đầu mỗi giai đoạn (khóa trong
+            pipeline.PIPELINE_STAGES) để đo thời gian và báo tiến độ; chiến lược có thể bỏ qua
+            các giai đoạn không dùng;
+- stats   : PipelineStats của lần chạy (bộ đếm riêng của chiến lược, ví dụ step6_iterations).
+Ràng buộc (MAX_PALLETS, MAX_WEIGHT, số dòng Packing List) là chung cho mọi chiến lược và được
+kiểm tra bởi Container.can_fit. Việc đánh số lại container và tạo payload JSON do pipeline làm.
+
+Chiến lược có sẵn:
+- 'v3'     : pipeline đầy đủ 'Iterative Solver V3' (mặc định);
+- 'greedy' : nhanh, chỉ xếp tham lam (BƯỚC 2 -> 5 rồi first-fit), không có vòng lặp BƯỚC 6
+             và các bước tối ưu container lãng phí / cross-ship;
+- 'exact'  : cho đơn hàng nhỏ: chạy 'v3' rồi tìm lời giải ít container hơn (cùng số container
+             thì ít dòng xếp chéo công ty hơn) bằng branch-and-bound (exact_solver.py) trong
+             EXACT_TIME_BUDGET giây; hết thời gian hoặc đơn hàng quá lớn (> EXACT_MAX_ITEMS
+             pallet) thì giữ kết quả của 'v3'.
+Đăng ký chiến lược mới bằng decorator @register_strategy(name, description).
+"""
+import copy
+import logging
+import os
+import re
+import time
+from collections import namedtuple
+
+from bounds import container_lower_bounds
+from data_processor import *
+from exact_solver import solve_bin_packing
+
+logger = logging.getLogger('packing.solver')
+
+# unplaced_integer / unplaced_fractional: pallet không xếp được (được liệt kê trong payload)
+# info: thông tin thêm của chiến lược (tùy chọn), được trả trong payload['solver']
+PackingResult = namedtuple('PackingResult', ['containers', 'unplaced_integer', 'unplaced_fractional', 'info'],
+                           defaults=(None,))
+
+DEFAULT_STRATEGY = 'v3'
+
+# Chế độ 'exact': thời gian tối đa cho branch-and-bound (giây) và số pallet (sau khi gộp/tách
+# pallet lẻ) tối đa để thử tìm lời giải chính xác
+EXACT_TIME_BUDGET = float(os.environ.get('EXACT_TIME_BUDGET', 5.0))
+EXACT_MAX_ITEMS = int(os.environ.get('EXACT_MAX_ITEMS', 60))
+
+# name -> (hàm solve, mô tả)
+_STRATEGIES = {}
+
+
+def register_strategy(name, description):
+    """Decorator đăng ký một hàm solve(pallets, report, stats) dưới tên `name`."""
+    def decorator(solve):
+        _STRATEGIES[name] = (solve, description)
+        return solve
+    return decorator
+
+
+def get_strategy(name):
+    """Hàm solve của chiến lược `name`; ValueError nếu không tồn tại."""
+    try:
+        return _STRATEGIES[name][0]
+    except KeyError:
+        raise ValueError(
+            f"Chiến lược xếp '{name}' không hợp lệ. Các chiến lược có sẵn: {', '.join(sorted(_STRATEGIES))}."
+        ) from None
+
+
+def available_strategies():
+    """{tên: mô tả} của các chiến lược đã đăng ký."""
+    return {name: description for name, (_, description) in _STRATEGIES.items()}
+
+
+def _prepare_fractional_units(fractional_pallets, report):
+    """
+    BƯỚC 5 -> 5.6: gộp pallet lẻ cùng công ty, ghép liên công ty, nới lỏng ngưỡng 0.95 và tách
+    nhỏ pallet lẻ để lấp đầy pallet gộp. Trả về danh sách pallet lẻ/gộp sẵn sàng để xếp.
+    """
+    # --- BƯỚC 5: GỘP PALLET LẺ CÙNG CÔNG TY ---
+    report('step_5')
+    logger.info("# BƯỚC 5: GỘP PALLET LẺ CÙNG CÔNG TY #")
+    combined_pallets_same_company, uncombined_pallets = combine_fractional_pallets(fractional_pallets)
+
+    last_combined_id = 0
+    if combined_pallets_same_company:
+        last_combined_id = max([int(re.search(r'\d+', p.id).group()) for p in combined_pallets_same_company])
+    next_id_for_mixed = last_combined_id + 1
+
+    # --- BƯỚC 5.5: TỐI ƯU HÓA GHÉP LIÊN CÔNG TY ---
+    report('step_5_5')
+    logger.info("# BƯỚC 5.5: TỐI ƯU HÓA GHÉP LIÊN CÔNG TY #")
+    newly_combined_mixed, remaining_fractionals, next_id_for_mixed = optimize_cross_company_combination(
+        combined_pallets_same_company, uncombined_pallets, next_id_for_mixed
+    )
+
+    # --- BƯỚC 5.5b (MỚI THÊM): NỚI LỎNG NGƯỠNG GỘP LÊN 0.95 ---
+    report('step_5_5b')
+    logger.info("# BƯỚC 5.5b: NỚI LỎNG NGƯỠNG GỘP LÊN 0.95 (CÙNG & LIÊN CTY) #")
+    current_combined_5_5 = newly_combined_mixed + [p for p in remaining_fractionals if p.is_combined]
+    current_single_5_5 = [p for p in remaining_fractionals if not p.is_combined]
+
+    relaxed_combined, relaxed_singles, next_id_for_mixed = optimize_combination_relaxed_threshold(
+        current_combined_5_5, current_single_5_5, next_id_for_mixed, threshold=0.95
+    )
+
+    # --- BƯỚC 5.6 (MỚI THÊM): TÁCH NHỎ PALLET LẺ ĐỂ LẤP ĐẦY PALLET GỘP ---
+    report('step_5_6')
+    logger.info("# BƯỚC 5.6: TÁCH NHỎ PALLET LẺ ĐỂ LẤP ĐẦY PALLET GỘP #")
+    final_combined_5_6, final_singles_5_6 = optimize_by_splitting_and_filling_fractionals(
+        relaxed_combined, 
+        relaxed_singles
+    )
+
+    # Gộp tất cả các pallet lẻ/gộp lại để chuẩn bị xếp
+    return final_combined_5_6 + final_singles_5_6
+
+
+@register_strategy('v3', "Pipeline đầy đủ 'Iterative Solver V3': chất lượng tốt nhất, chậm nhất.")
+def solve_iterative_v3(all_pallets, report, stats):
+    """Pipeline tối ưu hóa đầy đủ (BƯỚC 2 -> BƯỚC 6.5) của /api/process."""
+    # --- BƯỚC 2: TÁCH TOÀN BỘ PALLET THÀNH PHẦN NGUYÊN VÀ LẺ ---
+    report('step_2')
+    logger.info("# BƯỚC 2: TÁCH TOÀN BỘ PALLET THÀNH PHẦN NGUYÊN VÀ LẺ #")
+    integer_pallets, fractional_pallets = split_integer_fractional_pallets(all_pallets)
+
+    # --- BƯỚC 3: XỬ LÝ PALLET NGUYÊN QUÁ KHỔ ---
+    report('step_3')
+    logger.info("# BƯỚC 3: XỬ LÝ PALLET NGUYÊN QUÁ KHỔ #")
+    oversized_containers, regular_sized_integer_pallets, container_id_counter = handle_all_oversized_pallets(
+        all_pallets=integer_pallets,
+        start_container_id=1
+    )
+
+    # --- BƯỚC 4: XẾP CÁC PALLET NGUYÊN CÓ KÍCH THƯỚC BÌNH THƯỜNG ---
+    report('step_4')
+    logger.info("# BƯỚC 4: XẾP PALLET NGUYÊN CÓ KÍCH THƯỚC BÌNH THƯỜNG #")
+    final_containers = list(oversized_containers)
+    final_containers, unplaced_integer_pallets, container_id_counter = pack_integer_pallets(
+        regular_sized_integer_pallets,
+        final_containers,
+        container_id_counter
+    )
+
+    # --- BƯỚC 5 -> 5.6: GỘP / GHÉP / TÁCH PALLET LẺ ---
+    pallets_to_pack_fractional = _prepare_fractional_units(fractional_pallets, report)
+
+    # Xếp các pallet fractional đã tối ưu vào container
+    report('pack_fractional')
+    unplaced_fractional_pallets = pack_fractional_pallets(pallets_to_pack_fractional, final_containers)
+
+    # --- BƯỚC 6: VÒNG LẶP XỬ LÝ TOÀN BỘ PALLET CHỜ ---
+    report('step_6')
+    logger.info("# BƯỚC 6: VÒNG LẶP XỬ LÝ TOÀN BỘ PALLET CHỜ #")
+    loop_counter = 0
+    # Sức chứa còn trống theo công ty của final_containers, cập nhật dần qua các vòng lặp
+    capacity = CapacityAggregates(final_containers)
+    while unplaced_integer_pallets or unplaced_fractional_pallets:
+        loop_counter += 1
+        if loop_counter > 20: 
+            logger.warning("Warning: Loop limit reached. Breaking.")
+            break
+        stats.step6_iterations += 1
+
+        pallets_before_iteration = len(unplaced_integer_pallets) + len(unplaced_fractional_pallets)
+        report('step_6', f"Vòng lặp {loop_counter}, còn {pallets_before_iteration} pallet chờ")
+        logger.info("--- Bắt đầu vòng lặp xử lý pallet chờ lần thứ %s ---", loop_counter)
+
+        # === 6.1: ƯU TIÊN XỬ LÝ DANH SÁCH PALLET NGUYÊN CHỜ ===
+        if unplaced_integer_pallets:
+            unplaced_integer_pallets = try_pack_pallets_into_same_company_containers(unplaced_integer_pallets, final_containers)
+
+            if unplaced_integer_pallets:
+                can_cross_ship_all = check_cross_ship_capacity_for_list(
+                    unplaced_integer_pallets, final_containers, unplaced_fractional_pallets, capacity)
+
+                if can_cross_ship_all:
+                    unplaced_integer_pallets = handle_unplaced_pallets_with_smart_splitting(
+                        unplaced_integer_pallets, final_containers, unplaced_fractional_pallets, capacity)
+                    if unplaced_integer_pallets:
+                        final_containers, container_id_counter = handle_remaining_integers_iteratively(
+                            unplaced_integer_pallets, final_containers, container_id_counter, capacity)
+                        unplaced_integer_pallets = []
+                else:
+                    unplaced_integer_pallets = attempt_partial_cross_ship(unplaced_integer_pallets, final_containers, unplaced_fractional_pallets)
+                    if unplaced_integer_pallets:
+                        unplaced_integer_pallets, final_containers, container_id_counter = create_and_pack_one_new_container(
+                            unplaced_integer_pallets, final_containers, container_id_counter, unplaced_fractional_pallets,
+                            capacity
+                        )
+
+        # === 6.2: XỬ LÝ DANH SÁCH PALLET LẺ/GỘP CHỜ ===
+        if unplaced_fractional_pallets:
+            # 6.2.1: Thử xếp nguyên vẹn cùng công ty
+            unplaced_fractional_pallets = try_pack_unplaced_fractionals_same_company(unplaced_fractional_pallets, final_containers)
+
+            # --- ĐOẠN MỚI THÊM: XỬ LÝ PALLET HỖN HỢP TRƯỚC LẮP GHÉP ---
+            mixed_pallets_to_place = [p for p in unplaced_fractional_pallets if "+" in str(p.company)]
+            unplaced_fractional_pallets = [p for p in unplaced_fractional_pallets if "+" not in str(p.company)]
+
+            if mixed_pallets_to_place:
+                with ContainerIndex(final_containers) as container_index:
+                    for mixed_pallet in list(mixed_pallets_to_place):
+                        placed = False
+                        container = container_index.best_fit(mixed_pallet)
+                        if container is not None:
+                            container.add_pallet(mixed_pallet)
+                            placed = True
+                        if not placed:
+                             unplaced_fractional_pallets.append(mixed_pallet)
+            # --------------------------------------------------------
+
+            # 6.2.2: Lắp ghép nâng cao (Repack)
+            if unplaced_fractional_pallets:
+                unplaced_fractional_pallets = repack_unplaced_pallets(unplaced_fractional_pallets, final_containers)
+
+            # 6.2.3: Chia nhỏ tỉ mỉ (Split & Fit)
+            if unplaced_fractional_pallets:
+               final_containers, container_id_counter, unplaced_fractional_pallets = split_and_fit_leftovers(
+                       unplaced_fractional_pallets, final_containers, container_id_counter
+               )
+
+            # 6.2.4: Xếp chéo (Cross-ship)
+            if unplaced_fractional_pallets:
+              unplaced_fractional_pallets, container_id_counter = cross_ship_remaining_pallets(
+                  unplaced_pallets=unplaced_fractional_pallets,
+                  containers=final_containers,
+                  next_container_id=container_id_counter,
+                  unplaced_integer_pallets=unplaced_integer_pallets,
+                  capacity=capacity
+             )
+
+        # === 6.3: KIỂM TRA TIẾN TRIỂN ===
+        pallets_after_iteration = len(unplaced_integer_pallets) + len(unplaced_fractional_pallets)
+
+        if pallets_after_iteration > 0 and pallets_after_iteration == pallets_before_iteration:
+            logger.warning("Warning: No progress in packing loop. Breaking to avoid infinite loop.")
+            break
+
+        # === 6.4: XỬ LÝ PALLET HỖN HỢP CÒN SÓT LẠI VÀO CUỐI VÒNG LẶP ===
+        mixed_pallets_to_place = [p for p in unplaced_fractional_pallets if "+" in str(p.company)]
+
+        if mixed_pallets_to_place:
+            # Danh sách chờ có chỉ mục theo id: xóa pallet đã xếp trong O(1)
+            waiting_fractionals = PalletIndex(unplaced_fractional_pallets)
+            with ContainerIndex(final_containers) as container_index:
+                for mixed_pallet in list(mixed_pallets_to_place):
+                    placed = False
+                    container = container_index.best_fit(mixed_pallet)
+                    if container is not None:
+                        container.add_pallet(mixed_pallet)
+                        placed = True
+                        waiting_fractionals.remove(mixed_pallet)
+                    if not placed:
+                        logger.debug("  [-] (Chưa xếp được) Pallet hỗn hợp %s vẫn trong danh sách chờ.", mixed_pallet.id)
+            unplaced_fractional_pallets = list(waiting_fractionals)
+    capacity.close()
+
+    # --- GIAI ĐOẠN TỐI ƯU: XỬ LÝ CONTAINER LÃNG PHÍ ---
+    report('waste')
+    logger.info("================================================================================")
+    logger.info("BẮT ĐẦU GIAI ĐOẠN TỐI ƯU HÓA: XỬ LÝ CONTAINER LÃNG PHÍ (ITERATIVE SOLVER V3)")
+    logger.info("================================================================================")
+
+    fully_optimized_containers = solve_waste_container_iteratively(final_containers)
+
+    # --- BƯỚC 6.5 (MỚI THÊM): GỌI HÀM TỐI ƯU HÓA CROSS-SHIP ---
+    report('step_6_5')
+    fully_optimized_containers = optimize_cross_company_combination_v2(fully_optimized_containers)
+
+    return PackingResult(fully_optimized_containers, unplaced_integer_pallets or [], unplaced_fractional_pallets or [])
+
+
+def _first_fit(pallet, container_index):
+    """Container cùng công ty còn ít chỗ nhất chứa được pallet, nếu không có thì container bất kỳ."""
+    container = container_index.best_fit(pallet, company=str(pallet.company))
+    if container is None:
+        container = container_index.best_fit(pallet)
+    return container
+
+
+@register_strategy('greedy', "Nhanh: tách/gộp pallet rồi xếp tham lam (first-fit), không lặp tối ưu.")
+def solve_greedy(all_pallets, report, stats):
+    """
+    Chế độ nhanh: dùng lại BƯỚC 2 -> 5 và bước xếp pallet lẻ cùng công ty, sau đó xếp mọi pallet
+    còn chờ theo thứ tự số lượng giảm dần vào container phù hợp đầu tiên (ưu tiên cùng công ty,
+    rồi xếp chéo) hoặc mở container mới. Bỏ qua vòng lặp BƯỚC 6, tối ưu container lãng phí và
+    BƯỚC 6.5 nên có thể dùng nhiều container hơn 'v3'.
+    """
+    report('step_2')
+    integer_pallets, fractional_pallets = split_integer_fractional_pallets(all_pallets)
+
+    report('step_3')
+    oversized_containers, regular_sized_integer_pallets, container_id_counter = handle_all_oversized_pallets(
+        all_pallets=integer_pallets,
+        start_container_id=1
+    )
+
+    report('step_4')
+    containers, waiting, container_id_counter = pack_integer_pallets(
+        regular_sized_integer_pallets,
+        list(oversized_containers),
+        container_id_counter
+    )
+
+    report('step_5')
+    combined_pallets, uncombined_pallets = combine_fractional_pallets(fractional_pallets)
+
+    report('pack_fractional')
+    waiting = waiting + pack_fractional_pallets(combined_pallets + uncombined_pallets, containers)
+
+    report('step_6')
+    unplaced_integer, unplaced_fractional = [], []
+    with ContainerIndex(containers) as container_index:
+        for pallet in sorted(waiting, key=lambda p: p.quantity, reverse=True):
+            container = _first_fit(pallet, container_index)
+            if container is None:
+                container = Container(container_id=f"C{container_id_counter}", main_company=pallet.company)
+                if not container.can_fit(pallet):
+                    # Pallet không vừa cả một container rỗng
+                    (unplaced_integer if pallet.is_integer else unplaced_fractional).append(pallet)
+                    continue
+                container_id_counter += 1
+                containers.append(container)
+                container_index.add(container)
+            container.add_pallet(pallet)
+
+    return PackingResult(containers, unplaced_integer, unplaced_fractional)
+
+
+def _main_company(pallets):
+    """
+    Công ty có nhiều dòng Packing List nhất trong các pallet (bằng nhau thì tổng số lượng lớn hơn),
+    không tính pallet gộp liên công ty - giống cách exact_solver tính số dòng xếp chéo.
+    """
+    lines, totals = {}, {}
+    for pallet in pallets:
+        if "+" not in str(pallet.company):
+            company = str(pallet.company)
+            lines[company] = lines.get(company, 0) + pallet.logical_pallet_count
+            totals[company] = totals.get(company, 0.0) + pallet.quantity
+    if lines:
+        return max(sorted(lines), key=lambda company: (lines[company], totals[company]))
+    return str(pallets[0].company).split('+')[0]
+
+
+def _cross_ship_lines(containers):
+    """Số dòng Packing List của các pallet không thuộc công ty chính của container chứa nó."""
+    return sum(p.logical_pallet_count for c in containers for p in c.pallets
+               if str(p.company) != str(c.main_company))
+
+
+def _fits_empty_container(pallet):
+    """Như Container.can_fit với một container rỗng."""
+    return (pallet.logical_pallet_count <= MAX_PALLETS
+            and pallet.quantity <= MAX_PALLETS + EPSILON
+            and pallet.total_weight <= MAX_WEIGHT + EPSILON)
+
+
+def _is_fractional(pallet):
+    return not pallet.is_integer
+
+
+@register_strategy('exact', "Chính xác cho đơn hàng nhỏ: 'v3' + branch-and-bound có giới hạn thời gian.")
+def solve_exact(all_pallets, report, stats):
+    """
+    Chạy 'v3' (trên bản sao pallet) làm lời giải ban đầu. Nếu lời giải đó chưa đạt cận dưới
+    toàn cục (bounds.py), tách/gộp pallet như BƯỚC 2 -> 5.6 rồi tìm bằng branch-and-bound cách
+    xếp các pallet đó vào ít container hơn. Kết quả 'v3' được giữ lại khi không tìm được lời giải
+    tốt hơn, hết EXACT_TIME_BUDGET hoặc đơn hàng có nhiều hơn EXACT_MAX_ITEMS pallet.
+
+    Cùng số container thì lời giải có ít dòng xếp chéo công ty hơn (info['cross_ship_lines'], xem
+    _cross_ship_lines) được chọn; hòa thì giữ kết quả 'v3'. Container mới nhận công ty có nhiều
+    dòng nhất làm công ty chính.
+
+    info['status']:
+    - 'optimal'          : số container bằng cận dưới toàn cục và không có dòng xếp chéo, chắc chắn
+                           tối ưu;
+    - 'optimal_for_units': đã duyệt hết mọi cách xếp các pallet sau BƯỚC 5.6 (không tách thêm);
+    - 'timeout'          : hết thời gian, trả lời giải tốt nhất đã tìm được;
+    - 'too_large'        : quá nhiều pallet, dùng kết quả 'v3';
+    - 'fallback'         : (phòng thủ) lời giải tìm được bị Container.can_fit từ chối, dùng kết quả
+                           'v3'. Tìm kiếm dùng cùng phép so sánh và cùng thứ tự cộng như Container
+                           nên trạng thái này không xảy ra nếu hai bên nhất quán.
+    """
+    started = time.perf_counter()
+    lower_bound = container_lower_bounds(all_pallets)['global']
+    heuristic = solve_iterative_v3(copy.deepcopy(all_pallets), report, stats)
+    heuristic_unplaced = len(heuristic.unplaced_integer) + len(heuristic.unplaced_fractional)
+    info = {
+        'status': None,
+        'lower_bound': lower_bound,
+        'heuristic_containers': len(heuristic.containers),
+        'containers': len(heuristic.containers),
+        'heuristic_cross_ship_lines': _cross_ship_lines(heuristic.containers),
+        'cross_ship_lines': None,
+        'nodes': 0,
+        'seconds': None,
+    }
+
+    def finish(result, status):
+        info['status'] = status
+        info['containers'] = len(result.containers)
+        info['cross_ship_lines'] = _cross_ship_lines(result.containers)
+        info['seconds'] = round(time.perf_counter() - started, 6)
+        logger.info("Chế độ exact: %s, %s container (v3: %s, cận dưới %s), %s nút.",
+                    status, info['containers'], info['heuristic_containers'], lower_bound, info['nodes'])
+        return result._replace(info=info)
+
+    if (not heuristic_unplaced and len(heuristic.containers) <= lower_bound
+            and not info['heuristic_cross_ship_lines']):
+        return finish(heuristic, 'optimal')
+
+    # Pallet dùng cho tìm kiếm: cùng cách tách/gộp của 'v3' nhưng chưa xếp vào container nào.
+    # Các bước con được tính chung vào giai đoạn 'exact'.
+    report('exact')
+    silent = lambda stage, detail=None: None
+    integer_pallets, fractional_pallets = split_integer_fractional_pallets(all_pallets)
+    oversized_containers, regular_integer_pallets, container_id_counter = handle_all_oversized_pallets(
+        all_pallets=integer_pallets,
+        start_container_id=1
+    )
+    units = regular_integer_pallets + _prepare_fractional_units(fractional_pallets, silent)
+
+    unplaceable = [p for p in units if not _fits_empty_container(p)]
+    units = [p for p in units if _fits_empty_container(p)]
+    if len(units) > EXACT_MAX_ITEMS:
+        return finish(heuristic, 'too_large')
+
+    # Chỉ nhận lời giải mới nếu nó tốt hơn: ít pallet không xếp được hơn, hoặc bằng nhau nhưng
+    # ít container hơn, hoặc cùng số container nhưng ít dòng xếp chéo hơn
+    upper_bound = upper_bound_cross = None
+    if len(unplaceable) >= heuristic_unplaced:
+        upper_bound = len(heuristic.containers)
+        if len(unplaceable) == heuristic_unplaced:
+            upper_bound_cross = info['heuristic_cross_ship_lines']
+    # Cùng phép so sánh với Container.can_fit: số nguyên không sai số, hoặc tổng chính xác của
+    # các giá trị float với sai số EPSILON
+    if FIXED_POINT_CAPACITY:
+        size = lambda p: (p.quantity_units, p.weight_units)
+        capacity, tolerance = (MAX_QUANTITY_UNITS, MAX_WEIGHT_UNITS, MAX_PALLETS), 0
+    else:
+        size = lambda p: (p.quantity, p.total_weight)
+        capacity, tolerance = (MAX_PALLETS, MAX_WEIGHT, MAX_PALLETS), EPSILON
+    search = solve_bin_packing(
+        [size(p) + (p.logical_pallet_count, p.company) for p in units],
+        capacity=capacity,
+        tolerance=tolerance,
+        fixed_bins=[([size(p)[0] for p in c.pallets], [size(p)[1] for p in c.pallets],
+                     c.total_logical_pallets, c.main_company)
+                    for c in oversized_containers],
+        upper_bound=upper_bound,
+        lower_bound=lower_bound,
+        time_budget=max(0.0, EXACT_TIME_BUDGET - (time.perf_counter() - started)),
+        upper_bound_cross=upper_bound_cross,
+    )
+    info['nodes'] = search.nodes
+    status = 'optimal_for_units' if search.proven else 'timeout'
+    if search.assignment is None:
+        return finish(heuristic, status)
+
+    bins = {}
+    for pallet, b in zip(units, search.assignment):
+        bins.setdefault(b, []).append(pallet)
+    containers = list(oversized_containers)
+    bin_containers = dict(enumerate(oversized_containers))
+    for b in sorted(bins):
+        if b not in bin_containers:
+            bin_containers[b] = Container(container_id=f"C{container_id_counter}", main_company=_main_company(bins[b]))
+            containers.append(bin_containers[b])
+            container_id_counter += 1
+    # Xếp theo đúng thứ tự của tìm kiếm để can_fit so sánh cùng các tổng
+    for i in search.order:
+        container = bin_containers[search.assignment[i]]
+        if not container.can_fit(units[i]):
+            return finish(heuristic, 'fallback')
+        container.add_pallet(units[i])
+
+    result = PackingResult(
+        containers,
+        [p for p in unplaceable if not _is_fractional(p)],
+        [p for p in unplaceable if _is_fractional(p)],
+    )
+    if len(containers) <= lower_bound and not unplaceable and not search.cross_lines:
+        status = 'optimal'
+    return finish(result, status)
@@ -0,0 +1,462 @@
+# backend/workbook_cache.py
+"""
+Đọc sheet Excel MỘT LẦN và dùng chung cho cả bước tối ưu hóa (load_and_prepare_pallets)
+lẫn bước tạo Packing List (load_and_map_raw_data_for_pkl).
+
+- Sheet được đọc với tập hợp tất cả các cột mà hai bước trên cần (RAW_COLUMNS),
+  bắt đầu từ dòng 6 (bỏ qua 5 dòng tiêu đề), cột được đánh số theo vị trí gốc trong sheet.
+- Kết quả được lưu trong bộ nhớ theo khóa (hash nội dung file, tên sheet), nên khi
+  người dùng upload đè một file khác cùng tên, khóa tự thay đổi.
+- Nếu đã gọi enable_disk_cache(thư_mục), sheet đã parse còn được ghi xuống đĩa
+  (mỗi cột một file .npy, đọc lại bằng memory-map) để các request sau - kể cả sau khi
+  khởi động lại server - không phải parse lại file Excel.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Hợp của các cột dùng cho tối ưu hóa (1, 2, 3, 7, 10, 11) và Packing List (1, 2, 4, 5, 6, 7, 12, 48)
+RAW_COLUMNS = [1, 2, 3, 4, 5, 6, 7, 10, 11, 12, 48]
+HEADER_ROWS = 5
+# Số sheet đã đọc được giữ lại trong bộ nhớ (LRU)
+MAX_CACHED_SHEETS = 8
+# Số file được nhớ hash nội dung / danh sách tên sheet (LRU, mỗi đường dẫn một mục)
+MAX_CACHED_FILES = 64
+# True: đọc .xlsx bằng openpyxl read_only, chỉ giữ RAW_COLUMNS (bộ nhớ thấp với file lớn)
+# False: dùng pd.read_excel như trước
+USE_STREAMING_READER = True
+
+# Cache trên đĩa (sidecar): tắt cho tới khi gọi enable_disk_cache()
+SIDECAR_FORMAT_VERSION = 1
+DEFAULT_SIDECAR_MAX_BYTES = 512 * 1024 * 1024
+
+# Mã kiểu giá trị cho cột object (trộn chuỗi / số / ô trống)
+_KIND_EMPTY, _KIND_STR, _KIND_INT, _KIND_FLOAT, _KIND_BOOL = 0, 1, 2, 3, 4
+
+logger = logging.getLogger('packing.workbook')
+
+_lock = threading.Lock()
+_sheet_cache = OrderedDict()   # (file_hash, sheet_name) -> DataFrame
+_sheet_names_cache = OrderedDict()  # đường dẫn -> ((kích thước, mtime), [tên sheet])
+_inflight = {}                 # (file_hash, sheet_name) -> threading.Event, sheet đang được parse
+_hash_cache = OrderedDict()    # đường dẫn -> ((kích thước, mtime), file_hash)
+_sidecar_dir = None
+_sidecar_max_bytes = DEFAULT_SIDECAR_MAX_BYTES
+
+
+def _file_stamp(filepath):
+    stat = os.stat(filepath)
+    return os.path.abspath(filepath), (stat.st_size, stat.st_mtime_ns)
+
+
+def _get_for_stamp(cache, path, stamp):
+    """Giá trị đã nhớ của file nếu file chưa đổi (kích thước, mtime); gọi khi đang giữ _lock."""
+    entry = cache.get(path)
+    if entry is None or entry[0] != stamp:
+        return None
+    cache.move_to_end(path)
+    return entry[1]
+
+
+def _put_for_stamp(cache, path, stamp, value):
+    """Nhớ giá trị mới của file (thay mục cũ cùng đường dẫn), tối đa MAX_CACHED_FILES mục; gọi khi giữ _lock."""
+    cache[path] = (stamp, value)
+    cache.move_to_end(path)
+    while len(cache) > MAX_CACHED_FILES:
+        cache.popitem(last=False)
+
+
+def file_content_hash(filepath):
+    """Hash SHA-1 nội dung file; được nhớ lại theo đường dẫn cho tới khi kích thước/thời gian sửa đổi."""
+    path, stamp = _file_stamp(filepath)
+    with _lock:
+        cached = _get_for_stamp(_hash_cache, path, stamp)
+    if cached:
+        return cached
+
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    file_hash = digest.hexdigest()
+    with _lock:
+        _put_for_stamp(_hash_cache, path, stamp, file_hash)
+    return file_hash
+
+
+def _convert_cell(cell):
+    """Chuyển giá trị ô giống hệt pandas (ô trống -> '', ô lỗi -> NaN, số nguyên -> int)."""
+    value = cell.value
+    if value is None:
+        return ''
+    if cell.data_type == 'e':
+        return np.nan
+    if cell.data_type == 'n':
+        as_int = int(value)
+        return as_int if as_int == value else float(value)
+    return value
+
+
+def _stream_sheet(filepath, sheet_name):
+    """
+    Đọc sheet bằng openpyxl read_only: duyệt từng dòng từ dòng 6 trở đi và chỉ giữ lại
+    các ô thuộc RAW_COLUMNS, nên bộ nhớ chỉ tỉ lệ với số cột cần dùng chứ không phải
+    toàn bộ sheet. Kiểu dữ liệu các cột được suy ra giống pd.read_excel.
+    """
+    from openpyxl import load_workbook
+    from pandas.io.parsers import TextParser
+
+    wb = load_workbook(filepath, read_only=True, data_only=True, keep_links=False)
+    try:
+        if sheet_name not in wb.sheetnames:
+            raise ValueError(f"No sheet named '{sheet_name}'")
+        ws = wb[sheet_name]
+        ws.reset_dimensions()
+
+        empty_row = [''] * len(RAW_COLUMNS)
+        rows = []
+        rows_with_data = 0
+        for row in ws.iter_rows(min_row=HEADER_ROWS + 1):
+            width = len(row)
+            kept = [_convert_cell(row[c]) if c < width else '' for c in RAW_COLUMNS]
+            rows.append(kept)
+            # Giống pandas: dòng có dữ liệu ở BẤT KỲ cột nào (kể cả cột không dùng) vẫn được giữ
+            if kept != empty_row or any(cell.value is not None and cell.value != '' for cell in row):
+                rows_with_data = len(rows)
+    finally:
+        wb.close()
+
+    # Bỏ các dòng trống ở cuối sheet
+    del rows[rows_with_data:]
+    if not rows:
+        return pd.DataFrame().reindex(columns=RAW_COLUMNS)
+
+    df = TextParser(rows, header=None, skip_blank_lines=False).read()
+    df.columns = RAW_COLUMNS
+    return df
+
+
+def _parse_sheet(filepath, sheet_name):
+    if USE_STREAMING_READER and filepath.lower().endswith(('.xlsx', '.xlsm')):
+        return _stream_sheet(filepath, sheet_name)
+    df = pd.read_excel(filepath, sheet_name=sheet_name, header=None, skiprows=HEADER_ROWS)
+    # Cột không tồn tại trong sheet (ví dụ sheet ngắn hơn cột AW) được điền NaN
+    return df.reindex(columns=RAW_COLUMNS)
+
+
+# ==============================================================================
+# CACHE TRÊN ĐĨA (SIDECAR)
+# ==============================================================================
+def enable_disk_cache(directory, max_bytes=DEFAULT_SIDECAR_MAX_BYTES):
+    """
+    Bật cache sidecar trong `directory` (thường là UPLOAD_FOLDER/.sheet_cache).
+    Tổng dung lượng được giới hạn bởi `max_bytes`; mục ít dùng nhất bị xóa trước.
+    """
+    global _sidecar_dir, _sidecar_max_bytes
+    os.makedirs(directory, exist_ok=True)
+    _sidecar_dir = directory
+    _sidecar_max_bytes = max_bytes
+
+
+def _sidecar_path(file_hash, sheet_name):
+    sheet_digest = hashlib.sha1(str(sheet_name).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(_sidecar_dir, f"{file_hash}-{sheet_digest}")
+
+
+def _encode_object_column(values):
+    """
+    Mã hóa cột object thành 3 mảng kiểu cố định (memory-map được):
+    kind (mã kiểu), num (giá trị số), text (giá trị chuỗi).
+    Trả về None nếu cột chứa kiểu khác (ví dụ ngày tháng) - khi đó sheet không được ghi đĩa.
+    """
+    n = len(values)
+    kind = np.zeros(n, dtype=np.int8)
+    num = np.zeros(n, dtype=np.float64)
+    text = [''] * n
+    for i, v in enumerate(values):
+        if isinstance(v, str):
+            kind[i] = _KIND_STR
+            text[i] = v
+        elif isinstance(v, (bool, np.bool_)):
+            kind[i] = _KIND_BOOL
+            num[i] = float(v)
+        elif isinstance(v, (int, np.integer)):
+            if abs(int(v)) > 2 ** 53:
+                return None
+            kind[i] = _KIND_INT
+            num[i] = float(v)
+        elif isinstance(v, (float, np.floating)):
+            if np.isnan(v):
+                continue
+            kind[i] = _KIND_FLOAT
+            num[i] = float(v)
+        elif v is None:
+            continue
+        else:
+            return None
+    return {'kind': kind, 'num': num, 'text': np.array(text, dtype=str)}
+
+
+def _decode_object_column(kind, num, text):
+    out = []
+    for k, x, t in zip(kind.tolist(), num.tolist(), text.tolist()):
+        if k == _KIND_STR:
+            out.append(t)
+        elif k == _KIND_INT:
+            out.append(int(x))
+        elif k == _KIND_FLOAT:
+            out.append(x)
+        elif k == _KIND_BOOL:
+            out.append(bool(x))
+        else:
+            out.append(np.nan)
+    return np.array(out, dtype=object)
+
+
+def _directory_size(path):
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+def _list_sidecars():
+    """[(đường dẫn, thời gian dùng gần nhất, dung lượng, meta)] của mọi sidecar hợp lệ."""
+    entries = []
+    for entry in os.scandir(_sidecar_dir):
+        if not entry.is_dir() or entry.name.startswith('.'):
+            continue
+        meta_path = os.path.join(entry.path, 'meta.json')
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            last_used = os.stat(meta_path).st_mtime
+            entries.append((entry.path, last_used, _directory_size(entry.path), meta))
+        except (OSError, ValueError):
+            # Sidecar hỏng hoặc đang được ghi dở bởi tiến trình khác: bỏ qua
+            continue
+    return entries
+
+
+def _evict_sidecars(source_path, file_hash, keep_path):
+    """
+    - Xóa các sidecar của cùng file upload nhưng nội dung cũ (file đã bị upload đè); sidecar của
+      các sheet khác trong file hiện tại (cùng file_hash) được giữ lại.
+    - Xóa sidecar ít dùng nhất cho tới khi tổng dung lượng <= _sidecar_max_bytes.
+    """
+    entries = _list_sidecars()
+    live = []
+    for path, last_used, size, meta in entries:
+        if (path != keep_path and meta.get('source') == source_path
+                and meta.get('file_hash') != file_hash):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            live.append((last_used, path, size))
+
+    total = sum(size for _, _, size in live)
+    for _, path, size in sorted(live):
+        if total <= _sidecar_max_bytes:
+            break
+        if path == keep_path:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def _save_sidecar(df, filepath, file_hash, sheet_name):
+    target = _sidecar_path(file_hash, sheet_name)
+    if os.path.isdir(target):
+        return
+    if not isinstance(df.index, pd.RangeIndex) or df.index.step != 1:
+        return
+
+    columns = []
+    arrays = {}
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if values.dtype.kind in 'fiub':
+            columns.append({'name': int(col), 'encoding': 'raw'})
+            arrays[f"c{col}"] = values
+        else:
+            encoded = _encode_object_column(values)
+            if encoded is None:
+                return
+            columns.append({'name': int(col), 'encoding': 'object'})
+            for part, arr in encoded.items():
+                arrays[f"c{col}_{part}"] = arr
+
+    meta = {
+        'version': SIDECAR_FORMAT_VERSION,
+        'source': os.path.abspath(filepath),
+        'file_hash': file_hash,
+        'sheet_name': sheet_name,
+        'index': [df.index.start, len(df)],
+        'columns': columns,
+    }
+
+    # Ghi vào thư mục tạm rồi đổi tên: tiến trình khác không bao giờ thấy sidecar ghi dở
+    tmp = os.path.join(_sidecar_dir, f".tmp-{uuid.uuid4().hex}")
+    os.makedirs(tmp)
+    try:
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), arr, allow_pickle=False)
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.rename(tmp, target)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+
+    _evict_sidecars(meta['source'], file_hash, target)
+
+
+def _load_sidecar(file_hash, sheet_name):
+    path = _sidecar_path(file_hash, sheet_name)
+    meta_path = os.path.join(path, 'meta.json')
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != SIDECAR_FORMAT_VERSION or meta.get('file_hash') != file_hash:
+            return None
+
+        data = {}
+        for col in meta['columns']:
+            name = col['name']
+            if col['encoding'] == 'raw':
+                data[name] = np.asarray(np.load(os.path.join(path, f"c{name}.npy"), mmap_mode='r'))
+            else:
+                parts = [np.load(os.path.join(path, f"c{name}_{part}.npy"), mmap_mode='r')
+                         for part in ('kind', 'num', 'text')]
+                data[name] = _decode_object_column(*parts)
+        # Đánh dấu vừa được dùng (phục vụ LRU trên đĩa)
+        os.utime(meta_path, None)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    start, length = meta['index']
+    # copy=False: cột số được đọc thẳng từ vùng memory-map
+    return pd.DataFrame(data, index=pd.RangeIndex(start, start + length), copy=False)
+
+
+# ==============================================================================
+# API
+# ==============================================================================
+def read_sheet(filepath, sheet_name):
+    """
+    Trả về DataFrame thô của sheet (cột = chỉ số cột gốc trong RAW_COLUMNS).
+    Chỉ parse file ở lần gọi đầu tiên cho mỗi (nội dung file, sheet); nếu cache đĩa
+    được bật, lần đọc đầu tiên sau khi khởi động lại server lấy từ sidecar.
+    DataFrame trả về được dùng chung - người gọi cần chọn cột/copy trước khi sửa đổi.
+    """
+    file_hash = file_content_hash(filepath)
+    key = (file_hash, sheet_name)
+    while True:
+        with _lock:
+            df = _sheet_cache.get(key)
+            if df is not None:
+                _sheet_cache.move_to_end(key)
+                return df
+            pending = _inflight.get(key)
+            if pending is None:
+                # Luồng này chịu trách nhiệm parse; các luồng khác chờ thay vì parse trùng
+                done = _inflight[key] = threading.Event()
+                break
+        pending.wait()
+
+    try:
+        df = _load_sidecar(file_hash, sheet_name) if _sidecar_dir else None
+        if df is None:
+            df = _parse_sheet(filepath, sheet_name)
+            if _sidecar_dir:
+                _save_sidecar(df, filepath, file_hash, sheet_name)
+
+        with _lock:
+            _sheet_cache[key] = df
+            _sheet_cache.move_to_end(key)
+            while len(_sheet_cache) > MAX_CACHED_SHEETS:
+                _sheet_cache.popitem(last=False)
+    finally:
+        # Nếu parse lỗi, luồng đang chờ sẽ tự thử lại và nhận lỗi của chính nó
+        with _lock:
+            _inflight.pop(key, None)
+        done.set()
+    return df
+
+
+def _sheet_names_from_zip(filepath):
+    """
+    Đọc tên sheet trực tiếp từ xl/workbook.xml trong file .xlsx (file zip),
+    không parse bất kỳ worksheet nào. Trả về None nếu không phải định dạng này.
+    """
+    if not zipfile.is_zipfile(filepath):
+        return None
+    with zipfile.ZipFile(filepath) as zf:
+        try:
+            with zf.open('xl/workbook.xml') as f:
+                root = ET.parse(f).getroot()
+        except KeyError:
+            return None
+    # Tên thẻ có namespace (chuẩn transitional hoặc strict) -> so sánh theo phần tên cục bộ
+    return [el.get('name') for el in root.iter() if el.tag.rsplit('}', 1)[-1] == 'sheet']
+
+
+def list_sheet_names(filepath):
+    """
+    Danh sách tên sheet của file, theo đúng thứ tự trong workbook.
+    .xlsx: đọc từ xl/workbook.xml (vài ms, không phụ thuộc kích thước file);
+    .xls hoặc file không đọc được theo cách trên: dùng pd.ExcelFile.
+    """
+    path, stamp = _file_stamp(filepath)
+    with _lock:
+        names = _get_for_stamp(_sheet_names_cache, path, stamp)
+    if names is None:
+        names = _sheet_names_from_zip(filepath)
+        if names is None:
+            with pd.ExcelFile(filepath) as xls:
+                names = list(xls.sheet_names)
+        with _lock:
+            _put_for_stamp(_sheet_names_cache, path, stamp, names)
+    return list(names)
+
+
+def preload_sheets(filepath, sheet_names, max_sheets=2):
+    """
+    Parse trước tối đa `max_sheets` sheet đầu tiên trong một luồng nền để request /api/process
+    sau đó lấy ngay từ cache. Số sheet luôn nhỏ hơn MAX_CACHED_SHEETS để việc parse trước không
+    đẩy các sheet đang dùng ra khỏi cache. Lỗi khi parse trước được bỏ qua: request thật sẽ tự báo lỗi.
+    """
+    sheet_names = list(sheet_names)[:max(0, min(max_sheets, MAX_CACHED_SHEETS // 2))]
+
+    def _worker():
+        for sheet_name in sheet_names:
+            try:
+                read_sheet(filepath, sheet_name)
+            except Exception as e:
+                logger.warning("Bỏ qua parse trước sheet '%s': %s", sheet_name, e)
+
+    thread = threading.Thread(target=_worker, name='sheet-preload', daemon=True)
+    thread.start()
+    return thread
+
+
+def clear_cache(include_disk=False):
+    """Xóa toàn bộ dữ liệu đã đọc trong bộ nhớ (và các sidecar nếu include_disk=True)."""
+    with _lock:
+        _sheet_cache.clear()
+        _sheet_names_cache.clear()
+        _hash_cache.clear()
+    if include_disk and _sidecar_dir:
+        for entry in os.scandir(_sidecar_dir):
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)